@@ -0,0 +1,109 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from .errors import GenerationCancelled
+
+
+class CancellationToken:
+    """
+    A thread-safe stop signal shared by everything working on one request or run.
+
+    cancel() may be called from any thread (e.g. the GUI's Stop button). Blocking
+    waits use wait() so they wake up at once; async calls register a callback
+    that cancels their task, which closes the HTTP request it is waiting on.
+    cancel_after() turns the token into a wall-clock budget.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: list[Callable[[], None]] = []
+        self._timer: Optional[threading.Timer] = None
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "Cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def cancel_after(self, seconds: float, reason: Optional[str] = None) -> "CancellationToken":
+        """Cancel the token once `seconds` have passed (timer runs on a daemon thread)."""
+        self._timer = threading.Timer(seconds, self.cancel, [reason or f"Time budget of {seconds:g}s exhausted"])
+        self._timer.daemon = True
+        self._timer.start()
+        return self
+
+    def close(self):
+        """Stop a cancel_after() timer that has not fired yet."""
+        if self._timer is not None:
+            self._timer.cancel()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Sleep up to `timeout` seconds; returns True (early) if the token is cancelled."""
+        return self._event.wait(timeout)
+
+    def add_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Run `callback` on cancellation (right away if already cancelled). Returns a
+        function that unregisters it; callbacks run on the cancelling thread.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise GenerationCancelled(self.reason or "Cancelled")
+
+
+def in_thread(fn, *args, name: str = "api-call") -> Future:
+    """Run fn on a daemon thread, so a call that is abandoned never delays exit."""
+    future = Future()
+
+    def target():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=target, name=name, daemon=True).start()
+    return future
+
+
+def wait_or_cancel(future: Future, cancel: Optional[CancellationToken]):
+    """
+    Result of `future`, or GenerationCancelled as soon as `cancel` fires. A blocking
+    SDK call can't be interrupted from another thread, so it is left to finish (or
+    hit its deadline) in the background and its result is discarded.
+    """
+    if cancel is None:
+        return future.result()
+    done = threading.Event()
+    future.add_done_callback(lambda _: done.set())
+    unregister = cancel.add_callback(done.set)
+    try:
+        done.wait()
+    finally:
+        unregister()
+    if not future.done():
+        raise GenerationCancelled(cancel.reason or "Cancelled")
+    return future.result()
@@ -1,223 +1,541 @@
-from google import genai
-from google.genai import types
-from PIL import Image
-from .models import GenerationParameters
-from io import BytesIO
+import json
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Optional
+from .cancellation import CancellationToken, in_thread, wait_or_cancel
+from .errors import (ContentBlockedError, DeadlineExceeded, ErrorKind, GenerationCancelled, GenerationError,
+                     ReferenceExpired, classify_error, error_message, retry_after, status_code)
+from .key_pool import ALL_MODELS, KeyPool, PooledKey
+from .models import ChatTurn, GeneratedImage, GenerationParameters
+from .rate_limit import RateLimiter
+from .references import ReferenceImages
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
 
 class APIClient:
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.client = None
-        if self.api_key:
-            self.client = genai.Client(api_key=self.api_key)
+    def __init__(self, api_key: str, rate_limiter: Optional[RateLimiter] = None, metrics=None,
+                 key_pool: Optional[KeyPool] = None, timeouts: Optional[dict[str, float]] = None,
+                 references: Optional[ReferenceImages] = None):
+        self.rate_limiter = rate_limiter
+        # Optional core.metrics.Metrics; the client only records into it
+        self.metrics = metrics
+        # One genai.Client per key, each created on its first request: importing
+        # google.genai takes longer than everything else at startup, and cache
+        # hits or --help never need it
+        self.pool = key_pool if key_pool is not None else KeyPool([api_key] if api_key else [])
+        # Seconds a model may take to answer, by model name or "default"; missing or 0 waits forever
+        self.timeouts = dict(timeouts or {})
+        # Reference images are uploaded once per key and content hash, then sent by URI
+        self.references = references if references is not None else ReferenceImages(metrics=metrics)
 
     def update_api_key(self, api_key: str):
-        self.api_key = api_key
-        if self.api_key:
-            self.client = genai.Client(api_key=self.api_key)
-        else:
-            self.client = None
+        self.pool = KeyPool([api_key] if api_key else [])
+
+    def timeout_for(self, model: str) -> Optional[float]:
+        timeout = self.timeouts.get(model, self.timeouts.get("default"))
+        return float(timeout) if timeout else None
+
+    def _acquire_key(self, params: GenerationParameters, cancel: Optional[CancellationToken] = None) -> PooledKey:
+        """Block until some key may send this request (rate limits and ejections permitting)."""
+        waited = 0.0
+        while True:
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            key, wait = self.pool.acquire(params.model, params.number_of_images, self.rate_limiter)
+            if key:
+                self._observe_quota_wait(params, waited)
+                return key
+            if cancel is not None:
+                cancel.wait(wait)
+            else:
+                time.sleep(wait)
+            waited += wait
+
+    async def _aacquire_key(self, params: GenerationParameters) -> PooledKey:
+        import asyncio
+        waited = 0.0
+        while True:
+            key, wait = self.pool.acquire(params.model, params.number_of_images, self.rate_limiter)
+            if key:
+                self._observe_quota_wait(params, waited)
+                return key
+            await asyncio.sleep(wait)
+            waited += wait
 
-    def generate(self, params: GenerationParameters) -> list[Image.Image]:
-        if not self.client:
-            raise ValueError("API Key is not set. Please check your .env file or settings.")
+    def _observe_quota_wait(self, params: GenerationParameters, waited: float):
+        if waited > 0:
+            logger.info(f"Rate limiter delayed {params.model} request by {waited:.1f}s")
+        if self.metrics:
+            self.metrics.observe("queue_wait_seconds", waited, stage="quota")
+
+    def _record(self, params: GenerationParameters, key: PooledKey, outcome: str, latency: float,
+                decode: float = 0.0, images: Optional[list[GeneratedImage]] = None):
+        """One request's timings, sizes and outcome as metrics plus a compact event."""
+        images = images or []
+        self.pool.release(key, len(images), error=None if outcome == "success" else outcome)
+        size = sum(len(img.data) for img in images)
+        if images:
+            logger.info(f"{params.model}: {len(images)} image(s), {size / 1024:.0f} KiB in {latency:.1f}s")
+        if not self.metrics:
+            return
+        self.metrics.inc("api_requests_total", model=params.model, outcome=outcome)
+        if len(self.pool) > 1:
+            self.metrics.inc("key_requests_total", key=key.id, outcome=outcome)
+        self.metrics.observe("api_latency_seconds", latency, model=params.model)
+        if images:
+            self.metrics.observe("decode_seconds", decode, model=params.model)
+            self.metrics.inc("api_images_total", len(images), model=params.model)
+            self.metrics.inc("api_response_bytes_total", size, model=params.model)
+        self.metrics.event(
+            "api_request", model=params.model, outcome=outcome, latency=round(latency, 4),
+            decode=round(decode, 4), images=len(images), bytes=size
+        )
+
+    def _dump_response(self, response):
+        """Full response dump for debugging, only when enabled or sampled. Inline image bytes are elided."""
+        if not self.metrics or not self.metrics.should_dump_response():
+            return
+        try:
+            data = response.model_dump(exclude_none=True) if hasattr(response, "model_dump") else repr(response)
+            logger.info(f"API response: {json.dumps(_redact_bytes(data), default=str)}")
+        except Exception as e:
+            logger.info(f"API response could not be dumped: {e}")
+
+    def _report_key_error(self, e: Exception, params: GenerationParameters, key: PooledKey):
+        if classify_error(e) == ErrorKind.QUOTA:
+            delay = retry_after(e)
+            delay = delay if delay is not None else self.pool.quota_eject_seconds
+            # Other workers move to the remaining keys instead of collecting 429s too
+            self.pool.eject(key, delay, params.model, "quota", error_message(e))
+            if self.rate_limiter:
+                self.rate_limiter.backoff(params.model, delay, scope=key.id)
+        elif status_code(e) in (401, 403):
+            self.pool.eject(key, self.pool.auth_eject_seconds, ALL_MODELS, f"HTTP {status_code(e)}", error_message(e))
+        else:
+            return
+        if self.metrics and len(self.pool) > 1:
+            self.metrics.inc("key_ejections_total", key=key.id)
 
+    def _build_prompt(self, params: GenerationParameters) -> str:
         full_prompt = params.prompt
         if params.negative_prompt:
             full_prompt += f" --no {params.negative_prompt}"
+        return full_prompt
+
+    def _check_references(self, params: GenerationParameters):
+        if params.reference_images and params.model.startswith("imagen"):
+            raise GenerationError(f"{params.model} does not accept reference images; use a Gemini image model") \
+                from ValueError("reference images need a Gemini model")
+
+    def _contents(self, params: GenerationParameters, key: PooledKey, full_prompt: str):
+        """The prompt, preceded by the reference images when there are any."""
+        if not params.reference_images:
+            return full_prompt
+        return [*self.references.parts(key, params.reference_images), full_prompt]
+
+    def _reference_expired(self, e: Exception, params: GenerationParameters, key: PooledKey,
+                           images: Optional[list[str]] = None) -> Optional[ReferenceExpired]:
+        """
+        ReferenceExpired (retried) if the request was rejected because an uploaded
+        image is gone, after forgetting the upload so the retry sends it again; else None.
+        """
+        images = params.reference_images if images is None else images
+        # An expired or deleted upload is rejected as a client error that names the file
+        if not images or status_code(e) not in (400, 403, 404) or "file" not in str(e).lower():
+            return None
+        if self.references.forget(key, images):
+            return ReferenceExpired(f"Reference image upload is no longer available, uploading again: {e}")
+        return None
+
+    def _report_error(self, e: Exception, params: GenerationParameters, key: PooledKey, started: float,
+                      response, images: Optional[list[str]] = None) -> Exception:
+        """Record a failed request and return the exception to raise in its place."""
+        expired = self._reference_expired(e, params, key, images)
+        if expired is None:
+            # A gone upload comes back as a 403 too, but says nothing about the key, so it is not ejected
+            self._report_key_error(e, params, key)
+        self._record(params, key, classify_error(e).value, time.perf_counter() - started)
+        return expired or self._wrap_error(e, response)
+
+    def _http_options(self, params: GenerationParameters) -> Optional["types.HttpOptions"]:
+        from google.genai import types
+        timeout = self.timeout_for(params.model)
+        # The SDK gives up on the connection after this (and tells the server via X-Server-Timeout)
+        return types.HttpOptions(timeout=int(timeout * 1000)) if timeout else None
+
+    def _build_imagen_config(self, params: GenerationParameters) -> "types.GenerateImagesConfig":
+        from google.genai import types
+        config = types.GenerateImagesConfig(
+            number_of_images=params.number_of_images,
+            aspect_ratio=params.aspect_ratio,
+            safety_filter_level=params.safety_filter,
+            person_generation=params.person_generation,
+            http_options=self._http_options(params)
+        )
+        
+        # Add optional parameters if set
+        if params.guidance_scale is not None:
+            config.guidance_scale = params.guidance_scale
+        if params.seed is not None:
+            config.seed = params.seed
+        
+        # Note: Imagen doesn't support 'image_size' in all versions or it might be named differently (resolution vs image_size)
+        # But based on docs, 'image_size' is supported.
+        # However, for 3.0, let's try to set it if not 1K default.
+        # Actually, some SDK versions might not strictly type this, let's be safe.
+        # If we want to support 2K/4K, we should pass it.
+        # Using generic kwargs if needed, but let's try direct attribute first.
+        return config
+
+    def _build_gemini_config(self, params: GenerationParameters) -> "types.GenerateContentConfig":
+        from google.genai import types
+        model_name = params.model
+        
+        # Construct ImageConfig
+        image_config_args = {}
+        
+        # Add aspect_ratio if supported (both Flash and Gemini 3 support it)
+        if params.aspect_ratio:
+             image_config_args["aspect_ratio"] = params.aspect_ratio
+
+        # Add image_size ONLY for Gemini 3 (Flash usually fixed to 1024x1024 or handles aspect ratio only)
+        if "gemini-3" in model_name:
+             # Ensure uppercase K
+             size_val = params.image_size.upper()
+             if not size_val.endswith("K"):
+                 size_val += "K"
+             image_config_args["image_size"] = size_val
+        
+        # Safety settings
+        safety_settings = [
+                types.SafetySetting(
+                    category="HARM_CATEGORY_HARASSMENT",
+                    threshold=params.safety_filter.upper()
+                ),
+                types.SafetySetting(
+                    category="HARM_CATEGORY_HATE_SPEECH",
+                    threshold=params.safety_filter.upper()
+                ),
+                types.SafetySetting(
+                    category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
+                    threshold=params.safety_filter.upper()
+                ),
+                types.SafetySetting(
+                    category="HARM_CATEGORY_DANGEROUS_CONTENT",
+                    threshold=params.safety_filter.upper()
+                )
+        ]
+
+        # The seed makes repeated requests reproducible, which the result cache relies on
+        return types.GenerateContentConfig(
+            response_modalities=["IMAGE"],
+            candidate_count=params.number_of_images,
+            seed=params.seed,
+            image_config=types.ImageConfig(**image_config_args) if image_config_args else None,
+            safety_settings=safety_settings,
+            http_options=self._http_options(params)
+        )
+
+    def _parse_imagen_response(self, response) -> list[GeneratedImage]:
+        images = []
+        if hasattr(response, 'generated_images'):
+            for generated_image in response.generated_images:
+                if hasattr(generated_image, 'image') and hasattr(generated_image.image, 'image_bytes'):
+                    img = GeneratedImage.from_bytes(
+                        generated_image.image.image_bytes,
+                        getattr(generated_image.image, 'mime_type', None)
+                    )
+                    images.append(img)
+        return images
+
+    def _parse_gemini_response(self, response) -> list[GeneratedImage]:
+        images = []
+
+        # The new SDK simplifies access, but let's handle potential structures
+        # First check if content was blocked
+        # The SDK always has the attribute; only a set block_reason means the prompt was blocked
+        block_reason = getattr(getattr(response, 'prompt_feedback', None), 'block_reason', None)
+        if block_reason:
+            raise ContentBlockedError(f"Content blocked by safety filter: {block_reason}")
+        
+        # Check candidates for safety ratings
+        if hasattr(response, 'candidates') and response.candidates:
+            for candidate in response.candidates:
+                # Check if candidate was blocked
+                if hasattr(candidate, 'finish_reason'):
+                    finish_reason = str(candidate.finish_reason)
+                    if 'SAFETY' in finish_reason or 'BLOCKED' in finish_reason:
+                        safety_info = ""
+                        if hasattr(candidate, 'safety_ratings'):
+                            safety_info = f" Safety ratings: {candidate.safety_ratings}"
+                        raise ContentBlockedError(f"Content blocked due to safety: {finish_reason}{safety_info}")
+                
+                # Try to extract images from candidate
+                if hasattr(candidate, 'content') and candidate.content:
+                    if hasattr(candidate.content, 'parts') and candidate.content.parts:
+                        for part in candidate.content.parts:
+                            if hasattr(part, 'inline_data') and part.inline_data:
+                                img = GeneratedImage.from_bytes(part.inline_data.data, part.inline_data.mime_type)
+                                images.append(img)
+        
+        # Fallback: try response.parts directly (some SDK versions)
+        if not images and hasattr(response, 'parts') and response.parts:
+            for part in response.parts:
+                if hasattr(part, 'inline_data') and part.inline_data:
+                    img = GeneratedImage.from_bytes(part.inline_data.data, part.inline_data.mime_type)
+                    images.append(img)
+
+        return images
+
+    def _check_images(self, images: list[GeneratedImage], response) -> list[GeneratedImage]:
+        if not images:
+            # Provide detailed error information
+            error_details = []
+            if hasattr(response, 'text') and response.text:
+                error_details.append(f"Model returned text: {response.text}")
+            if hasattr(response, 'candidates'):
+                error_details.append(f"Candidates: {len(response.candidates) if response.candidates else 0}")
+            if hasattr(response, 'prompt_feedback'):
+                error_details.append(f"Prompt feedback: {response.prompt_feedback}")
+            
+            error_msg = "No images generated."
+            if error_details:
+                error_msg += " Details: " + ", ".join(error_details)
+            raise RuntimeError(error_msg)
+
+        return images
+
+    def _handle_response(self, params: GenerationParameters, key: PooledKey, response,
+                         started: float) -> list[GeneratedImage]:
+        latency = time.perf_counter() - started
+        self._dump_response(response)
+        if params.model.startswith("imagen"):
+            images = self._parse_imagen_response(response)
+        else:
+            images = self._parse_gemini_response(response)
+        images = self._check_images(images, response)
+        decode = time.perf_counter() - started - latency
+        self._record(params, key, "success", latency, decode, images)
+        return images
+
+    def _wrap_error(self, e: Exception, response) -> GenerationError:
+        # Preserve original error information
+        error_msg = f"Generation failed: {type(e).__name__}: {str(e)}"
+        
+        # Try to add response details if available
+        try:
+            if response is not None:
+                details = []
+                if hasattr(response, 'prompt_feedback'):
+                    details.append(f"Prompt feedback: {response.prompt_feedback}")
+                if hasattr(response, 'candidates') and response.candidates:
+                    details.append(f"Candidates count: {len(response.candidates)}")
+                    for i, candidate in enumerate(response.candidates):
+                        if hasattr(candidate, 'finish_reason'):
+                            details.append(f"Candidate {i} finish_reason: {candidate.finish_reason}")
+                        if hasattr(candidate, 'safety_ratings'):
+                            details.append(f"Candidate {i} safety_ratings: {candidate.safety_ratings}")
+                if details:
+                    error_msg += "\n\nResponse details:\n" + "\n".join(details)
+        except:
+            pass  # If we can't get details, just use the original error
+        
+        error_cls = ContentBlockedError if isinstance(e, ContentBlockedError) else GenerationError
+        return error_cls(error_msg)
+
+    def generate(self, params: GenerationParameters,
+                 cancel: Optional[CancellationToken] = None) -> list[GeneratedImage]:
+        """
+        Blocking generation. With a `cancel` token the call runs on its own thread
+        and this returns (raising GenerationCancelled) as soon as the token fires.
+        That only abandons the request: it keeps running, and holds its key's slot,
+        until the API answers or the model's deadline (if any) passes. agenerate() aborts it.
+        """
+        if cancel is None:
+            return self._generate(params)
+        cancel.raise_if_cancelled()
+        return wait_or_cancel(in_thread(self._generate, params, cancel), cancel)
+
+    def _generate(self, params: GenerationParameters,
+                  cancel: Optional[CancellationToken] = None) -> list[GeneratedImage]:
+        full_prompt = self._build_prompt(params)
+        self._check_references(params)
         
         # Determine model name
         model_name = params.model
+        response = None
+        
+        key = self._acquire_key(params, cancel)
+        started = time.perf_counter()
         
         try:
-            images = []
-            
             if model_name.startswith("imagen"):
                 # Handle Imagen models
-                config = types.GenerateImagesConfig(
-                    number_of_images=params.number_of_images,
-                    aspect_ratio=params.aspect_ratio,
-                    safety_filter_level=params.safety_filter,
-                    person_generation=params.person_generation
-                )
-                
-                # Add optional parameters if set
-                if params.guidance_scale is not None:
-                    config.guidance_scale = params.guidance_scale
-                
-                # Note: Imagen doesn't support 'image_size' in all versions or it might be named differently (resolution vs image_size)
-                # But based on docs, 'image_size' is supported.
-                # However, for 3.0, let's try to set it if not 1K default.
-                # Actually, some SDK versions might not strictly type this, let's be safe.
-                # If we want to support 2K/4K, we should pass it.
-                # Using generic kwargs if needed, but let's try direct attribute first.
-                
-                response = self.client.models.generate_images(
+                response = key.client.models.generate_images(
                     model=model_name,
                     prompt=full_prompt,
-                    config=config
+                    config=self._build_imagen_config(params)
                 )
-                
-                if hasattr(response, 'generated_images'):
-                    for generated_image in response.generated_images:
-                        if hasattr(generated_image, 'image') and hasattr(generated_image.image, 'image_bytes'):
-                            img = Image.open(BytesIO(generated_image.image.image_bytes))
-                            images.append(img)
-                            
             else:
                 # Handle Gemini models (including gemini-3-pro-image-preview)
-                
-                # Construct ImageConfig
-                image_config_args = {}
-                
-                # Add aspect_ratio if supported (both Flash and Gemini 3 support it)
-                if params.aspect_ratio:
-                     image_config_args["aspect_ratio"] = params.aspect_ratio
-
-                # Add image_size ONLY for Gemini 3 (Flash usually fixed to 1024x1024 or handles aspect ratio only)
-                if "gemini-3" in model_name:
-                     # Ensure uppercase K
-                     size_val = params.image_size.upper()
-                     if not size_val.endswith("K"):
-                         size_val += "K"
-                     image_config_args["image_size"] = size_val
-                
-                # Safety settings
-                safety_settings = [
-                        types.SafetySetting(
-                            category="HARM_CATEGORY_HARASSMENT",
-                            threshold=params.safety_filter.upper()
-                        ),
-                        types.SafetySetting(
-                            category="HARM_CATEGORY_HATE_SPEECH",
-                            threshold=params.safety_filter.upper()
-                        ),
-                        types.SafetySetting(
-                            category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                            threshold=params.safety_filter.upper()
-                        ),
-                        types.SafetySetting(
-                            category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                            threshold=params.safety_filter.upper()
-                        )
-                ]
-
-                config = types.GenerateContentConfig(
-                    response_modalities=["IMAGE"],
-                    candidate_count=params.number_of_images,
-                    image_config=types.ImageConfig(**image_config_args) if image_config_args else None,
-                    safety_settings=safety_settings
-                )
-                
-                # Handle seed if supported/provided (Gemini 3 might support it via other means or it's random)
-                # Currently SDK for generate_content might not expose seed directly in top config easily 
-                # but let's check if we can pass it. 
-                # If not supported, we just ignore it for now to avoid errors.
-
-                response = self.client.models.generate_content(
+                response = key.client.models.generate_content(
                     model=model_name,
-                    contents=full_prompt,
-                    config=config
+                    contents=self._contents(params, key, full_prompt),
+                    config=self._build_gemini_config(params)
                 )
+            return self._handle_response(params, key, response, started)
 
-                # Log the raw response for debugging
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.info("=" * 80)
-                logger.info("RAW API RESPONSE:")
-                logger.info(f"Response type: {type(response)}")
-                logger.info(f"Response object: {response}")
-                logger.info(f"Response dir: {dir(response)}")
-                
-                # Try to serialize response to see its structure
-                try:
-                    logger.info(f"Response __dict__: {response.__dict__ if hasattr(response, '__dict__') else 'N/A'}")
-                except:
-                    pass
-                
-                # Log specific attributes
-                for attr in ['text', 'parts', 'candidates', 'prompt_feedback', 'usage_metadata']:
-                    if hasattr(response, attr):
-                        try:
-                            value = getattr(response, attr)
-                            logger.info(f"response.{attr}: {value}")
-                        except Exception as e:
-                            logger.info(f"response.{attr}: Error accessing - {e}")
-                
-                logger.info("=" * 80)
+        except Exception as e:
+            raise self._report_error(e, params, key, started, response) from e
+        except BaseException:
+            # Cancelled or interrupted mid-request: give the key's slot back
+            self.pool.release(key, error="cancelled")
+            raise
 
-                # The new SDK simplifies access, but let's handle potential structures
-                # First check if content was blocked
-                if hasattr(response, 'prompt_feedback'):
-                    if hasattr(response.prompt_feedback, 'block_reason'):
-                        block_reason = response.prompt_feedback.block_reason
-                        raise RuntimeError(f"Content blocked by safety filter: {block_reason}")
-                
-                # Check candidates for safety ratings
-                if hasattr(response, 'candidates') and response.candidates:
-                    for candidate in response.candidates:
-                        # Check if candidate was blocked
-                        if hasattr(candidate, 'finish_reason'):
-                            finish_reason = str(candidate.finish_reason)
-                            if 'SAFETY' in finish_reason or 'BLOCKED' in finish_reason:
-                                safety_info = ""
-                                if hasattr(candidate, 'safety_ratings'):
-                                    safety_info = f" Safety ratings: {candidate.safety_ratings}"
-                                raise RuntimeError(f"Content blocked due to safety: {finish_reason}{safety_info}")
-                        
-                        # Try to extract images from candidate
-                        if hasattr(candidate, 'content') and candidate.content:
-                            if hasattr(candidate.content, 'parts') and candidate.content.parts:
-                                for part in candidate.content.parts:
-                                    if hasattr(part, 'inline_data') and part.inline_data:
-                                        img = Image.open(BytesIO(part.inline_data.data))
-                                        images.append(img)
-                
-                # Fallback: try response.parts directly (some SDK versions)
-                if not images and hasattr(response, 'parts') and response.parts:
-                    for part in response.parts:
-                        if hasattr(part, 'inline_data') and part.inline_data:
-                            img = Image.open(BytesIO(part.inline_data.data))
-                            images.append(img)
-
-            if not images:
-                # Provide detailed error information
-                error_details = []
-                if hasattr(response, 'text') and response.text:
-                    error_details.append(f"Model returned text: {response.text}")
-                if hasattr(response, 'candidates'):
-                    error_details.append(f"Candidates: {len(response.candidates) if response.candidates else 0}")
-                if hasattr(response, 'prompt_feedback'):
-                    error_details.append(f"Prompt feedback: {response.prompt_feedback}")
-                
-                error_msg = "No images generated."
-                if error_details:
-                    error_msg += " Details: " + ", ".join(error_details)
-                raise RuntimeError(error_msg)
+    def prompt_turn(self, params: GenerationParameters) -> ChatTurn:
+        """The first message of an edit session: the full prompt and its reference images."""
+        return ChatTurn(role="user", text=self._build_prompt(params), images=list(params.reference_images or []))
+
+    def chat(self, params: GenerationParameters, history: list[ChatTurn], message: ChatTurn,
+             cancel: Optional[CancellationToken] = None) -> tuple[list[GeneratedImage], ChatTurn]:
+        """
+        One turn of a multi-turn edit through the SDK's chat interface: `history`
+        is replayed, `message` sent, and the images plus the model's reply (text
+        and thought signature, images left for the caller to fill in) returned.
+        Rate limits, deadlines, cancellation and errors work as in generate().
+        """
+        if cancel is None:
+            return self._chat(params, history, message)
+        cancel.raise_if_cancelled()
+        return wait_or_cancel(in_thread(self._chat, params, history, message, cancel), cancel)
+
+    def _chat_content(self, key: PooledKey, turn: ChatTurn) -> "types.Content":
+        from google.genai import types
+        parts = self.references.parts(key, turn.images) if turn.images else []
+        if turn.text:
+            parts.append(types.Part.from_text(text=turn.text))
+        if turn.signature and parts:
+            # Gemini 3 expects the signature back on the first part of the reply it belongs to
+            parts[0].thought_signature = turn.signature
+        return types.Content(role=turn.role, parts=parts)
+
+    def _reply_turn(self, response) -> ChatTurn:
+        parts = response.candidates[0].content.parts if response.candidates and response.candidates[0].content else []
+        parts = parts or []
+        text = "".join(part.text for part in parts if part.text and not part.thought)
+        signature = next((part.thought_signature for part in parts if part.thought_signature), None)
+        return ChatTurn(role="model", text=text, signature=signature)
 
-            return images
+    def _chat(self, params: GenerationParameters, history: list[ChatTurn], message: ChatTurn,
+              cancel: Optional[CancellationToken] = None) -> tuple[list[GeneratedImage], ChatTurn]:
+        if params.model.startswith("imagen"):
+            raise GenerationError(f"{params.model} cannot edit in a chat; use a Gemini image model") \
+                from ValueError("edit sessions need a Gemini model")
+        response = None
+
+        key = self._acquire_key(params, cancel)
+        started = time.perf_counter()
+
+        try:
+            chat = key.client.chats.create(
+                model=params.model,
+                config=self._build_gemini_config(params),
+                history=[self._chat_content(key, turn) for turn in history]
+            )
+            response = chat.send_message(self._chat_content(key, message).parts)
+            # Before _handle_response records the success: that releases the key, and a
+            # failure after it would release it a second time in the except below
+            reply = self._reply_turn(response)
+            return self._handle_response(params, key, response, started), reply
 
         except Exception as e:
-            # Preserve original error information
-            error_msg = f"Generation failed: {type(e).__name__}: {str(e)}"
-            
-            # Try to add response details if available
-            try:
-                if 'response' in locals():
-                    details = []
-                    if hasattr(response, 'prompt_feedback'):
-                        details.append(f"Prompt feedback: {response.prompt_feedback}")
-                    if hasattr(response, 'candidates') and response.candidates:
-                        details.append(f"Candidates count: {len(response.candidates)}")
-                        for i, candidate in enumerate(response.candidates):
-                            if hasattr(candidate, 'finish_reason'):
-                                details.append(f"Candidate {i} finish_reason: {candidate.finish_reason}")
-                            if hasattr(candidate, 'safety_ratings'):
-                                details.append(f"Candidate {i} safety_ratings: {candidate.safety_ratings}")
-                    if details:
-                        error_msg += "\n\nResponse details:\n" + "\n".join(details)
-            except:
-                pass  # If we can't get details, just use the original error
-            
-            raise RuntimeError(error_msg)
+            images = [image for turn in [*history, message] for image in turn.images]
+            raise self._report_error(e, params, key, started, response, images) from e
+        except BaseException:
+            # Cancelled or interrupted mid-request: give the key's slot back
+            self.pool.release(key, error="cancelled")
+            raise
+
+    async def agenerate(self, params: GenerationParameters,
+                        cancel: Optional[CancellationToken] = None) -> list[GeneratedImage]:
+        """
+        Async counterpart of generate() using the SDK's `client.aio` surface, so
+        one event loop can keep many requests in flight without a thread each.
+        A fired `cancel` token cancels the request's task, which closes its HTTP
+        connection, and raises GenerationCancelled.
+        """
+        if cancel is None:
+            return await self._agenerate(params)
+        import asyncio
+        cancel.raise_if_cancelled()
+        loop = asyncio.get_running_loop()
+        task = asyncio.ensure_future(self._agenerate(params))
+        unregister = cancel.add_callback(lambda: loop.call_soon_threadsafe(task.cancel))
+        try:
+            return await task
+        except asyncio.CancelledError:
+            # Only translate our own cancellation; the caller's task being cancelled stays a CancelledError
+            if cancel.cancelled and not asyncio.current_task().cancelling():
+                raise GenerationCancelled(cancel.reason or "Cancelled") from None
+            raise
+        finally:
+            unregister()
+
+    async def _agenerate(self, params: GenerationParameters) -> list[GeneratedImage]:
+        import asyncio
+        full_prompt = self._build_prompt(params)
+        self._check_references(params)
+        model_name = params.model
+        response = None
+
+        key = await self._aacquire_key(params)
+        started = time.perf_counter()
+
+        try:
+            if model_name.startswith("imagen"):
+                call = key.client.aio.models.generate_images(
+                    model=model_name,
+                    prompt=full_prompt,
+                    config=self._build_imagen_config(params)
+                )
+            else:
+                # Reading and uploading the references blocks, so it runs off the event loop
+                contents = await asyncio.to_thread(self._contents, params, key, full_prompt)
+                call = key.client.aio.models.generate_content(
+                    model=model_name,
+                    contents=contents,
+                    config=self._build_gemini_config(params)
+                )
+            response = await self._with_deadline(call, params)
+            return self._handle_response(params, key, response, started)
+
+        except Exception as e:
+            raise self._report_error(e, params, key, started, response) from e
+        except BaseException:
+            # Cancelled or interrupted mid-request: give the key's slot back
+            self.pool.release(key, error="cancelled")
+            raise
+
+    async def _with_deadline(self, call, params: GenerationParameters):
+        """Await an SDK call for at most the model's timeout; running out cancels (and closes) the request."""
+        import asyncio
+        timeout = self.timeout_for(params.model)
+        if timeout is None:
+            return await call
+        try:
+            return await asyncio.wait_for(call, timeout)
+        except TimeoutError as e:
+            raise DeadlineExceeded(f"{params.model} did not answer within {timeout:g}s") from e
+
 
+def _redact_bytes(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, dict):
+        return {k: _redact_bytes(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact_bytes(v) for v in value]
+    return value
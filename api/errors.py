@@ -0,0 +1,140 @@
+import re
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Iterator, Optional
+
+
+class ErrorKind(str, Enum):
+    QUOTA = "quota"            # 429 / RESOURCE_EXHAUSTED: retry after the quota refills
+    TRANSIENT = "transient"    # 5xx, timeouts, dropped connections: retry with backoff
+    SAFETY = "safety"          # Blocked by safety filters: retrying the same prompt is pointless
+    INVALID = "invalid"        # Bad request, auth or missing key: fails again until config changes
+    CANCELLED = "cancelled"    # Stopped by the user or a time budget: never retried
+    UNKNOWN = "unknown"        # Anything else: retried like a transient error
+
+
+PERMANENT_ERRORS = (ErrorKind.SAFETY, ErrorKind.INVALID, ErrorKind.CANCELLED)
+
+
+class GenerationError(RuntimeError):
+    """Raised by APIClient for failed generations; the SDK error is kept as __cause__."""
+
+
+class ContentBlockedError(GenerationError):
+    """The prompt or every candidate was blocked by a safety filter."""
+
+
+class GenerationCancelled(GenerationError):
+    """The request was abandoned because its CancellationToken fired."""
+
+
+class ReferenceExpired(GenerationError):
+    """The API no longer knows an uploaded reference image; it is uploaded again on the retry."""
+
+
+class DeadlineExceeded(GenerationError, TimeoutError):
+    """The model did not answer within its configured timeout (retried like any timeout)."""
+
+
+def _error_chain(exc: BaseException) -> Iterator[BaseException]:
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        exc = exc.__cause__ or exc.__context__
+
+
+def _is_transport_error(exc: BaseException) -> bool:
+    # httpx / requests network failures, matched by name to avoid importing either here
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    return bool(names & {"TransportError", "TimeoutException", "ConnectionError", "Timeout"})
+
+
+def classify_error(exc: BaseException) -> ErrorKind:
+    for err in _error_chain(exc):
+        if isinstance(err, ContentBlockedError):
+            return ErrorKind.SAFETY
+        if isinstance(err, GenerationCancelled):
+            return ErrorKind.CANCELLED
+        if isinstance(err, ReferenceExpired):
+            return ErrorKind.TRANSIENT
+
+        code = getattr(err, "code", None)
+        status = str(getattr(err, "status", "") or "")
+        if isinstance(code, int) and code >= 400:
+            if code == 429 or status == "RESOURCE_EXHAUSTED":
+                return ErrorKind.QUOTA
+            if code >= 500 or code == 408:
+                return ErrorKind.TRANSIENT
+            return ErrorKind.INVALID
+
+        if isinstance(err, (TimeoutError, ConnectionError)) or _is_transport_error(err):
+            return ErrorKind.TRANSIENT
+        if isinstance(err, (ValueError, TypeError)):
+            return ErrorKind.INVALID
+
+    return ErrorKind.UNKNOWN
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """HTTP status of the first API error in the chain, if any."""
+    for err in _error_chain(exc):
+        code = getattr(err, "code", None)
+        if isinstance(code, int) and code >= 400:
+            return code
+    return None
+
+
+def error_message(exc: BaseException) -> str:
+    """Short description of the first API error in the chain ("HTTP 403 PERMISSION_DENIED: ..."), else of `exc`."""
+    for err in _error_chain(exc):
+        code = getattr(err, "code", None)
+        if isinstance(code, int) and code >= 400:
+            status = getattr(err, "status", None)
+            message = getattr(err, "message", None) or str(err)
+            return f"HTTP {code}{f' {status}' if status else ''}: {message}"
+    return f"{type(exc).__name__}: {exc}"
+
+
+def _parse_seconds(value) -> Optional[float]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)s?", value)
+    if match:
+        return float(match.group(1))
+    try:
+        # HTTP-date form of Retry-After
+        when = parsedate_to_datetime(value)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """
+    Server-suggested delay in seconds, from a `Retry-After` header or a
+    google.rpc.RetryInfo `retryDelay` in the error body. None if there is no hint.
+    """
+    for err in _error_chain(exc):
+        response = getattr(err, "response", None)
+        headers = getattr(response, "headers", None)
+        if headers is not None:
+            try:
+                delay = _parse_seconds(headers.get("retry-after"))
+            except Exception:
+                delay = None
+            if delay is not None:
+                return delay
+
+        details = getattr(err, "details", None)
+        if isinstance(details, dict):
+            details = details.get("error", details).get("details", [])
+        if isinstance(details, list):
+            for detail in details:
+                if isinstance(detail, dict) and "retryDelay" in detail:
+                    delay = _parse_seconds(detail["retryDelay"])
+                    if delay is not None:
+                        return delay
+    return None
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from .rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Ejection scope for errors that concern the key itself rather than one model's quota
+ALL_MODELS = "*"
+
+
+def load_api_keys(api_key: Optional[str] = None, api_keys: Optional[list[str]] = None,
+                  api_keys_file: Optional[str] = None) -> list[str]:
+    """
+    Collect keys from the single `api_key`, the comma-separated GOOGLE_API_KEYS
+    environment variable, the `api_keys` list and a file with one key per line
+    (blank lines and `#` comments skipped). Duplicates are dropped, order is kept.
+    """
+    keys = [api_key or ""]
+    keys += (os.getenv("GOOGLE_API_KEYS") or "").split(",")
+    keys += api_keys or []
+    if api_keys_file:
+        try:
+            with open(api_keys_file, 'r', encoding='utf-8') as f:
+                keys += [line for line in f if not line.lstrip().startswith("#")]
+        except OSError as e:
+            logger.warning(f"Could not read API keys file {api_keys_file}: {e}")
+    return list(dict.fromkeys(k.strip() for k in keys if k and k.strip()))
+
+
+def _default_client(api_key: str):
+    from google import genai
+    return genai.Client(api_key=api_key)
+
+
+class PooledKey:
+    """One API key with its genai.Client (created on first use) and usage counters."""
+    def __init__(self, key: str):
+        self.key = key
+        # Stable across processes, so rate-limit buckets in a shared SQLite file line up
+        self.id = "key-" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+        self.client = None
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.quota_errors = 0
+        self.images = 0
+        self.ejected: dict[str, float] = {}  # model (or ALL_MODELS) -> monotonic time it is usable again
+        self.last_error: Optional[str] = None
+
+    @property
+    def masked(self) -> str:
+        return f"...{self.key[-4:]}"
+
+    def ejected_for(self, model: str, now: float) -> float:
+        return max(self.ejected.get(model, 0.0), self.ejected.get(ALL_MODELS, 0.0)) - now
+
+
+class KeyPool:
+    """
+    Spreads requests over several API keys, each with its own quota.
+
+    acquire() picks, among the keys not currently ejected for the model, the one
+    with the fewest requests in flight (then the fewest sent) that the rate limiter
+    lets through right now; with `rate_limits` set, every key gets its own buckets.
+    A key that returns 429 is ejected for that model until the Retry-After hint (or
+    `quota_eject_seconds`) has passed; a 401/403 ejects it for every model for
+    `auth_eject_seconds`.
+    """
+    def __init__(self, keys: list[str], quota_eject_seconds: float = 30, auth_eject_seconds: float = 600,
+                 client_factory: Optional[Callable[[str], Any]] = None):
+        self.keys = [PooledKey(key) for key in keys]
+        self.quota_eject_seconds = quota_eject_seconds
+        self.auth_eject_seconds = auth_eject_seconds
+        self.client_factory = client_factory or _default_client
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings) -> "KeyPool":
+        """Build the pool from a SettingsManager (`api_key`, `api_keys`, `api_keys_file`, `key_pool`)."""
+        config = settings.get("key_pool") or {}
+        keys = load_api_keys(settings.get("api_key"), settings.get("api_keys"), settings.get("api_keys_file"))
+        return cls(
+            keys,
+            quota_eject_seconds=float(config.get("quota_eject_seconds", 30)),
+            auth_eject_seconds=float(config.get("auth_eject_seconds", 600))
+        )
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def acquire(self, model: str, images: int = 1,
+                rate_limiter: Optional[RateLimiter] = None) -> tuple[Optional[PooledKey], float]:
+        """
+        Reserve a key for one request. Returns (key, 0) or, when no key can send
+        right now, (None, seconds until one may). Call release() when done.
+        """
+        if not self.keys:
+            raise ValueError("API Key is not set. Please check your .env file or settings.")
+
+        with self._lock:
+            now = time.monotonic()
+            available = [k for k in self.keys if k.ejected_for(model, now) <= 0]
+            if not available:
+                if all(k.ejected.get(ALL_MODELS, 0.0) > now for k in self.keys):
+                    latest = max(self.keys, key=lambda k: k.ejected[ALL_MODELS])
+                    raise ValueError(f"Every API key was rejected; last error: {latest.last_error}")
+                return None, min(k.ejected_for(model, now) for k in self.keys)
+
+            wait = float("inf")
+            for key in sorted(available, key=lambda k: (k.in_flight, k.requests)):
+                key_wait = rate_limiter.reserve(model, images, scope=key.id) if rate_limiter else 0.0
+                if key_wait <= 0:
+                    if key.client is None:
+                        key.client = self.client_factory(key.key)
+                    key.in_flight += 1
+                    key.requests += 1
+                    return key, 0.0
+                wait = min(wait, key_wait)
+            return None, wait
+
+    def release(self, key: PooledKey, images: int = 0, error: Optional[str] = None):
+        with self._lock:
+            key.in_flight -= 1
+            key.images += images
+            if error is not None:
+                key.failures += 1
+
+    def eject(self, key: PooledKey, seconds: float, model: str = ALL_MODELS, reason: str = "quota",
+              message: Optional[str] = None):
+        """Take `key` out of rotation for `model`; `message` (the API's error) is reported if every key ends up rejected."""
+        with self._lock:
+            key.ejected[model] = max(key.ejected.get(model, 0.0), time.monotonic() + seconds)
+            key.last_error = message or reason
+            if reason == "quota":
+                key.quota_errors += 1
+        scope = "all models" if model == ALL_MODELS else model
+        logger.warning(f"API key {key.masked} ejected for {seconds:.0f}s ({reason}, {scope})")
+
+    def stats(self) -> list[dict[str, Any]]:
+        """Per-key usage; `share` is the key's fraction of all requests sent."""
+        with self._lock:
+            now = time.monotonic()
+            total = sum(k.requests for k in self.keys) or 1
+            return [{
+                "id": k.id,
+                "key": k.masked,
+                "in_flight": k.in_flight,
+                "requests": k.requests,
+                "failures": k.failures,
+                "quota_errors": k.quota_errors,
+                "images": k.images,
+                "share": round(k.requests / total, 3),
+                "ejected": {m: round(until - now, 1) for m, until in k.ejected.items() if until > now},
+            } for k in self.keys]
+
+    def log_summary(self):
+        if len(self.keys) < 2:
+            return
+        for s in self.stats():
+            logger.info(f"API key {s['key']}: {s['requests']} requests ({s['share']:.0%}), {s['images']} images, "
+                        f"{s['failures']} failures, {s['quota_errors']} quota errors")
@@ -1,5 +1,16 @@
-from pydantic import BaseModel, Field
-from typing import Optional, Literal
+import hashlib
+import json
+from io import BytesIO
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Any, Optional, Literal
+
+MIME_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+    "image/gif": "gif",
+    "image/avif": "avif",
+}
 
 class GenerationParameters(BaseModel):
     prompt: str = Field(..., description="The prompt for image generation")
@@ -17,6 +28,75 @@ class GenerationParameters(BaseModel):
     seed: Optional[int] = Field(None, description="Seed for generation")
     guidance_scale: Optional[float] = Field(None, description="Guidance scale (CFG)")
 
+    # Image-to-image: local files sent along with the prompt (uploaded once, see api.references)
+    reference_images: Optional[list[str]] = Field(None, description="Reference image files to edit or restyle")
+
+    # Routing: where the request may go when `model` is overloaded (None = use the configured routing)
+    fallback_models: Optional[list[str]] = Field(None, description="Models to try, in order, when the model fails")
+
+    def cache_key(self) -> str:
+        """Stable hash of the canonicalized parameters; equal parameters give equal keys."""
+        # Routing does not change what `model` would produce, so it is not part of the key
+        data = self.model_dump(exclude={"fallback_models", "reference_images"})
+        if self.reference_images:
+            # What the references contain decides the result, not where they are stored
+            from .references import reference_digest
+            data["reference_images"] = [reference_digest(path) for path in self.reference_images]
+        canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class ChatTurn(BaseModel):
+    """
+    One message of a multi-turn edit (core.session) as it is replayed to the model.
+    Images are local files, sent as Files API references (see api.references).
+    """
+    role: Literal["user", "model"]
+    text: str = ""
+    images: list[str] = Field(default_factory=list, description="Image files in this message")
+    signature: Optional[bytes] = Field(None, description="Thought signature the model attached to its reply")
+
 class GenerationResponse(BaseModel):
     images: list[str]  # Base64 encoded strings or paths (handled by client)
     info: str
+    mime_types: list[str] = Field(default_factory=list, description="MIME type of each entry in images")
+    paths: list[str] = Field(default_factory=list, description="Where the images were saved on the server")
+
+def sniff_mime_type(data: bytes) -> str:
+    """Guess the image MIME type from magic bytes, for responses that omit it."""
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    return "application/octet-stream"
+
+class GeneratedImage(BaseModel):
+    """
+    One generated image exactly as returned by the API: the encoded bytes and their
+    MIME type. Nothing is decoded until a consumer asks for `.image`, so results
+    that only get written to disk never pay for a decode/re-encode.
+    """
+    data: bytes
+    mime_type: str = "image/png"
+    _image: Any = PrivateAttr(default=None)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, mime_type: Optional[str] = None) -> "GeneratedImage":
+        return cls(data=data, mime_type=mime_type or sniff_mime_type(data))
+
+    @property
+    def extension(self) -> str:
+        return MIME_EXTENSIONS.get(self.mime_type, "png")
+
+    @property
+    def image(self):
+        """Lazily decoded PIL view of the image."""
+        if self._image is None:
+            from PIL import Image
+            self._image = Image.open(BytesIO(self.data))
+        return self._image
@@ -0,0 +1,183 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# (bucket key, tokens wanted, refill rate per second, capacity)
+BucketRequest = tuple[str, float, float, float]
+
+
+class MemoryBucketStore:
+    """In-process token buckets, shared by all threads of one process."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: dict[str, list[float]] = {}  # key -> [tokens, updated, blocked_until]
+
+    def reserve(self, requests: list[BucketRequest], now: float) -> float:
+        """
+        Take tokens from every bucket atomically (all or nothing).
+        Returns 0 on success, otherwise the seconds to wait before trying again.
+        """
+        with self._lock:
+            wait = 0.0
+            states = []
+            for key, tokens, rate, capacity in requests:
+                state = self._buckets.setdefault(key, [capacity, now, 0.0])
+                available = min(capacity, state[0] + (now - state[1]) * rate)
+                states.append((state, available))
+                wait = max(wait, state[2] - now, _refill_wait(available, tokens, rate))
+
+            if wait > 0:
+                return wait
+
+            for (state, available), (_, tokens, _, _) in zip(states, requests):
+                state[0] = available - tokens
+                state[1] = now
+            return 0.0
+
+    def block(self, keys: list[str], until: float):
+        with self._lock:
+            for key in keys:
+                state = self._buckets.setdefault(key, [0.0, until, 0.0])
+                state[0] = 0.0
+                state[1] = until
+                state[2] = max(state[2], until)
+
+
+class SQLiteBucketStore:
+    """
+    Token buckets persisted in a SQLite file so several processes on one host
+    (e.g. multiple systemd units) draw from the same quota. Each reservation is
+    one short `BEGIN IMMEDIATE` transaction, which SQLite serializes across processes.
+    """
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, "
+                "blocked_until REAL NOT NULL DEFAULT 0)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def reserve(self, requests: list[BucketRequest], now: float) -> float:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            wait = 0.0
+            updates = []
+            for key, tokens, rate, capacity in requests:
+                row = conn.execute(
+                    "SELECT tokens, updated, blocked_until FROM buckets WHERE key = ?", (key,)
+                ).fetchone()
+                stored, updated, blocked_until = row if row else (capacity, now, 0.0)
+                available = min(capacity, stored + (now - updated) * rate)
+                wait = max(wait, blocked_until - now, _refill_wait(available, tokens, rate))
+                updates.append((key, available - tokens, now, blocked_until))
+
+            if wait <= 0:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated, blocked_until) VALUES (?, ?, ?, ?)",
+                    updates
+                )
+            conn.execute("COMMIT")
+            return max(wait, 0.0)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def block(self, keys: list[str], until: float):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key in keys:
+                conn.execute(
+                    "INSERT INTO buckets (key, tokens, updated, blocked_until) VALUES (?, 0, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = 0, updated = excluded.updated, "
+                    "blocked_until = MAX(blocked_until, excluded.blocked_until)",
+                    (key, until, until)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def _bucket(scope: str, model: str, unit: str) -> str:
+    return f"{scope}/{model}:{unit}" if scope else f"{model}:{unit}"
+
+
+def _refill_wait(available: float, tokens: float, rate: float) -> float:
+    if available >= tokens:
+        return 0.0
+    if rate <= 0:
+        return float("inf")
+    return (tokens - available) / rate
+
+
+class RateLimiter:
+    """
+    Client-side token-bucket limiter keyed by model name.
+
+    `limits` maps a model name (or "default") to `{"rpm": ..., "ipm": ..., "burst": ...}`:
+    requests per minute, images per minute and an optional bucket capacity
+    (defaults to one minute worth of tokens). Models without an entry are not limited.
+    A `scope` (an API key id when using a key pool) gives each key its own buckets.
+    """
+    def __init__(self, limits: dict[str, dict[str, Any]], store=None):
+        self.limits = limits
+        self.store = store or MemoryBucketStore()
+
+    @classmethod
+    def from_settings(cls, limits: Optional[dict[str, dict[str, Any]]], db_path: Optional[str] = None) -> Optional["RateLimiter"]:
+        if not limits:
+            return None
+        store = SQLiteBucketStore(db_path) if db_path else MemoryBucketStore()
+        return cls(limits, store)
+
+    def _limit_for(self, model: str) -> Optional[dict[str, Any]]:
+        return self.limits.get(model) or self.limits.get("default")
+
+    def _requests(self, model: str, images: int, scope: str = "") -> list[BucketRequest]:
+        limit = self._limit_for(model)
+        if not limit:
+            return []
+
+        requests = []
+        for unit, tokens in (("rpm", 1), ("ipm", images)):
+            per_minute = limit.get(unit)
+            if not per_minute:
+                continue
+            capacity = float(limit.get("burst") or per_minute)
+            # A single call may need more tokens than the bucket can ever hold
+            requests.append((_bucket(scope, model, unit), min(tokens, capacity), per_minute / 60.0, capacity))
+        return requests
+
+    def reserve(self, model: str, images: int = 1, scope: str = "") -> float:
+        """Try to take tokens now. Returns 0 when granted, otherwise seconds to wait."""
+        requests = self._requests(model, images, scope)
+        if not requests:
+            return 0.0
+        return self.store.reserve(requests, time.time())
+
+    def backoff(self, model: str, seconds: float, scope: str = ""):
+        """Drain the model's buckets and hold every caller back for `seconds` (e.g. after a 429)."""
+        if not self._limit_for(model):
+            return
+        logger.warning(f"Rate limiter: pausing {model}{f' on {scope}' if scope else ''} for {seconds:.0f}s after quota error")
+        self.store.block([_bucket(scope, model, "rpm"), _bucket(scope, model, "ipm")], time.time() + seconds)
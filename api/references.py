@@ -0,0 +1,223 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Optional
+
+from .key_pool import PooledKey
+from .models import sniff_mime_type
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+# The Files API keeps uploads for 48 hours; used when a response has no expiration_time
+UPLOAD_LIFETIME = 48 * 3600
+
+_digests: dict[tuple[str, int, int], str] = {}
+_digests_lock = threading.Lock()
+
+
+def reference_digest(path: str) -> str:
+    """
+    SHA-256 of a reference image's bytes, remembered per (path, mtime, size) so
+    that cache keys and upload lookups don't re-read the file for every job.
+    A file that cannot be read is identified by its path instead.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "path:" + os.path.abspath(path)
+    memo = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _digests_lock:
+        digest = _digests.get(memo)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        with _digests_lock:
+            _digests[memo] = digest
+    return digest
+
+
+def _mime_type(path: str) -> str:
+    with open(path, 'rb') as f:
+        mime_type = sniff_mime_type(f.read(16))
+    if mime_type == "application/octet-stream":
+        mime_type = mimetypes.guess_type(path)[0] or mime_type
+    return mime_type
+
+
+class UploadStore:
+    """Optional SQLite record of uploaded files, so several processes (and later runs) reuse the same uploads."""
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            "key_id TEXT NOT NULL, sha256 TEXT NOT NULL, name TEXT NOT NULL, uri TEXT NOT NULL, "
+            "mime_type TEXT NOT NULL, expires REAL NOT NULL, PRIMARY KEY (key_id, sha256))"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key_id: str, digest: str) -> Optional[dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT name, uri, mime_type, expires FROM uploads WHERE key_id = ? AND sha256 = ?", (key_id, digest)
+        ).fetchone()
+        return dict(zip(("name", "uri", "mime_type", "expires"), row)) if row else None
+
+    def put(self, key_id: str, digest: str, upload: dict[str, Any]):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO uploads (key_id, sha256, name, uri, mime_type, expires) VALUES (?, ?, ?, ?, ?, ?)",
+            (key_id, digest, upload["name"], upload["uri"], upload["mime_type"], upload["expires"])
+        )
+
+    def delete(self, key_id: str, digest: str):
+        self._connect().execute("DELETE FROM uploads WHERE key_id = ? AND sha256 = ?", (key_id, digest))
+
+    def purge(self, now: float):
+        self._connect().execute("DELETE FROM uploads WHERE expires <= ?", (now,))
+
+
+class ReferenceImages:
+    """
+    Turns the reference_images of a request into request parts.
+
+    Each unique image (by content hash) is uploaded once per API key through the
+    Files API and its URI reused by every later request, instead of sending the
+    same megabytes inline each time. Uploads expire (48 hours on the Gemini API),
+    so one is replaced `refresh_margin` seconds before its expiration_time, and
+    forget() drops it when the API rejects it. With `db_path` the uploads are
+    recorded in SQLite and shared by every process using the same file.
+
+    With `upload` off, or on a backend without the Files API (Vertex AI), the
+    images are sent inline.
+    """
+    def __init__(self, upload: bool = True, db_path: Optional[str] = None, refresh_margin: float = 3600,
+                 metrics=None):
+        self.upload = upload
+        self.refresh_margin = refresh_margin
+        # Optional core.metrics.Metrics
+        self.metrics = metrics
+        self.store = UploadStore(db_path) if db_path else None
+        self._uploads: dict[tuple[str, str], dict[str, Any]] = {}
+        self._inline_keys: set[str] = set()
+        self._lock = threading.Lock()
+        self._key_locks: dict[tuple[str, str], threading.Lock] = {}
+        if self.store:
+            self.store.purge(time.time())
+
+    @classmethod
+    def from_settings(cls, config: Optional[dict[str, Any]], metrics=None) -> "ReferenceImages":
+        config = config or {}
+        return cls(
+            upload=bool(config.get("upload", True)),
+            db_path=config.get("uploads_db") or None,
+            refresh_margin=float(config.get("refresh_margin", 3600)),
+            metrics=metrics
+        )
+
+    def parts(self, key: PooledKey, paths: list[str]) -> list["types.Part"]:
+        """One Part per reference image, in order. Raises ValueError for a missing file."""
+        from google.genai import types
+        parts = []
+        for path in paths:
+            if not os.path.isfile(path):
+                raise ValueError(f"Reference image not found: {path}")
+            upload = self._uploaded(key, path) if self.upload and key.id not in self._inline_keys else None
+            if upload:
+                parts.append(types.Part.from_uri(file_uri=upload["uri"], mime_type=upload["mime_type"]))
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            parts.append(types.Part.from_bytes(data=data, mime_type=sniff_mime_type(data)))
+        return parts
+
+    def _valid(self, upload: Optional[dict[str, Any]]) -> bool:
+        return upload is not None and upload["expires"] - self.refresh_margin > time.time()
+
+    def _uploaded(self, key: PooledKey, path: str) -> Optional[dict[str, Any]]:
+        """The live upload of this image for this key, uploading it first if needed; None to send it inline."""
+        digest = reference_digest(path)
+        cache_key = (key.id, digest)
+        with self._lock:
+            upload = self._uploads.get(cache_key)
+            if self._valid(upload):
+                return upload
+            key_lock = self._key_locks.setdefault(cache_key, threading.Lock())
+
+        # One upload per image and key even when many workers ask at once
+        with key_lock:
+            with self._lock:
+                upload = self._uploads.get(cache_key)
+            if not self._valid(upload) and self.store:
+                upload = self.store.get(key.id, digest)
+            if not self._valid(upload):
+                upload = self._upload(key, path, digest)
+                if upload is None:
+                    return None
+                if self.store:
+                    self.store.put(key.id, digest, upload)
+            with self._lock:
+                self._uploads[cache_key] = upload
+            return upload
+
+    def _upload(self, key: PooledKey, path: str, digest: str) -> Optional[dict[str, Any]]:
+        from google.genai import types
+        mime_type = _mime_type(path)
+        started = time.perf_counter()
+        try:
+            file = key.client.files.upload(
+                file=path, config=types.UploadFileConfig(mime_type=mime_type, display_name=f"ref-{digest[:16]}")
+            )
+            deadline = time.monotonic() + 30
+            while file.state == types.FileState.PROCESSING and time.monotonic() < deadline:
+                time.sleep(0.5)
+                file = key.client.files.get(name=file.name)
+        except ValueError as e:
+            # The SDK refuses file uploads on Vertex AI clients
+            logger.warning(f"Files API not available for key {key.masked}, sending reference images inline: {e}")
+            with self._lock:
+                self._inline_keys.add(key.id)
+            return None
+        if file.state == types.FileState.FAILED:
+            raise ValueError(f"Upload of reference image {path} failed: {file.error}")
+
+        size = os.path.getsize(path)
+        logger.info(f"Uploaded reference image {path} ({size / 1024:.0f} KiB) as {file.name} "
+                    f"in {time.perf_counter() - started:.1f}s")
+        if self.metrics:
+            self.metrics.inc("reference_uploads_total")
+            self.metrics.inc("reference_upload_bytes_total", size)
+        expires = file.expiration_time.timestamp() if file.expiration_time else time.time() + UPLOAD_LIFETIME
+        return {"name": file.name, "uri": file.uri, "mime_type": file.mime_type or mime_type, "expires": expires}
+
+    def forget(self, key: PooledKey, paths: list[str]) -> int:
+        """
+        Drop the uploads of these images for this key (e.g. the API no longer knows
+        them), so the next request uploads them again. Returns how many were dropped.
+        """
+        dropped = 0
+        for path in paths:
+            digest = reference_digest(path)
+            with self._lock:
+                dropped += self._uploads.pop((key.id, digest), None) is not None
+            if self.store:
+                self.store.delete(key.id, digest)
+        return dropped
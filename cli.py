@@ -1,11 +1,15 @@
 import argparse
 import sys
 import logging
-import yaml
 import os
-from api.models import GenerationParameters
-from core.generator import GeneratorCore
-from core.runner import GenerationRunner
+from typing import TYPE_CHECKING
+
+# Everything else is imported where it is first needed, so --help and argument
+# errors return without loading pydantic, Pillow or the google-genai SDK.
+# tools/bench_startup.py measures this.
+if TYPE_CHECKING:
+    from api.models import GenerationParameters
+    from core.retry import RetryPolicy
 
 # Configure logging
 logging.basicConfig(
@@ -32,17 +36,84 @@ def parse_args():
     parser.add_argument("--safety-filter", type=str, default=None, choices=["block_none", "block_only_high", "block_medium_and_above", "block_low_and_above"])
     parser.add_argument("--seed", type=int, default=None, help="Random seed")
     parser.add_argument("--guidance-scale", type=float, default=None, help="Guidance scale")
+    parser.add_argument("--ref", type=str, action="append", default=None, metavar="IMAGE",
+                        help="Reference image to edit or restyle (repeat for several)")
     
     # Retry Params
     parser.add_argument("--retry", action="store_true", default=None, help="Enable auto retry")
     parser.add_argument("--retry-interval", type=int, default=None, help="Retry interval in seconds")
     parser.add_argument("--max-retries", type=int, default=None, help="Max retries (0 for infinite)")
+    parser.add_argument("--retry-backoff", type=float, default=None, help="Multiply the retry interval by this factor after each failure")
+    parser.add_argument("--retry-max-interval", type=int, default=None, help="Upper bound for the backoff interval in seconds")
+
+    # Routing
+    parser.add_argument("--fallback-models", type=str, default=None,
+                        help="Comma-separated models to try, in order, when the model is overloaded or out of quota")
+    parser.add_argument("--hedge", action="store_true", default=None,
+                        help="Also send slow requests (past the model's p95 latency) to the first fallback model (async path only)")
+
+    # Output Format
+    parser.add_argument("--output-format", type=str, default=None, choices=["original", "png", "webp", "jpeg", "avif"],
+                        help="File format for saved images ('original' keeps the API bytes)")
+    parser.add_argument("--quality", type=int, default=None, help="Quality for webp/jpeg/avif output (0-100)")
+    parser.add_argument("--compress-level", type=int, default=None, choices=range(0, 10), metavar="0-9",
+                        help="PNG compression level")
+    parser.add_argument("--lossless", action="store_true", default=None, help="Use lossless WebP")
+
+    # Output Layout
+    parser.add_argument("--shard", type=str, default=None, choices=["none", "date", "hash"],
+                        help="Subfolders for saved images: by date, by content hash, or none (flat)")
+    parser.add_argument("--catalog", type=str, default=None,
+                        help="SQLite catalog of saved images, relative to output_dir ('' turns it off)")
+
+    # Result Cache
+    parser.add_argument("--no-cache", dest="cache", action="store_false", default=None,
+                        help="Always call the API, even if an identical seeded request is cached")
 
     # API Key (optional override)
     parser.add_argument("--api-key", type=str, default=None, help="Google API Key (overrides env/config)")
+
+    # Batch Mode
+    parser.add_argument("--batch", type=str, default=None, help="Path to a JSONL/YAML job list to run in batch mode")
+    parser.add_argument("--workers", type=int, default=None, help="Number of concurrent workers in batch mode")
+    parser.add_argument("--manifest", type=str, default=None, help="Output manifest (JSONL) for batch results")
+    parser.add_argument("--async", dest="use_async", action="store_true", default=None,
+                        help="Use the asyncio API path in batch mode (--workers becomes max requests in flight)")
+    parser.add_argument("--job-store", type=str, default=None,
+                        help="SQLite file tracking batch job state; rerun with the same file to resume")
+    parser.add_argument("--retry-failed", action="store_true", default=None,
+                        help="With --job-store, run previously failed jobs again")
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="Stop the batch after this many seconds, aborting requests in flight")
+
+    # Diagnostics
+    parser.add_argument("--debug-responses", action="store_true", default=False,
+                        help="Log every raw API response (image bytes elided)")
+    parser.add_argument("--events-file", type=str, default=None,
+                        help="Append per-request timing events (JSONL) to this file")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on this port (/metrics)")
+    parser.add_argument("--metrics-textfile", type=str, default=None,
+                        help="Write Prometheus metrics to this file for node_exporter's textfile collector")
     
     return parser.parse_args()
 
+def merge_config(config, source):
+    """
+    Merge a YAML mapping or batch job entry into config.
+    Only keys known to config are taken; aliases are mapped to internal names.
+    """
+    # Direct mapping for matching keys
+    for key in config.keys():
+        if key in source:
+            config[key] = source[key]
+
+    # Handle aliases
+    if "negative_prompt" in source:
+        config["neg_prompt"] = source["negative_prompt"]
+    if "number_of_images" in source:
+        config["num_images"] = source["number_of_images"]
+
 def load_config(args):
     """
     Load configuration from YAML file (if provided) and merge with CLI arguments.
@@ -59,16 +130,38 @@ def load_config(args):
         "safety_filter": "block_none",
         "seed": None,
         "guidance_scale": None,
+        "reference_images": None,
         "retry": False,
         "retry_interval": 10,
         "max_retries": 0,
-        "api_key": None
+        "retry_backoff": 2.0,
+        "retry_max_interval": 600,
+        "retry_jitter": 0.5,
+        "fallback_models": None,
+        "hedge": False,
+        "cache": True,
+        "output_format": None,
+        "quality": None,
+        "compress_level": None,
+        "lossless": None,
+        "shard": None,
+        "catalog": None,
+        "api_key": None,
+        "batch": None,
+        "jobs": None,
+        "sweep": None,
+        "workers": 4,
+        "manifest": None,
+        "async": False,
+        "job_store": None,
+        "retry_failed": False,
+        "time_budget": None
     }
 
     # 1. Load from YAML file if provided
     # Default to 'generate.yaml' if no file specified AND no prompt specified (assuming full config driven)
     yaml_file = args.file
-    if not yaml_file and not args.prompt and os.path.exists("generate.yaml"):
+    if not yaml_file and not args.prompt and not args.batch and os.path.exists("generate.yaml"):
         yaml_file = "generate.yaml"
         logger.info(f"No args provided, auto-loading default config: {yaml_file}")
 
@@ -78,21 +171,11 @@ def load_config(args):
             sys.exit(1)
         
         try:
+            import yaml
             with open(yaml_file, 'r') as f:
                 yaml_config = yaml.safe_load(f)
                 if yaml_config:
-                    # Update config with YAML values, mapping keys if necessary
-                    # Assuming YAML keys match our internal config keys
-                    # We might need to map 'negative_prompt' -> 'neg_prompt' etc if YAML schema differs
-                    
-                    # Direct mapping for matching keys
-                    for key in config.keys():
-                        if key in yaml_config:
-                            config[key] = yaml_config[key]
-                    
-                    # Handle aliases
-                    if "negative_prompt" in yaml_config:
-                        config["neg_prompt"] = yaml_config["negative_prompt"]
+                    merge_config(config, yaml_config)
                         
         except Exception as e:
             logger.error(f"Error parsing YAML file: {e}")
@@ -109,6 +192,7 @@ def load_config(args):
     if args.safety_filter is not None: config["safety_filter"] = args.safety_filter
     if args.seed is not None: config["seed"] = args.seed
     if args.guidance_scale is not None: config["guidance_scale"] = args.guidance_scale
+    if args.ref is not None: config["reference_images"] = args.ref
     
     # Retry params need special handling because store_true default is False/None logic
     # If args.retry is True (flag present), use it.
@@ -128,28 +212,36 @@ def load_config(args):
     
     if args.retry_interval is not None: config["retry_interval"] = args.retry_interval
     if args.max_retries is not None: config["max_retries"] = args.max_retries
+    if args.retry_backoff is not None: config["retry_backoff"] = args.retry_backoff
+    if args.retry_max_interval is not None: config["retry_max_interval"] = args.retry_max_interval
+    if args.fallback_models is not None:
+        config["fallback_models"] = [m.strip() for m in args.fallback_models.split(",") if m.strip()]
+    if args.hedge: config["hedge"] = True
+    if args.cache is not None: config["cache"] = args.cache
+    if args.output_format is not None: config["output_format"] = args.output_format
+    if args.quality is not None: config["quality"] = args.quality
+    if args.compress_level is not None: config["compress_level"] = args.compress_level
+    if args.lossless: config["lossless"] = True
+    if args.shard is not None: config["shard"] = args.shard
+    if args.catalog is not None: config["catalog"] = args.catalog
     if args.api_key is not None: config["api_key"] = args.api_key
+    if args.batch is not None: config["batch"] = args.batch
+    if args.workers is not None: config["workers"] = args.workers
+    if args.manifest is not None: config["manifest"] = args.manifest
+    if args.use_async: config["async"] = True
+    if args.job_store is not None: config["job_store"] = args.job_store
+    if args.retry_failed: config["retry_failed"] = True
+    if args.time_budget is not None: config["time_budget"] = args.time_budget
 
     return config
 
-def run_cli():
-    args = parse_args()
-    config = load_config(args)
-    
-    if not config["prompt"]:
-        print("Error: Prompt is required (provide via CLI --prompt or YAML file)")
-        sys.exit(1)
-
-    core = GeneratorCore()
-    
-    if config["api_key"]:
-        core.update_api_key(config["api_key"])
-        
-    if not core.settings.get("api_key"):
-        print("Error: API Key not found. Set GOOGLE_API_KEY env var, use --api-key, or set in YAML")
-        sys.exit(1)
-        
-    params = GenerationParameters(
+def build_params(config) -> "GenerationParameters":
+    from api.models import GenerationParameters
+    references = config["reference_images"]
+    # YAML and job files may give a single path instead of a list
+    if isinstance(references, str):
+        references = [references]
+    return GenerationParameters(
         prompt=config["prompt"],
         negative_prompt=config["neg_prompt"],
         aspect_ratio=config["aspect_ratio"],
@@ -159,8 +251,137 @@ def run_cli():
         person_generation=config["person_generation"],
         safety_filter=config["safety_filter"],
         seed=config["seed"],
-        guidance_scale=config["guidance_scale"]
+        guidance_scale=config["guidance_scale"],
+        reference_images=references or None,
+        fallback_models=config["fallback_models"]
+    )
+
+def build_retry_policy(config) -> "RetryPolicy":
+    from core.retry import RetryPolicy
+    return RetryPolicy(
+        base_interval=config["retry_interval"],
+        max_interval=config["retry_max_interval"],
+        multiplier=config["retry_backoff"],
+        jitter=config["retry_jitter"]
+    )
+
+def iter_batch_jobs(config, sweep=None):
+    """
+    Lazily turn batch entries into BatchJobs. Each job inherits the merged
+    YAML/CLI config and overrides only the keys it specifies. Without a job
+    file or list, the jobs are the points of `sweep`.
+    """
+    from core.batch import BatchJob, JobIds, load_jobs
+    from core.sweep import sweep_job_id
+
+    if config["batch"]:
+        raw_jobs = load_jobs(config["batch"])
+    elif config["jobs"]:
+        raw_jobs = iter(config["jobs"])
+    else:
+        raw_jobs = iter(sweep or ())
+    default_id = JobIds() if config["batch"] or config["jobs"] else sweep_job_id
+
+    for position, job in enumerate(raw_jobs, 1):
+        job_config = dict(config)
+        merge_config(job_config, job)
+        job_id = str(job.get("id", f"#{position}"))
+        if not job_config["prompt"]:
+            logger.error(f"[{job_id}] Skipping job without a prompt")
+            continue
+        try:
+            params = build_params(job_config)
+        except Exception as e:
+            logger.error(f"[{job_id}] Skipping invalid job: {e}")
+            continue
+        if "id" not in job:
+            job_id = default_id(params)
+        yield BatchJob(id=job_id, params=params)
+
+def build_sweep(config):
+    """The Sweep from the config's `sweep:` section, checked against the known job keys."""
+    from core.sweep import Sweep
+
+    try:
+        sweep = Sweep(config["sweep"])
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    unknown = sweep.job_keys() - set(config) - {"negative_prompt", "number_of_images"}
+    if unknown:
+        print(f"Error: Unknown sweep key(s): {', '.join(sorted(unknown))}")
+        sys.exit(1)
+    return sweep
+
+def run_batch(core, config, pipeline):
+    from core.batch import BatchRunner
+    from core.job_store import JobStore
+
+    manifest = config["manifest"]
+    if not manifest:
+        base = os.path.splitext(config["batch"] or config["job_store"] or ("sweep" if config["sweep"] else "batch"))[0]
+        manifest = f"{base}.manifest.jsonl"
+
+    if config["sweep"] and not (config["batch"] or config["jobs"]):
+        from core.sweep import unique_jobs
+        sweep = build_sweep(config)
+        logger.info(f"Sweep expands to {len(sweep)} combination(s)")
+        jobs = unique_jobs(iter_batch_jobs(config, sweep))
+    else:
+        jobs = iter_batch_jobs(config)
+    job_store = None
+    if config["job_store"]:
+        # Jobs go through the store: finished ones are skipped, interrupted ones run again
+        job_store = JobStore(config["job_store"])
+        job_store.recover()
+        if config["retry_failed"]:
+            logger.info(f"Requeued {job_store.requeue_failed()} failed job(s)")
+        added = job_store.add(jobs)
+        counts = job_store.counts()
+        logger.info(f"Job store {config['job_store']}: {added} new, {counts['pending']} pending, "
+                    f"{counts['done']} done, {counts['failed']} failed")
+        jobs = job_store.pending()
+
+    batch = BatchRunner(
+        core=core,
+        jobs=jobs,
+        workers=config["workers"],
+        manifest_path=manifest,
+        retry_enabled=config["retry"],
+        retry_interval=config["retry_interval"],
+        max_retries=config["max_retries"],
+        retry_policy=build_retry_policy(config),
+        use_cache=config["cache"],
+        pipeline=pipeline,
+        job_store=job_store,
+        time_budget=config["time_budget"]
     )
+
+    try:
+        if config["async"]:
+            import asyncio
+            stats = asyncio.run(batch.arun())
+        else:
+            stats = batch.run()
+    except KeyboardInterrupt:
+        logger.warning("Interrupted, waiting for in-flight jobs to stop...")
+        batch.stop()
+        raise
+
+    print(f"Batch complete: {stats['succeeded']} succeeded, {stats['failed']} failed, "
+          f"{stats['cancelled']} cancelled, {stats['images']} images. Manifest: {manifest}")
+    if job_store:
+        counts = job_store.counts()
+        print(f"Job store: {counts['done']} done, {counts['failed']} failed, {counts['pending']} pending")
+        job_store.close()
+    if stats["failed"]:
+        sys.exit(1)
+
+def run_single(core, config, pipeline):
+    import asyncio
+    from core.runner import GenerationRunner
+
+    params = build_params(config)
     
     runner = GenerationRunner(
         core=core,
@@ -168,15 +389,92 @@ def run_cli():
         retry_enabled=config["retry"],
         retry_interval=config["retry_interval"],
         max_retries=config["max_retries"],
-        status_callback=lambda msg: logger.info(f"STATUS: {msg}")
+        status_callback=lambda msg: logger.info(f"STATUS: {msg}"),
+        retry_policy=build_retry_policy(config),
+        use_cache=config["cache"],
+        pipeline=pipeline
     )
     
     try:
-        images = runner.run()
-        print(f"Successfully generated {len(images)} images.")
+        # The async path, so Ctrl+C closes the request instead of leaving it running
+        images = asyncio.run(runner.arun())
     except Exception as e:
         print(f"Generation failed after retries: {e}")
         sys.exit(1)
 
+    pipeline.flush()
+    if runner.save_future and runner.save_future.exception():
+        print(f"Generated {len(images)} images but saving failed: {runner.save_future.exception()}")
+        sys.exit(1)
+    print(f"Successfully generated {len(images)} images.")
+
+def run_cli():
+    args = parse_args()
+    config = load_config(args)
+    batch_mode = bool(config["batch"] or config["jobs"] or config["sweep"] or config["job_store"])
+    
+    if not batch_mode and not config["prompt"]:
+        print("Error: Prompt is required (provide via CLI --prompt or YAML file)")
+        sys.exit(1)
+
+    from core.generator import GeneratorCore
+    from core.metrics_export import start_exporters
+    from core.pipeline import PostProcessor
+
+    core = GeneratorCore()
+    if args.debug_responses:
+        core.metrics.debug_responses = True
+    if args.events_file:
+        core.metrics.events_file = args.events_file
+    
+    if config["api_key"]:
+        core.update_api_key(config["api_key"])
+        
+    if not core.has_api_key():
+        print("Error: API Key not found. Set GOOGLE_API_KEY (or GOOGLE_API_KEYS) env var, use --api-key, or set in YAML")
+        sys.exit(1)
+
+    try:
+        core.update_output_format({
+            "format": config["output_format"],
+            "quality": config["quality"],
+            "compress_level": config["compress_level"],
+            "lossless": config["lossless"]
+        })
+        core.update_output_layout({"shard": config["shard"], "catalog": config["catalog"]})
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if config["hedge"]:
+        core.settings.settings["routing"] = {**(core.settings.get("routing") or {}), "hedge": True}
+    if (core.settings.get("routing") or {}).get("hedge") and batch_mode and not config["async"]:
+        logger.warning("Hedging only applies to batch runs with --async; requests are not hedged")
+
+    metrics_config = dict(core.settings.get("metrics") or {})
+    if args.metrics_port is not None:
+        metrics_config["port"] = args.metrics_port
+    if args.metrics_textfile:
+        metrics_config["textfile"] = args.metrics_textfile
+    try:
+        exporters = start_exporters(core.metrics, metrics_config)
+    except OSError as e:
+        print(f"Error: Could not start metrics endpoint: {e}")
+        sys.exit(1)
+
+    # Saving and notifications run in the background; shutdown() flushes them before exit
+    pipeline = PostProcessor.from_settings(core)
+    try:
+        if batch_mode:
+            run_batch(core, config, pipeline)
+        else:
+            run_single(core, config, pipeline)
+    finally:
+        pipeline.shutdown()
+        for exporter in exporters:
+            exporter.stop()
+        core.client.pool.log_summary()
+        core.metrics.close()
+
 if __name__ == "__main__":
     run_cli()
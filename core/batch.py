@@ -0,0 +1,331 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator, Optional
+
+from api.cancellation import CancellationToken
+from api.models import GenerationParameters
+from core.generator import GeneratorCore
+from core.pipeline import PostProcessor
+from core.retry import RetryPolicy
+from core.runner import GenerationRunner
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchJob:
+    id: str
+    params: GenerationParameters
+
+
+def load_jobs(path: str) -> Iterator[dict[str, Any]]:
+    """
+    Yield raw job dicts from a batch file.
+    - `.jsonl`: one JSON object per line (blank lines and `#` comments are skipped).
+    - `.yaml`/`.yml`: either a top-level list or a mapping with a `jobs` list.
+    JSONL is streamed line by line so very large job files are never fully loaded.
+    """
+    if path.endswith(".jsonl"):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                try:
+                    job = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{path}:{line_no}: invalid JSON: {e}") from e
+                if not isinstance(job, dict):
+                    raise ValueError(f"{path}:{line_no}: job must be a JSON object")
+                yield job
+        return
+
+    import yaml
+    with open(path, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f)
+
+    if isinstance(data, dict):
+        data = data.get("jobs")
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: expected a list of jobs or a mapping with a 'jobs' list")
+
+    for index, job in enumerate(data, 1):
+        if not isinstance(job, dict):
+            raise ValueError(f"{path}: job #{index} must be a mapping")
+        yield job
+
+
+class JobIds:
+    """
+    Ids for jobs that don't set one, derived from their parameters like
+    core.sweep.sweep_job_id. Editing or reordering a job file and resuming against
+    a job store then runs the changed jobs, instead of matching them by position
+    to rows holding the old parameters. Identical jobs are numbered in order
+    ("-2", "-3", ...), so each of them still runs.
+    """
+    def __init__(self, prefix: str = "job"):
+        self.prefix = prefix
+        # Keyed by a 64-bit digest so that huge job files stay cheap to number
+        self._seen: dict[int, int] = {}
+
+    def __call__(self, params: GenerationParameters) -> str:
+        digest = params.cache_key()[:16]
+        key = int(digest, 16)
+        count = self._seen[key] = self._seen.get(key, 0) + 1
+        return f"{self.prefix}-{digest}" if count == 1 else f"{self.prefix}-{digest}-{count}"
+
+
+class ManifestWriter:
+    """Thread-safe JSONL writer recording one line per finished job."""
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, record: dict[str, Any]):
+        if not self._file:
+            return
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class BatchRunner:
+    """
+    Runs many generation jobs through a bounded pool of worker threads that share
+    one GeneratorCore (and therefore one APIClient / genai.Client).
+
+    Jobs are consumed lazily from the iterable: at most `workers * 2` jobs are
+    queued or running at any time, so job files of any size stay cheap in memory.
+    Use arun() instead of run() to drive the jobs through the asyncio API path.
+
+    With a `job_store` (core.job_store.JobStore), each job's state is persisted as it
+    starts and finishes, so an interrupted run can be resumed from the store.
+
+    stop() and an exhausted `time_budget` (seconds of wall-clock time for the whole
+    run) abort the requests in flight and start no more jobs; the interrupted ones
+    are recorded as cancelled (pending again in the job store).
+    """
+    def __init__(self, core: GeneratorCore, jobs: Iterable[BatchJob], workers: int = 4,
+                 manifest_path: Optional[str] = None,
+                 retry_enabled: bool = False, retry_interval: int = 5, max_retries: int = 0,
+                 retry_policy: Optional[RetryPolicy] = None, use_cache: bool = True,
+                 pipeline: Optional[PostProcessor] = None, job_store=None,
+                 time_budget: Optional[float] = None):
+        self.core = core
+        self.jobs = jobs
+        self.workers = max(1, workers)
+        self.manifest = ManifestWriter(manifest_path)
+        self.retry_enabled = retry_enabled
+        self.retry_interval = retry_interval
+        self.max_retries = max_retries
+        self.retry_policy = retry_policy
+        self.use_cache = use_cache
+        self.pipeline = pipeline
+        self.job_store = job_store
+        self.time_budget = time_budget
+
+        self.cancel = CancellationToken()
+        self._slots = threading.BoundedSemaphore(self.workers * 2)
+        self._stats_lock = threading.Lock()
+        self.stats = {"submitted": 0, "succeeded": 0, "failed": 0, "cancelled": 0, "images": 0}
+
+    def stop(self):
+        self.cancel.cancel("Batch stopped")
+
+    def _should_stop(self) -> bool:
+        return self.cancel.cancelled
+
+    def _start_budget(self):
+        if self.time_budget:
+            self.cancel.cancel_after(self.time_budget)
+
+    def _make_runner(self, job: BatchJob) -> GenerationRunner:
+        return GenerationRunner(
+            core=self.core,
+            params=job.params,
+            retry_enabled=self.retry_enabled,
+            retry_interval=self.retry_interval,
+            max_retries=self.max_retries,
+            status_callback=lambda msg: logger.info(f"[{job.id}] {msg}"),
+            retry_policy=self.retry_policy,
+            use_cache=self.use_cache,
+            pipeline=self.pipeline,
+            cancel=self.cancel
+        )
+
+    def _record_result(self, job: BatchJob, runner: GenerationRunner, started: float,
+                       images=None, error: Optional[Exception] = None):
+        record = {
+            "id": job.id,
+            "params": job.params.model_dump(),
+        }
+        if error is not None:
+            record["status"] = "failed"
+            record["error"] = str(error)
+        elif images is None:
+            record["status"] = "cancelled"
+        else:
+            record["status"] = "success"
+        record["duration"] = round(time.monotonic() - started, 3)
+
+        if record["status"] == "success" and runner.save_future is not None:
+            # Saving happens in the pipeline; write the manifest line once the paths exist
+            runner.save_future.add_done_callback(lambda future: self._finish_record(record, runner, future))
+        else:
+            self._finish_record(record, runner)
+
+    def _finish_record(self, record: dict[str, Any], runner: GenerationRunner, save_future=None):
+        if save_future is not None and save_future.exception() is not None:
+            record["status"] = "failed"
+            record["error"] = f"Saving failed: {save_future.exception()}"
+        record["outputs"] = runner.saved_paths
+        if runner.model_used and runner.model_used != record["params"]["model"]:
+            record["model_used"] = runner.model_used
+
+        with self._stats_lock:
+            if record["status"] == "success":
+                self.stats["succeeded"] += 1
+                self.stats["images"] += len(record["outputs"])
+            elif record["status"] == "failed":
+                self.stats["failed"] += 1
+            else:
+                self.stats["cancelled"] += 1
+
+        logger.info(f"[{record['id']}] {record['status']} in {record['duration']}s")
+        self.manifest.write(record)
+        if self.job_store:
+            self._store_result(record)
+
+    def _start_job(self, job: BatchJob):
+        if self.job_store:
+            self.job_store.start(job.id)
+
+    def _store_result(self, record: dict[str, Any]):
+        try:
+            self.job_store.record(record)
+        except Exception as e:
+            logger.error(f"[{record['id']}] Failed to update job store: {e}")
+
+    def _run_job(self, job: BatchJob):
+        started = time.monotonic()
+        self._start_job(job)
+        runner = self._make_runner(job)
+        try:
+            images = runner.run()
+        except Exception as e:
+            self._record_result(job, runner, started, error=e)
+        else:
+            self._record_result(job, runner, started, images=images)
+
+    async def _arun_job(self, job: BatchJob):
+        started = time.monotonic()
+        await asyncio.to_thread(self._start_job, job)
+        runner = self._make_runner(job)
+        try:
+            images = await runner.arun()
+        except Exception as e:
+            result = {"error": e}
+        else:
+            result = {"images": images}
+        # Manifest and job store writes are disk/SQLite I/O; keep them off the event loop
+        await asyncio.to_thread(self._record_result, job, runner, started, **result)
+
+    def _release_slot(self, _future):
+        self._slots.release()
+
+    def _drain(self):
+        self.cancel.close()
+        # Pending saves still add manifest lines, so flush them before closing it
+        if self.pipeline:
+            self.pipeline.flush()
+        self.manifest.close()
+
+    def _log_summary(self, started: float):
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Batch finished in {elapsed:.1f}s: {self.stats['succeeded']} succeeded, "
+            f"{self.stats['failed']} failed, {self.stats['cancelled']} cancelled, {self.stats['images']} images"
+        )
+        if self._should_stop():
+            logger.warning(f"{self.cancel.reason}: remaining jobs were not started")
+
+    def run(self) -> dict[str, int]:
+        started = time.monotonic()
+        self._start_budget()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as executor:
+                try:
+                    for job in self.jobs:
+                        # Backpressure: wait for a free slot before pulling the next job
+                        while not self._slots.acquire(timeout=0.5):
+                            if self._should_stop():
+                                break
+                        if self._should_stop():
+                            break
+
+                        future = executor.submit(self._run_job, job)
+                        future.add_done_callback(self._release_slot)
+                        self.stats["submitted"] += 1
+                except BaseException:
+                    # Ctrl+C: abort the jobs in flight rather than wait for them on the way out
+                    self.stop()
+                    raise
+        finally:
+            self._drain()
+
+        self._log_summary(started)
+        return self.stats
+
+    async def arun(self) -> dict[str, int]:
+        """
+        Asyncio variant of run(): `workers` is the number of requests kept in
+        flight on the event loop rather than a thread count, so it can be set
+        much higher without paying for one thread per request.
+        """
+        started = time.monotonic()
+        self._start_budget()
+        in_flight = asyncio.Semaphore(self.workers)
+        tasks = set()
+
+        def _on_done(task):
+            tasks.discard(task)
+            in_flight.release()
+
+        try:
+            for job in self.jobs:
+                await in_flight.acquire()
+                if self._should_stop():
+                    in_flight.release()
+                    break
+
+                task = asyncio.create_task(self._arun_job(job))
+                tasks.add(task)
+                task.add_done_callback(_on_done)
+                self.stats["submitted"] += 1
+
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            self._drain()
+
+        self._log_summary(started)
+        return self.stats
@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional
+
+from api.models import GeneratedImage, GenerationParameters
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache of generation results.
+
+    Each entry lives in `<dir>/<key[:2]>/<key>/` and holds the raw image bytes as
+    returned by the API plus a `meta.json` with the parameters and MIME types. The key is `GenerationParameters.cache_key()`.
+    Entries are evicted least-recently-used once the total size exceeds `max_bytes`;
+    a hit refreshes the entry's mtime so recency survives restarts.
+    """
+    META_FILE = "meta.json"
+
+    def __init__(self, directory: str, max_bytes: int, seeded_only: bool = True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.seeded_only = seeded_only
+        self._lock = threading.Lock()
+        self._entries: Optional[OrderedDict[str, int]] = None  # key -> bytes, oldest first
+        self._total = 0
+
+    @classmethod
+    def from_settings(cls, config: Optional[dict[str, Any]]) -> Optional["ResultCache"]:
+        if not config or not config.get("enabled", False):
+            return None
+        return cls(
+            directory=config.get("dir", ".cache/results"),
+            max_bytes=int(config.get("max_size_mb", 2048)) * 1024 * 1024,
+            seeded_only=config.get("seeded_only", True)
+        )
+
+    def accepts(self, params: GenerationParameters) -> bool:
+        # Without a seed every call is a fresh sample, so by default those are never served from cache
+        return params.seed is not None or not self.seeded_only
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _load_index(self):
+        if self._entries is not None:
+            return
+        entries = []
+        if os.path.isdir(self.directory):
+            for shard in os.scandir(self.directory):
+                if not shard.is_dir() or shard.name.startswith("."):
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.startswith("."):
+                        continue
+                    meta_path = os.path.join(entry.path, self.META_FILE)
+                    try:
+                        mtime = os.stat(meta_path).st_mtime
+                    except OSError:
+                        continue
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+                    entries.append((mtime, entry.name, size))
+        entries.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in entries)
+        self._total = sum(self._entries.values())
+
+    def get(self, params: GenerationParameters) -> Optional[list[GeneratedImage]]:
+        key = params.cache_key()
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, self.META_FILE)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            images = []
+            for entry in meta["files"]:
+                with open(os.path.join(entry_dir, entry["name"]), 'rb') as f:
+                    images.append(GeneratedImage(data=f.read(), mime_type=entry["mime_type"]))
+        except (OSError, ValueError, KeyError):
+            return None
+
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+        with self._lock:
+            self._load_index()
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return images
+
+    def put(self, params: GenerationParameters, images: list[GeneratedImage]):
+        key = params.cache_key()
+        entry_dir = self._entry_dir(key)
+        if os.path.exists(entry_dir):
+            return
+
+        # Write into a private temp dir, then rename into place so readers never see a partial entry
+        shard_dir = os.path.dirname(entry_dir)
+        os.makedirs(shard_dir, exist_ok=True)
+        tmp_dir = os.path.join(shard_dir, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        try:
+            files = []
+            size = 0
+            for i, image in enumerate(images):
+                name = f"{i}.{image.extension}"
+                with open(os.path.join(tmp_dir, name), 'wb') as f:
+                    f.write(image.data)
+                files.append({"name": name, "mime_type": image.mime_type})
+                size += len(image.data)
+
+            meta = {"params": params.model_dump(), "files": files, "created": time.time()}
+            meta_data = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+            with open(os.path.join(tmp_dir, self.META_FILE), 'wb') as f:
+                f.write(meta_data)
+            size += len(meta_data)
+
+            os.rename(tmp_dir, entry_dir)
+        except OSError as e:
+            # Another worker may have stored the same key first; either way the cache stays usable
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.exists(entry_dir):
+                logger.warning(f"Failed to write cache entry {key[:12]}: {e}")
+            return
+
+        with self._lock:
+            self._load_index()
+            if key not in self._entries:
+                self._entries[key] = size
+                self._total += size
+            self._evict()
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            self._total -= size
+            logger.debug(f"Evicted cache entry {key[:12]} ({size} bytes)")
@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Iterator, Optional
+
+from api.models import GenerationParameters
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("path", "sha256", "bytes", "format", "created", "model", "requested_model", "prompt",
+           "negative_prompt", "seed", "params_key", "params", "generation_seconds", "encode_seconds", "save_seconds",
+           "perceptual_hash", "duplicate_of")
+
+
+class Catalog:
+    """
+    SQLite index of every saved output: where it is, its SHA-256 and size, the
+    parameters and model that produced it and how long generating, encoding and
+    writing took. Lets the archive be searched by model, prompt, date or content
+    hash without walking the output folders. With duplicate detection on, each
+    row also has its perceptual hash and the file it duplicates, if any.
+
+    Paths are stored relative to the catalog's folder (normally output_dir), so
+    the archive can be moved as a whole; find() returns them joined back.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.root = os.path.dirname(os.path.abspath(path))
+        os.makedirs(self.root, exist_ok=True)
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS outputs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT NULL UNIQUE, sha256 TEXT NOT NULL, "
+            "bytes INTEGER, format TEXT, created REAL NOT NULL, model TEXT, requested_model TEXT, prompt TEXT, "
+            "negative_prompt TEXT, seed INTEGER, params_key TEXT, params TEXT, generation_seconds REAL, "
+            "encode_seconds REAL, save_seconds REAL, perceptual_hash TEXT, duplicate_of TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS outputs_created ON outputs (created)")
+        conn.execute("CREATE INDEX IF NOT EXISTS outputs_model ON outputs (model, created)")
+        conn.execute("CREATE INDEX IF NOT EXISTS outputs_sha256 ON outputs (sha256)")
+        conn.execute("CREATE INDEX IF NOT EXISTS outputs_params_key ON outputs (params_key)")
+
+    @classmethod
+    def from_settings(cls, config: Optional[dict[str, Any]], output_dir: str) -> Optional["Catalog"]:
+        """The catalog named in the "output_layout" settings, relative to output_dir; None when disabled."""
+        name = (config or {}).get("catalog")
+        if not name:
+            return None
+        return cls(os.path.join(output_dir, name))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _relative(self, path: str) -> str:
+        relative = os.path.relpath(os.path.abspath(path), self.root)
+        # Files outside the catalog's folder keep their absolute path
+        return os.path.abspath(path) if relative.startswith("..") else relative
+
+    def add(self, path: str, sha256: str, size: int, format: str,
+            params: Optional[GenerationParameters] = None, model: Optional[str] = None,
+            generation_seconds: Optional[float] = None, encode_seconds: Optional[float] = None,
+            save_seconds: Optional[float] = None, perceptual_hash: Optional[str] = None,
+            duplicate_of: Optional[str] = None):
+        """Record one saved file. `model` is the model that answered when it differs from params.model."""
+        row = {
+            "path": self._relative(path),
+            "sha256": sha256,
+            "bytes": size,
+            "format": format,
+            "created": time.time(),
+            "model": model or (params.model if params else None),
+            "requested_model": params.model if params else None,
+            "prompt": params.prompt if params else None,
+            "negative_prompt": params.negative_prompt if params else None,
+            "seed": params.seed if params else None,
+            "params_key": params.cache_key() if params else None,
+            "params": json.dumps(params.model_dump(), ensure_ascii=False) if params else None,
+            "generation_seconds": generation_seconds,
+            "encode_seconds": encode_seconds,
+            "save_seconds": save_seconds,
+            "perceptual_hash": perceptual_hash,
+            "duplicate_of": self._relative(duplicate_of) if duplicate_of else None,
+        }
+        self._connect().execute(
+            f"INSERT OR REPLACE INTO outputs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+            [row[column] for column in COLUMNS]
+        )
+
+    def find(self, model: Optional[str] = None, prompt: Optional[str] = None, sha256: Optional[str] = None,
+             since: Optional[float] = None, until: Optional[float] = None, duplicates: bool = False,
+             limit: Optional[int] = 100) -> list[dict[str, Any]]:
+        """
+        Outputs matching every given filter, newest first. `prompt` is a substring
+        match, `sha256` may be a prefix, `since`/`until` are Unix timestamps and
+        `duplicates` keeps only files flagged as near-duplicates of another.
+        """
+        where, args = [], []
+        if model:
+            where.append("model = ?")
+            args.append(model)
+        if prompt:
+            where.append("prompt LIKE ? ESCAPE '\\'")
+            args.append("%" + prompt.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if sha256:
+            where.append("sha256 >= ? AND sha256 < ?")
+            args += [sha256.lower(), sha256.lower() + "g"]
+        if since is not None:
+            where.append("created >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("created < ?")
+            args.append(until)
+        if duplicates:
+            where.append("duplicate_of IS NOT NULL")
+
+        query = f"SELECT {', '.join(COLUMNS)} FROM outputs"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY created DESC"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+
+        results = []
+        for values in self._connect().execute(query, args):
+            row = dict(zip(COLUMNS, values))
+            row["path"] = os.path.join(self.root, row["path"])
+            if row["duplicate_of"]:
+                row["duplicate_of"] = os.path.join(self.root, row["duplicate_of"])
+            row["params"] = json.loads(row["params"]) if row["params"] else None
+            results.append(row)
+        return results
+
+    def perceptual_hashes(self, prefix: str) -> Iterator[tuple[str, str]]:
+        """(path, perceptual hash) of every original (not flagged duplicate) output whose hash starts with `prefix`."""
+        rows = self._connect().execute(
+            "SELECT path, perceptual_hash FROM outputs WHERE perceptual_hash >= ? AND perceptual_hash < ? "
+            "AND duplicate_of IS NULL ORDER BY id", (prefix, prefix + "\uffff")
+        )
+        for path, key in rows:
+            yield os.path.join(self.root, path), key
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM outputs").fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
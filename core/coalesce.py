@@ -0,0 +1,41 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable
+
+
+class RequestCoalescer:
+    """
+    Lets concurrent callers with the same key share one execution: the first
+    caller runs `fn`, everyone arriving while it is in flight waits for and gets
+    the same result (or exception). Nothing is cached once the call finishes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: dict[Hashable, Future] = {}
+
+    def run(self, key: Hashable, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        """Returns (result, shared); `shared` is True when another caller's execution was reused."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._in_flight)
@@ -0,0 +1,229 @@
+import functools
+import itertools
+import logging
+import math
+import threading
+from array import array
+from typing import TYPE_CHECKING, Any, Iterable, Optional
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+HASH_ALGORITHMS = ("ahash", "dhash", "phash")
+DEDUP_ACTIONS = ("flag", "skip", "hardlink")
+HASH_BITS = 64
+
+
+@functools.lru_cache(maxsize=None)
+def numpy_available() -> bool:
+    try:
+        import numpy  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _gray(image: "Image.Image", width: int, height: int) -> bytes:
+    """The image shrunk to width x height 8-bit grayscale, row by row."""
+    from PIL import Image
+    if image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGB")
+    small = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return small.convert("L").tobytes()
+
+
+def _bits_to_int(bits: Iterable[bool]) -> int:
+    value = 0
+    for bit in bits:
+        value = (value << 1) | bool(bit)
+    return value
+
+
+def _dct_matrix(size: int, n: int) -> list[list[float]]:
+    """First `size` rows of the orthonormal DCT-II matrix for n samples."""
+    return [[math.sqrt((1 if k == 0 else 2) / n) * math.cos(math.pi * (2 * i + 1) * k / (2 * n)) for i in range(n)]
+            for k in range(size)]
+
+
+_DCT_8x32 = _dct_matrix(8, 32)
+
+
+def average_hash(image: "Image.Image") -> int:
+    """aHash: 8x8 grayscale, one bit per pixel brighter than the mean."""
+    pixels = _gray(image, 8, 8)
+    if numpy_available():
+        import numpy as np
+        values = np.frombuffer(pixels, dtype=np.uint8)
+        return int.from_bytes(np.packbits(values > values.mean()).tobytes(), "big")
+    mean = sum(pixels) / len(pixels)
+    return _bits_to_int(p > mean for p in pixels)
+
+
+def difference_hash(image: "Image.Image") -> int:
+    """dHash: 9x8 grayscale, one bit per horizontally adjacent pair that gets darker."""
+    pixels = _gray(image, 9, 8)
+    if numpy_available():
+        import numpy as np
+        values = np.frombuffer(pixels, dtype=np.uint8).reshape(8, 9)
+        return int.from_bytes(np.packbits(values[:, :-1] > values[:, 1:]).tobytes(), "big")
+    return _bits_to_int(pixels[r * 9 + c] > pixels[r * 9 + c + 1] for r in range(8) for c in range(8))
+
+
+def perceptual_hash(image: "Image.Image") -> int:
+    """pHash: lowest 8x8 DCT frequencies of a 32x32 grayscale, one bit per coefficient above their median."""
+    pixels = _gray(image, 32, 32)
+    if numpy_available():
+        import numpy as np
+        dct = np.array(_DCT_8x32)
+        coefficients = (dct @ np.frombuffer(pixels, dtype=np.uint8).reshape(32, 32).astype(np.float64) @ dct.T).ravel()
+        # The DC term only measures overall brightness, so it is left out of the median
+        median = np.median(coefficients[1:])
+        return int.from_bytes(np.packbits(coefficients > median).tobytes(), "big")
+
+    rows = [pixels[r * 32:(r + 1) * 32] for r in range(32)]
+    # DCT of each row (32x8), then of each resulting column (8x8)
+    partial = [[sum(row[i] * basis[i] for i in range(32)) for basis in _DCT_8x32] for row in rows]
+    coefficients = [sum(basis[r] * partial[r][c] for r in range(32)) for basis in _DCT_8x32 for c in range(8)]
+    median = sorted(coefficients[1:])[31]
+    return _bits_to_int(c > median for c in coefficients)
+
+
+HASH_FUNCTIONS = {"ahash": average_hash, "dhash": difference_hash, "phash": perceptual_hash}
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class HashIndex:
+    """
+    Nearest-neighbour lookup of 64-bit hashes within a Hamming distance, by
+    multi-index hashing: each hash is split into `threshold + 1` chunks (at most 16)
+    and filed under every chunk's value. Two hashes within the threshold agree
+    exactly on at least one chunk (pigeonhole), so a lookup only compares the
+    hashes sharing a chunk with the query instead of the whole archive. Larger
+    thresholds also probe chunk values within `threshold // chunks` bits.
+    """
+    def __init__(self, threshold: int):
+        if not 0 <= threshold <= 32:
+            raise ValueError("Duplicate threshold must be between 0 and 32 bits")
+        self.threshold = threshold
+        chunks = min(threshold + 1, 16)
+        self._chunk_radius = threshold // chunks
+        sizes = [HASH_BITS // chunks + (1 if i < HASH_BITS % chunks else 0) for i in range(chunks)]
+        self._chunks = []  # (shift, mask) per chunk
+        shift = HASH_BITS
+        for size in sizes:
+            shift -= size
+            self._chunks.append((shift, (1 << size) - 1))
+        self._buckets: list[dict[int, list[int]]] = [{} for _ in self._chunks]
+        self._hashes = array("Q")
+        self._values: list[Any] = []
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, value_hash: int, value: Any):
+        entry = len(self._hashes)
+        self._hashes.append(value_hash)
+        self._values.append(value)
+        for (shift, mask), buckets in zip(self._chunks, self._buckets):
+            buckets.setdefault((value_hash >> shift) & mask, []).append(entry)
+
+    def _probes(self, chunk: int, mask: int) -> Iterable[int]:
+        yield chunk
+        width = mask.bit_length()
+        for flips in range(1, self._chunk_radius + 1):
+            for positions in itertools.combinations(range(width), flips):
+                yield chunk ^ sum(1 << p for p in positions)
+
+    def find(self, value_hash: int) -> Optional[tuple[Any, int]]:
+        """(value, distance) of the closest hash within the threshold, or None."""
+        best: Optional[tuple[int, int]] = None
+        seen: set[int] = set()
+        for (shift, mask), buckets in zip(self._chunks, self._buckets):
+            for probe in self._probes((value_hash >> shift) & mask, mask):
+                for entry in buckets.get(probe, ()):
+                    if entry in seen:
+                        continue
+                    seen.add(entry)
+                    distance = hamming(value_hash, self._hashes[entry])
+                    if distance <= self.threshold and (best is None or distance < best[1]):
+                        best = (entry, distance)
+                        if distance == 0:
+                            return self._values[entry], 0
+        if best is None:
+            return None
+        return self._values[best[0]], best[1]
+
+
+class Deduplicator:
+    """
+    Finds saved outputs that look like a new image: its perceptual hash
+    (`algorithm`: ahash, dhash or phash) is compared with every earlier output's
+    and anything within `threshold` differing bits counts as a duplicate.
+    `action` says what GeneratorCore.save_image does with one:
+    - flag: save it anyway and record which file it duplicates in the catalog
+    - skip: don't save it; the earlier file's path is returned instead
+    - hardlink: save a hard link to the earlier file instead of new bytes
+
+    Hashes are stored in the catalog as "<algorithm>:<hex>", and the in-memory
+    index is filled from it on first use, so duplicates are found across runs.
+    NumPy is used for hashing when installed; without it a pure-Python version
+    gives the same hashes, only slower.
+    """
+    def __init__(self, algorithm: str = "dhash", threshold: int = 6, action: str = "flag"):
+        if algorithm not in HASH_FUNCTIONS:
+            raise ValueError(f"Unknown perceptual hash '{algorithm}' (expected one of: {', '.join(HASH_ALGORITHMS)})")
+        if action not in DEDUP_ACTIONS:
+            raise ValueError(f"Unknown duplicate action '{action}' (expected one of: {', '.join(DEDUP_ACTIONS)})")
+        self.algorithm = algorithm
+        self.action = action
+        self.index = HashIndex(threshold)
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @classmethod
+    def from_settings(cls, config: Optional[dict[str, Any]]) -> Optional["Deduplicator"]:
+        if not config or not config.get("enabled", False):
+            return None
+        return cls(
+            algorithm=config.get("algorithm", "dhash"),
+            threshold=int(config.get("threshold", 6)),
+            action=config.get("action", "flag")
+        )
+
+    def hash(self, image: "Image.Image") -> int:
+        return HASH_FUNCTIONS[self.algorithm](image)
+
+    def key(self, value_hash: int) -> str:
+        """How a hash is stored in the catalog."""
+        return f"{self.algorithm}:{value_hash:016x}"
+
+    def load(self, catalog) -> int:
+        """Index the earlier outputs recorded in `catalog` (once). Returns how many were added."""
+        with self._lock:
+            if self._loaded:
+                return 0
+            self._loaded = True
+            if catalog is None:
+                return 0
+            prefix = f"{self.algorithm}:"
+            count = 0
+            for path, key in catalog.perceptual_hashes(prefix):
+                self.index.add(int(key[len(prefix):], 16), path)
+                count += 1
+        if count:
+            logger.info(f"Loaded {count} perceptual hashes for duplicate detection")
+        return count
+
+    def find(self, value_hash: int) -> Optional[tuple[str, int]]:
+        """(path, distance) of the closest earlier output within the threshold."""
+        with self._lock:
+            return self.index.find(value_hash)
+
+    def add(self, value_hash: int, path: str):
+        with self._lock:
+            self.index.add(value_hash, path)
@@ -0,0 +1,107 @@
+import logging
+from io import BytesIO
+from typing import TYPE_CHECKING, Any, Optional, Union
+
+from api.models import GeneratedImage
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ["original", "png", "webp", "jpeg", "avif"]
+
+FORMAT_EXTENSIONS = {"png": "png", "webp": "webp", "jpeg": "jpg", "avif": "avif"}
+FORMAT_MIME_TYPES = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg", "avif": "image/avif"}
+
+
+def avif_available() -> bool:
+    """AVIF needs Pillow built with libavif (11.2+) or the pillow-avif-plugin package."""
+    try:
+        from PIL import features
+        if features.check("avif"):
+            return True
+    except Exception:
+        pass
+    try:
+        import pillow_avif  # noqa: F401  (registers the plugin on import)
+        return True
+    except ImportError:
+        return False
+
+
+class OutputEncoder:
+    """
+    Turns a generation result into the bytes written to disk.
+
+    "original" writes the API bytes untouched. Other formats decode once and
+    re-encode with the given options:
+    - png: `compress_level` 0-9 (None = Pillow default)
+    - webp: `quality` 0-100, `lossless`, `method` 0-6 (speed/size trade-off)
+    - jpeg: `quality` 0-95
+    - avif: `quality` 0-100, `speed` 0-10, only if an AVIF encoder is installed
+    """
+    def __init__(self, format: str = "original", quality: int = 90, compress_level: Optional[int] = None,
+                 lossless: bool = False, method: int = 4, speed: int = 6):
+        format = (format or "original").lower()
+        if format == "jpg":
+            format = "jpeg"
+        if format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format '{format}'. Choose from: {', '.join(OUTPUT_FORMATS)}")
+        if format == "avif" and not avif_available():
+            logger.warning("AVIF encoder not available (install pillow-avif-plugin); saving original bytes instead")
+            format = "original"
+
+        self.format = format
+        self.quality = quality
+        self.compress_level = compress_level
+        self.lossless = lossless
+        self.method = method
+        self.speed = speed
+
+    @classmethod
+    def from_settings(cls, config: Optional[dict[str, Any]]) -> "OutputEncoder":
+        config = config or {}
+        return cls(
+            format=config.get("format", "original"),
+            quality=int(config.get("quality", 90)),
+            compress_level=config.get("compress_level"),
+            lossless=bool(config.get("lossless", False)),
+            method=int(config.get("method", 4)),
+            speed=int(config.get("speed", 6))
+        )
+
+    def _is_passthrough(self, image: Union[GeneratedImage, "Image.Image"]) -> bool:
+        if not isinstance(image, GeneratedImage):
+            return False
+        if self.format == "original":
+            return True
+        # Re-encoding PNG to PNG at default settings only costs time
+        return (self.format == "png" and self.compress_level is None
+                and image.mime_type == FORMAT_MIME_TYPES["png"])
+
+    def encode(self, image: Union[GeneratedImage, "Image.Image"]) -> tuple[bytes, str]:
+        """Returns (encoded bytes, file extension)."""
+        if self._is_passthrough(image):
+            return image.data, image.extension
+
+        pil_image = image.image if isinstance(image, GeneratedImage) else image
+        target = "png" if self.format == "original" else self.format
+
+        options: dict[str, Any] = {}
+        if target == "png":
+            if self.compress_level is not None:
+                options["compress_level"] = int(self.compress_level)
+        elif target == "webp":
+            options.update(quality=self.quality, lossless=self.lossless, method=self.method)
+        elif target == "jpeg":
+            options["quality"] = min(self.quality, 95)
+            # JPEG has no alpha channel
+            if pil_image.mode not in ("RGB", "L"):
+                pil_image = pil_image.convert("RGB")
+        elif target == "avif":
+            options.update(quality=self.quality, speed=self.speed)
+
+        buffer = BytesIO()
+        pil_image.save(buffer, format=target.upper(), **options)
+        return buffer.getvalue(), FORMAT_EXTENSIONS[target]
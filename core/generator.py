@@ -1,38 +1,220 @@
-import os
-from datetime import datetime
-from PIL import Image
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Optional, Union
+from api.cancellation import CancellationToken
 from api.client import APIClient
-from api.models import GenerationParameters
+from api.key_pool import KeyPool
+from api.models import GeneratedImage, GenerationParameters
+from api.references import ReferenceImages
+from api.rate_limit import RateLimiter
+from .cache import ResultCache
+from .catalog import Catalog
+from .dedup import Deduplicator
+from .encoding import OutputEncoder
+from .layout import OutputLayout
+from .metrics import Metrics
 from .settings import SettingsManager
+from .storage import AtomicWriter
+from .thumbnails import ThumbnailStore
+
+if TYPE_CHECKING:
+    from PIL import Image
+    from .session import EditSession
+
+logger = logging.getLogger(__name__)
 
 class GeneratorCore:
     def __init__(self):
         self.settings = SettingsManager()
-        # Load API Key from settings if available
-        api_key = self.settings.get("api_key", "")
-        self.client = APIClient(api_key)
+        self.metrics = Metrics.from_settings(self.settings.get("metrics"))
+        # Optional client-side quota; a rate_limit_db path shares it across processes
+        self.rate_limiter = RateLimiter.from_settings(
+            self.settings.get("rate_limits"),
+            self.settings.get("rate_limit_db")
+        )
+        # API keys from settings, env and an optional keys file; requests are spread over all of them
+        self.client = APIClient(
+            self.settings.get("api_key", ""), rate_limiter=self.rate_limiter, metrics=self.metrics,
+            key_pool=KeyPool.from_settings(self.settings),
+            # Per-model deadlines in seconds; a request past its deadline is aborted and retried like a timeout
+            timeouts=self.settings.get("timeouts"),
+            references=ReferenceImages.from_settings(self.settings.get("references"), metrics=self.metrics)
+        )
+        self.cache = ResultCache.from_settings(self.settings.get("cache"))
+        self.encoder = OutputEncoder.from_settings(self.settings.get("output_format"))
+        self.thumbnails = ThumbnailStore.from_settings(self.settings.get("thumbnails"))
+        self.layout = OutputLayout.from_settings(self.settings.get("output_layout"))
+        # Temp file + rename for every output, fsynced per file, per batch or not at all
+        self.storage = AtomicWriter.from_settings(self.settings.get("storage"))
+        # Optional near-duplicate detection by perceptual hash (off by default)
+        self.dedup = Deduplicator.from_settings(self.settings.get("dedup"))
+        self._catalog: Optional[Catalog] = None
+        self._catalog_loaded = False
+        self._catalog_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    @property
+    def catalog(self) -> Optional[Catalog]:
+        """Index of saved outputs (core.catalog), opened on first use; None when disabled."""
+        with self._catalog_lock:
+            if not self._catalog_loaded:
+                self._catalog = Catalog.from_settings(self.settings.get("output_layout"), self.settings.get("output_dir"))
+                self._catalog_loaded = True
+            return self._catalog
 
     def update_api_key(self, api_key: str):
         # Update in-memory settings and client, but don't persist to config.json
         self.settings.settings["api_key"] = api_key
-        self.client.update_api_key(api_key)
-
-    def generate(self, params: GenerationParameters) -> list[Image.Image]:
-        return self.client.generate(params)
-
-    def save_image(self, image: Image.Image, prefix: str = "img"):
-        output_dir = self.settings.get("output_dir")
-        os.makedirs(output_dir, exist_ok=True)
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{prefix}_{timestamp}.png"
-        path = os.path.join(output_dir, filename)
-        
-        counter = 1
-        while os.path.exists(path):
-            filename = f"{prefix}_{timestamp}_{counter}.png"
-            path = os.path.join(output_dir, filename)
-            counter += 1
-            
-        image.save(path)
+        self.client.pool = KeyPool.from_settings(self.settings)
+
+    def has_api_key(self) -> bool:
+        return len(self.client.pool) > 0
+
+    def update_output_format(self, options: dict):
+        # Like the API key, CLI/YAML overrides stay in memory and are not persisted
+        config = dict(self.settings.get("output_format") or {})
+        config.update({k: v for k, v in options.items() if v is not None})
+        self.settings.settings["output_format"] = config
+        self.encoder = OutputEncoder.from_settings(config)
+
+    def update_output_layout(self, options: dict):
+        # CLI/YAML overrides, in memory only like the output format
+        config = dict(self.settings.get("output_layout") or {})
+        config.update({k: v for k, v in options.items() if v is not None})
+        self.settings.settings["output_layout"] = config
+        self.layout = OutputLayout.from_settings(config)
+        with self._catalog_lock:
+            self._catalog = None
+            self._catalog_loaded = False
+
+    def _cache_for(self, params: GenerationParameters, use_cache: bool):
+        if use_cache and self.cache and self.cache.accepts(params):
+            return self.cache
+        return None
+
+    def generate(self, params: GenerationParameters, use_cache: bool = True,
+                 cancel: Optional[CancellationToken] = None) -> list[GeneratedImage]:
+        cache = self._cache_for(params, use_cache)
+        if cache:
+            images = cache.get(params)
+            if images:
+                logger.info(f"Cache hit for {params.cache_key()[:12]}, skipping API call")
+                return images
+
+        images = self.client.generate(params, cancel)
+        if cache:
+            cache.put(params, images)
+        return images
+
+    async def agenerate(self, params: GenerationParameters, use_cache: bool = True,
+                        cancel: Optional[CancellationToken] = None) -> list[GeneratedImage]:
+        cache = self._cache_for(params, use_cache)
+        if cache:
+            images = await asyncio.to_thread(cache.get, params)
+            if images:
+                logger.info(f"Cache hit for {params.cache_key()[:12]}, skipping API call")
+                return images
+
+        images = await self.client.agenerate(params, cancel)
+        if cache:
+            await asyncio.to_thread(cache.put, params, images)
+        return images
+
+    def run_async(self, coro):
+        """
+        Run a coroutine (e.g. GenerationRunner.arun()) on the core's event loop and
+        block until it finishes. For callers without a loop of their own, such as
+        GUI worker threads. The loop lives on a daemon thread for the life of the
+        core: the SDK's async HTTP connections belong to the loop that opened them,
+        so a fresh asyncio.run() per call would break the next call on a kept-alive connection.
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="event-loop", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def edit_session(self, params: GenerationParameters, image_path: Optional[str] = None) -> "EditSession":
+        """
+        A multi-turn edit session (core.session) for `params`. With `image_path`
+        (an image already generated from them) refinement starts from that image;
+        otherwise call start() first or let the first refine() do it.
+        """
+        from .session import EditSession
+        config = self.settings.get("edit_sessions")
+        if image_path:
+            return EditSession.from_image(self, params, image_path, config)
+        return EditSession.from_settings(self, params, config)
+
+    def save_image(self, image: Union[GeneratedImage, "Image.Image"], prefix: str = "img",
+                   params: Optional[GenerationParameters] = None, model: Optional[str] = None,
+                   generation_seconds: Optional[float] = None) -> str:
+        """
+        Save one result under output_dir in the configured output format and layout
+        (see core.layout), written atomically (see core.storage), and record it in
+        the catalog. With the default "original" format, API results are written
+        byte-for-byte (no decode or re-encode); plain PIL images are saved as PNG.
+        `model` is the model that answered, if a fallback or hedge differs from
+        params.model.
+
+        With duplicate detection on, an image that looks like an earlier output is
+        flagged, not saved (the earlier path is returned) or hard-linked to it.
+        """
+        perceptual, duplicate = self._find_duplicate(image)
+        if duplicate and self.dedup.action == "skip":
+            logger.info(f"Not saving a near-duplicate of {duplicate}")
+            self.metrics.inc("duplicates_total", action="skip")
+            return duplicate
+
+        started = time.perf_counter()
+        data, ext = self.encoder.encode(image)
+        encoded = time.perf_counter()
+        digest = hashlib.sha256(data).hexdigest()
+
+        # The name contains the content hash, so concurrent workers never collide and no free name is searched for
+        path = self.layout.path_for(self.settings.get("output_dir"), prefix, ext, digest)
+        linked = None
+        if duplicate is not None and self.dedup.action == "hardlink":
+            linked = self.storage.link(duplicate, path)
+        path = linked or self.storage.write(path, data)
+        if duplicate:
+            logger.info(f"{path} is a near-duplicate of {duplicate}")
+            self.metrics.inc("duplicates_total", action="hardlink" if linked else "flag")
+        elif perceptual is not None:
+            # Added after the write, so two near-duplicates saved concurrently may both be kept
+            self.dedup.add(perceptual, path)
+
+        written = time.perf_counter()
+        self.metrics.observe("encode_seconds", encoded - started, format=self.encoder.format)
+        self.metrics.observe("save_seconds", written - encoded)
+        self.metrics.inc("bytes_written_total", len(data))
+
+        catalog = self.catalog
+        if catalog:
+            try:
+                catalog.add(path, digest, len(data), ext, params=params, model=model,
+                            generation_seconds=generation_seconds, encode_seconds=encoded - started,
+                            save_seconds=written - encoded,
+                            perceptual_hash=self.dedup.key(perceptual) if perceptual is not None else None,
+                            duplicate_of=duplicate)
+            except Exception as e:
+                logger.warning(f"Failed to add {path} to the catalog: {e}")
         return path
+
+    def _find_duplicate(self, image: Union[GeneratedImage, "Image.Image"]) -> tuple[Optional[int], Optional[str]]:
+        """(perceptual hash, path of the earlier output it duplicates); (None, None) when detection is off."""
+        if not self.dedup:
+            return None, None
+        try:
+            self.dedup.load(self.catalog)
+            with self.metrics.timer("dedup_seconds"):
+                perceptual = self.dedup.hash(image.image if isinstance(image, GeneratedImage) else image)
+                match = self.dedup.find(perceptual)
+        except Exception as e:
+            logger.warning(f"Duplicate check failed, saving anyway: {e}")
+            return None, None
+        return perceptual, match[0] if match else None
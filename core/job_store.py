@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional
+
+from api.models import GenerationParameters
+from core.batch import BatchJob
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobStore:
+    """
+    Durable batch queue in a SQLite file. Every job moves through
+    pending -> in_flight -> done/failed, with its attempts, outputs and last error,
+    so a restarted run (crash, systemd restart, Ctrl+C) continues where it stopped
+    instead of spending quota on jobs that already finished.
+
+    A job is only marked done after its images are on disk. If the process dies in
+    between, the job is still in_flight and runs once more after recover(); the
+    first copy of its images stays in the output folder.
+    """
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, params TEXT NOT NULL, "
+                "state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, outputs TEXT, error TEXT, "
+                "updated REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, seq)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL + NORMAL survives process crashes; only a power loss can drop the last commits
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def add(self, jobs: Iterable[BatchJob], chunk_size: int = 500) -> int:
+        """
+        Insert BatchJobs as pending. Ids already in the store are left untouched,
+        so re-running the same job file only adds what is new. Returns the number added.
+        """
+        added = 0
+        chunk = []
+        for job in jobs:
+            chunk.append((job.id, json.dumps(job.params.model_dump(), ensure_ascii=False), PENDING, time.time()))
+            if len(chunk) >= chunk_size:
+                added += self._insert(chunk)
+                chunk = []
+        if chunk:
+            added += self._insert(chunk)
+        return added
+
+    def _insert(self, rows: list[tuple]) -> int:
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO jobs (id, params, state, updated) VALUES (?, ?, ?, ?)", rows)
+            return conn.total_changes - before
+
+    def recover(self) -> int:
+        """Return jobs left in_flight by a previous run to pending. Call once at startup."""
+        with self._transaction() as conn:
+            count = conn.execute(
+                "UPDATE jobs SET state = ?, updated = ? WHERE state = ?", (PENDING, time.time(), IN_FLIGHT)
+            ).rowcount
+        if count:
+            logger.info(f"Recovered {count} interrupted job(s) from {self.path}")
+        return count
+
+    def requeue_failed(self) -> int:
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE jobs SET state = ?, error = NULL, updated = ? WHERE state = ?", (PENDING, time.time(), FAILED)
+            ).rowcount
+
+    def pending(self, page_size: int = 100) -> Iterator[BatchJob]:
+        """
+        Stream pending jobs in insertion order, a page at a time. Pages are read by
+        sequence number, so jobs claimed while iterating are not skipped or repeated.
+        """
+        last_seq = 0
+        while True:
+            rows = self._connect().execute(
+                "SELECT seq, id, params FROM jobs WHERE state = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (PENDING, last_seq, page_size)
+            ).fetchall()
+            if not rows:
+                return
+            for seq, job_id, params in rows:
+                last_seq = seq
+                try:
+                    yield BatchJob(id=job_id, params=GenerationParameters(**json.loads(params)))
+                except Exception as e:
+                    logger.error(f"[{job_id}] Stored parameters are invalid: {e}")
+                    self.finish(job_id, FAILED, error=f"Invalid parameters: {e}")
+
+    def start(self, job_id: str):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                (IN_FLIGHT, time.time(), job_id)
+            )
+
+    def finish(self, job_id: str, state: str, outputs: Optional[list[str]] = None, error: Optional[str] = None):
+        """Record the final state (done/failed), or put the job back to pending."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, outputs = ?, error = ?, updated = ? WHERE id = ?",
+                (state, json.dumps(outputs or []), error, time.time(), job_id)
+            )
+
+    def record(self, record: dict):
+        """Store a batch manifest record. Cancelled jobs go back to pending so the next run picks them up."""
+        state = {"success": DONE, "failed": FAILED}.get(record["status"], PENDING)
+        self.finish(record["id"], state, outputs=record.get("outputs"), error=record.get("error"))
+
+    def counts(self) -> dict[str, int]:
+        rows = self._connect().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = {PENDING: 0, IN_FLIGHT: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,59 @@
+import os
+import threading
+from datetime import datetime
+from typing import Any, Optional
+
+SHARD_MODES = ("none", "date", "hash")
+
+
+class OutputLayout:
+    """
+    Where saved images go inside output_dir.
+
+    - `shard`: "none" keeps everything flat, "date" uses `date_format` subfolders
+      (2026/10/17/...), "hash" uses `hash_depth` two-hex-digit levels of the file's
+      SHA-256 (ab/cd/...), which keeps every folder small however large the archive.
+    - File names are `{prefix}_{timestamp}_{sha256[:12]}.{ext}`: unique by content,
+      so no free counter is probed for. Only the same bytes saved twice in one
+      second need the random suffix core.storage adds when a name is taken.
+    """
+    def __init__(self, shard: str = "none", date_format: str = "%Y/%m/%d", hash_depth: int = 2):
+        if shard not in SHARD_MODES:
+            raise ValueError(f"Unknown output shard mode '{shard}' (expected one of: {', '.join(SHARD_MODES)})")
+        self.shard = shard
+        self.date_format = date_format
+        self.hash_depth = max(0, min(hash_depth, 8))
+        self._lock = threading.Lock()
+        self._known_dirs: set[str] = set()
+
+    @classmethod
+    def from_settings(cls, config: Optional[dict[str, Any]]) -> "OutputLayout":
+        config = config or {}
+        return cls(
+            shard=config.get("shard", "none") or "none",
+            date_format=config.get("date_format", "%Y/%m/%d"),
+            hash_depth=int(config.get("hash_depth", 2))
+        )
+
+    def directory_for(self, output_dir: str, digest: str, now: datetime) -> str:
+        if self.shard == "date":
+            return os.path.join(output_dir, *now.strftime(self.date_format).split("/"))
+        if self.shard == "hash":
+            return os.path.join(output_dir, *(digest[i * 2:i * 2 + 2] for i in range(self.hash_depth)))
+        return output_dir
+
+    def _ensure_dir(self, directory: str):
+        # makedirs costs a stat per path level; each shard only needs it once per process
+        if directory in self._known_dirs:
+            return
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._known_dirs.add(directory)
+
+    def path_for(self, output_dir: str, prefix: str, ext: str, digest: str,
+                 now: Optional[datetime] = None) -> str:
+        """Where an image with this SHA-256 goes; its folder is created. core.storage writes it without overwriting."""
+        now = now or datetime.now()
+        directory = self.directory_for(output_dir, digest, now)
+        self._ensure_dir(directory)
+        return os.path.join(directory, f"{prefix}_{now.strftime('%Y%m%d_%H%M%S')}_{digest[:12]}.{ext}")
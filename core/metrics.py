@@ -0,0 +1,192 @@
+import bisect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, shared by every timing histogram
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _label_key(labels: dict[str, Any]) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """Cumulative-bucket histogram: enough for rates, averages and quantile estimates."""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate of the q-quantile, interpolated linearly inside the bucket that holds
+        it (like Prometheus' histogram_quantile). None when empty; observations above
+        the last bucket are reported as that bucket's bound.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.buckets[-1]
+
+
+def _copy_histogram(histogram: Histogram) -> Histogram:
+    copy = Histogram(histogram.buckets)
+    copy.counts = list(histogram.counts)
+    copy.count = histogram.count
+    copy.sum = histogram.sum
+    return copy
+
+
+class Metrics:
+    """
+    In-process counters and histograms for the generation hot path, plus compact
+    per-request events. Recording is a dict update under a lock, cheap enough to
+    call on every request; nothing is formatted unless an event sink is enabled.
+
+    Events go to `events_file` as JSON lines when set, otherwise to this logger at DEBUG.
+    Full API response dumps are opt-in: `debug_responses` dumps every response,
+    `response_sample_rate` a random fraction of them.
+    """
+    def __init__(self, events_file: Optional[str] = None, debug_responses: bool = False,
+                 response_sample_rate: float = 0.0, buckets=DEFAULT_BUCKETS):
+        self.events_file = events_file or None
+        self.debug_responses = debug_responses
+        self.response_sample_rate = response_sample_rate
+        self.buckets = tuple(buckets)
+        self.started = time.time()
+
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, Histogram]] = {}
+        self._windows: dict[str, deque] = {}
+        self._events_handle = None
+
+    @classmethod
+    def from_settings(cls, config: Optional[dict[str, Any]]) -> "Metrics":
+        config = config or {}
+        return cls(
+            events_file=config.get("events_file") or None,
+            debug_responses=bool(config.get("debug_responses", False)),
+            response_sample_rate=float(config.get("response_sample_rate", 0.0))
+        )
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def mark(self, name: str, value: float = 1, **labels):
+        """Increment a counter and also remember it in a one-minute window for per_minute()."""
+        self.inc(name, value, **labels)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.setdefault(name, deque())
+            window.append((now, value))
+            self._prune(window, now)
+
+    def per_minute(self, name: str) -> float:
+        """Total of mark(name) calls over the last 60 seconds."""
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(name)
+            if not window:
+                return 0.0
+            self._prune(window, now)
+            return float(sum(value for _, value in window))
+
+    def _prune(self, window: deque, now: float):
+        while window and now - window[0][0] > 60:
+            window.popleft()
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def event(self, kind: str, **fields):
+        """Record one compact structured event (no payloads, just numbers and identifiers)."""
+        if not self.events_file and not logger.isEnabledFor(logging.DEBUG):
+            return
+        record = {"ts": round(time.time(), 3), "event": kind, **fields}
+        line = json.dumps(record, separators=(",", ":"), default=str)
+        if not self.events_file:
+            logger.debug(line)
+            return
+        try:
+            with self._lock:
+                if self._events_handle is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.events_file)), exist_ok=True)
+                    self._events_handle = open(self.events_file, 'a', encoding='utf-8', buffering=1)
+                self._events_handle.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to write metrics event: {e}")
+
+    def should_dump_response(self) -> bool:
+        if self.debug_responses:
+            return True
+        return self.response_sample_rate > 0 and random.random() < self.response_sample_rate
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        """Copy of one histogram series, or None if nothing was observed."""
+        with self._lock:
+            histogram = self._histograms.get(name, {}).get(_label_key(labels))
+            return _copy_histogram(histogram) if histogram else None
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Copy of all series: {"counters": {name: {labels: value}}, "histograms": {name: {labels: Histogram}},
+        "per_minute": {name: value}}.
+        """
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {}
+            for name, series in self._histograms.items():
+                histograms[name] = {key: _copy_histogram(histogram) for key, histogram in series.items()}
+            windows = list(self._windows)
+        per_minute = {name: self.per_minute(name) for name in windows}
+        return {"counters": counters, "histograms": histograms, "per_minute": per_minute}
+
+    def close(self):
+        with self._lock:
+            if self._events_handle is not None:
+                self._events_handle.close()
+                self._events_handle = None
@@ -0,0 +1,188 @@
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+from .metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "nano_banana_"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HELP = {
+    "api_requests_total": "API calls by model and outcome",
+    "api_latency_seconds": "API call latency",
+    "api_images_total": "Images returned by the API",
+    "api_response_bytes_total": "Image bytes returned by the API",
+    "decode_seconds": "Time spent parsing API responses",
+    "queue_wait_seconds": "Time spent waiting for quota or a post-processing worker",
+    "encode_seconds": "Time spent encoding output files",
+    "save_seconds": "Time spent writing output files",
+    "fsync_seconds": "Time spent fsyncing a batch of written outputs",
+    "bytes_written_total": "Bytes written to output files",
+    "thumbnail_seconds": "Time spent writing preview thumbnails",
+    "dedup_seconds": "Time spent hashing and looking up images for duplicate detection",
+    "reference_uploads_total": "Reference images uploaded through the Files API",
+    "reference_upload_bytes_total": "Bytes of reference images uploaded",
+    "edit_turns_total": "Edit session turns completed",
+    "duplicates_total": "Near-duplicate images by action taken (flag, skip, hardlink)",
+    "notify_seconds": "Time spent sending notifications",
+    "generations_total": "Finished generations by model and outcome",
+    "retries_total": "Retried generation attempts by model and error kind",
+    "blocked_total": "Generations blocked by the safety filter",
+    "images_generated_total": "Images delivered by finished generations",
+    "key_requests_total": "API calls by key id and outcome (with more than one API key)",
+    "key_ejections_total": "Times a key was taken out of rotation after a 429/401/403",
+    "fallbacks_total": "Generations moved to a fallback model after a retryable error",
+    "hedged_requests_total": "Second requests sent because the first was slower than the hedge delay",
+    "hedge_wins_total": "Hedged generations answered first by the hedge model",
+    "coalesced_requests_total": "Server requests answered by an identical in-flight request",
+}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(key: tuple, extra: Optional[tuple] = None) -> str:
+    pairs = list(key) + list(extra or ())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render_prometheus(metrics: Metrics) -> str:
+    """Render every series in the Prometheus text exposition format."""
+    snapshot = metrics.snapshot()
+    lines = []
+
+    def header(name: str, kind: str, base: str):
+        if base in HELP:
+            lines.append(f"# HELP {name} {HELP[base]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for base, series in sorted(snapshot["counters"].items()):
+        name = PREFIX + base
+        header(name, "counter", base)
+        for key, value in sorted(series.items()):
+            lines.append(f"{name}{_labels(key)} {_number(value)}")
+
+    for base, series in sorted(snapshot["histograms"].items()):
+        name = PREFIX + base
+        header(name, "histogram", base)
+        for key, histogram in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(key, (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(key)} {histogram.sum!r}")
+            lines.append(f"{name}_count{_labels(key)} {histogram.count}")
+
+    for base, value in sorted(snapshot["per_minute"].items()):
+        name = PREFIX + base.removesuffix("_total") + "_per_minute"
+        lines.append(f"# HELP {name} Rolling total over the last 60 seconds")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_number(value)}")
+
+    name = PREFIX + "uptime_seconds"
+    lines.append(f"# TYPE {name} gauge")
+    lines.append(f"{name} {time.time() - metrics.started:.1f}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves /metrics for Prometheus from a daemon thread."""
+    def __init__(self, metrics: Metrics, port: int, host: str = "127.0.0.1"):
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split("?")[0] not in ("/metrics", "/"):
+                    handler.send_error(404)
+                    return
+                body = render_prometheus(metrics).encode("utf-8")
+                handler.send_response(200)
+                handler.send_header("Content-Type", CONTENT_TYPE)
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                # Scrapes every few seconds would otherwise flood the log
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> "MetricsServer":
+        self._thread.start()
+        logger.info(f"Serving metrics on http://{self._server.server_address[0]}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class TextfileExporter:
+    """
+    Periodically writes the metrics to a .prom file for node_exporter's textfile
+    collector. The file is replaced atomically so a scrape never sees half of it.
+    """
+    def __init__(self, metrics: Metrics, path: str, interval: float = 15):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="metrics-textfile", daemon=True)
+
+    def write(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(render_prometheus(self.metrics))
+        os.replace(tmp_path, self.path)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                logger.warning(f"Failed to write metrics textfile: {e}")
+
+    def start(self) -> "TextfileExporter":
+        self.write()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        # Final values, so short runs are recorded too
+        self.write()
+
+
+def start_exporters(metrics: Metrics, config: Optional[dict[str, Any]]) -> list:
+    """Start the HTTP endpoint and/or textfile writer configured in the "metrics" settings."""
+    config = config or {}
+    exporters = []
+    if config.get("port"):
+        exporters.append(MetricsServer(metrics, int(config["port"]), config.get("host") or "127.0.0.1").start())
+    if config.get("textfile"):
+        exporters.append(TextfileExporter(metrics, config["textfile"], float(config.get("textfile_interval", 15))).start())
+    return exporters
@@ -1,18 +1,151 @@
-import smtplib
 import logging
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.image import MIMEImage
+import threading
+import time
+from contextlib import contextmanager
 from email.utils import formatdate, make_msgid
-from typing import Optional, List
+from html import escape
+from typing import TYPE_CHECKING, Optional, List
 import os
 
+from .thumbnails import ThumbnailStore
+
+# smtplib and email.mime are only imported once an email is actually sent
+if TYPE_CHECKING:
+    import smtplib
+
 logger = logging.getLogger(__name__)
 
+class SMTPConnectionPool:
+    """
+    Keeps up to `max_size` authenticated SMTP connections open and reuses them,
+    so a batch run pays the connect/STARTTLS/login handshake once instead of per email.
+    Connections are (re)opened lazily: idle ones are checked with NOOP before reuse
+    and dropped if the server has closed them.
+    """
+    def __init__(self, server: str, port: int, sender_email: str, sender_password: Optional[str],
+                 use_starttls: bool = True, max_size: int = 2, idle_check_seconds: float = 30, timeout: float = 30):
+        self.server = server
+        self.port = port
+        self.sender_email = sender_email
+        self.sender_password = sender_password
+        self.use_starttls = use_starttls
+        self.max_size = max(1, max_size)
+        self.idle_check_seconds = idle_check_seconds
+        self.timeout = timeout
+
+        self._idle: list[tuple["smtplib.SMTP", float]] = []  # (connection, last used)
+        self._open = 0
+        self._cond = threading.Condition()
+
+    def _connect(self) -> "smtplib.SMTP":
+        import smtplib
+        logger.info(f"Connecting to SMTP server {self.server}:{self.port}...")
+        # Use SMTP_SSL if port is 465, otherwise use SMTP + starttls
+        if self.port == 465:
+            server = smtplib.SMTP_SSL(self.server, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+            if self.use_starttls:
+                server.starttls()
+
+        if self.sender_password:
+            server.login(self.sender_email, self.sender_password)
+        return server
+
+    def _is_alive(self, conn: "smtplib.SMTP") -> bool:
+        import smtplib
+        try:
+            return conn.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def _discard(self, conn: "smtplib.SMTP"):
+        try:
+            conn.quit()
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _checkout(self) -> "smtplib.SMTP":
+        with self._cond:
+            while not self._idle and self._open >= self.max_size:
+                self._cond.wait()
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                conn, last_used = None, 0.0
+                self._open += 1
+
+        try:
+            if conn is not None and time.monotonic() - last_used > self.idle_check_seconds and not self._is_alive(conn):
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+            return conn
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _release_slot(self):
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    def _checkin(self, conn: "smtplib.SMTP"):
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self._checkout()
+        try:
+            yield conn
+        except Exception:
+            self._discard(conn)
+            self._release_slot()
+            raise
+        else:
+            self._checkin(conn)
+
+    def send(self, msg):
+        import smtplib
+        # One retry on a fresh connection if a pooled one was dropped mid-send
+        for attempt in (1, 2):
+            try:
+                with self.connection() as conn:
+                    conn.send_message(msg)
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                if attempt == 2:
+                    raise
+                logger.info("SMTP connection was closed by the server, reconnecting...")
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn, _ in idle:
+            self._discard(conn)
+
+
 class EmailService:
     def __init__(self, settings_manager):
         self.settings = settings_manager
-        
+        self._pool: Optional[SMTPConnectionPool] = None
+        self._pool_key = None
+        self._pool_lock = threading.Lock()
+
+        # Digest mode: successes are buffered and sent as one email
+        self._digest: list[tuple[List[str], str]] = []
+        self._digest_lock = threading.Lock()
+        self._digest_timer: Optional[threading.Timer] = None
+
     def _get_config(self):
         return self.settings.get("email", {})
 
@@ -20,6 +153,19 @@ class EmailService:
         config = self._get_config()
         return config.get("enabled", False)
 
+    def uses_thumbnails(self) -> bool:
+        """Whether success emails will include preview thumbnails (attached or in a digest)."""
+        if not self.is_enabled():
+            return False
+        attach = self._get_config().get("attach", "thumbnail")
+        return attach == "thumbnail" or bool(self._digest_config().get("enabled", False))
+
+    def _digest_config(self) -> dict:
+        return self._get_config().get("digest", {}) or {}
+
+    def _thumbnails(self) -> ThumbnailStore:
+        return ThumbnailStore.from_settings(self.settings.get("thumbnails"))
+
     def _load_template(self, template_name: str) -> str:
         """
         Load HTML template from templates directory.
@@ -30,25 +176,29 @@ class EmailService:
             # or relative to core/notifications.py -> ../../templates
             base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
             template_path = os.path.join(base_dir, "templates", template_name)
-            
+
             if os.path.exists(template_path):
                 with open(template_path, 'r', encoding='utf-8') as f:
                     return f.read()
         except Exception as e:
             logger.warning(f"Failed to load email template {template_name}: {e}")
-        
+
         return ""
 
     def send_success(self, image_paths: List[str], prompt: str):
         if not self.is_enabled():
             return
-            
+
+        if self._digest_config().get("enabled", False):
+            self._add_to_digest(image_paths, prompt)
+            return
+
         subject = "Nano Banana Studio - Generation Success"
-        
+
         # Try to load HTML template
         html_template = self._load_template("email_success.html")
         html_body = None
-        
+
         if html_template:
             try:
                 # Use simple replacement instead of .format() to avoid conflict with CSS braces
@@ -57,19 +207,25 @@ class EmailService:
                 logger.error(f"Failed to format success email template: {e}")
 
         plain_body = f"Your image generation was successful.\n\nPrompt: {prompt}"
-        
-        self._send_email(subject, plain_body, html_body, attachments=image_paths)
+
+        attachments = image_paths
+        if self._get_config().get("attach", "thumbnail") == "thumbnail":
+            # Cached previews, usually written at save time; fall back to the original if one can't be made
+            thumbnails = self._thumbnails()
+            attachments = [thumbnails.get(path) or path for path in image_paths]
+
+        self._send_email(subject, plain_body, html_body, attachments=attachments)
 
     def send_failure(self, error_msg: str, prompt: str):
         if not self.is_enabled():
             return
 
         subject = "Nano Banana Studio - Generation Failed"
-        
+
         # Try to load HTML template
         html_template = self._load_template("email_failure.html")
         html_body = None
-        
+
         if html_template:
             try:
                 # Use simple replacement instead of .format() to avoid conflict with CSS braces
@@ -78,28 +234,122 @@ class EmailService:
                 logger.error(f"Failed to format failure email template: {e}")
 
         plain_body = f"Your image generation failed.\n\nPrompt: {prompt}\n\nError:\n{error_msg}"
-        
+
         self._send_email(subject, plain_body, html_body)
 
-    def _send_email(self, subject: str, plain_body: str, html_body: Optional[str] = None, attachments: Optional[List[str]] = None):
+    def _add_to_digest(self, image_paths: List[str], prompt: str):
+        config = self._digest_config()
+        max_items = int(config.get("max_items", 10))
+        window = float(config.get("window_seconds", 600))
+
+        with self._digest_lock:
+            self._digest.append((list(image_paths), prompt))
+            full = len(self._digest) >= max_items
+            if not full and self._digest_timer is None:
+                self._digest_timer = threading.Timer(window, self.flush_digest)
+                self._digest_timer.daemon = True
+                self._digest_timer.start()
+
+        if full:
+            self.flush_digest()
+
+    def flush_digest(self):
+        """Send every buffered success as a single email with thumbnails."""
+        with self._digest_lock:
+            items, self._digest = self._digest, []
+            if self._digest_timer is not None:
+                self._digest_timer.cancel()
+                self._digest_timer = None
+
+        if not items:
+            return
+
+        thumbnails = self._thumbnails()
+        subject = f"Nano Banana Studio - {len(items)} Generations Completed"
+
+        plain_lines = [f"{len(items)} image generations completed successfully.", ""]
+        html_items = []
+        inline_images = []
+        for prompt_index, (paths, prompt) in enumerate(items, 1):
+            plain_lines.append(f"{prompt_index}. {prompt}")
+            thumbs_html = []
+            for path in paths:
+                plain_lines.append(f"   {path}")
+                thumbnail = thumbnails.read_bytes(path)
+                if thumbnail:
+                    cid = make_msgid()[1:-1]
+                    thumb_name = os.path.splitext(os.path.basename(path))[0] + ".jpg"
+                    inline_images.append((cid, thumbnail, thumb_name))
+                    thumbs_html.append(f'<img class="thumb" src="cid:{cid}" alt="{escape(os.path.basename(path))}">')
+            html_items.append(
+                f'<div class="item"><div class="prompt-box">"{escape(prompt)}"</div>'
+                f'{"".join(thumbs_html)}'
+                f'<div class="paths">{"<br>".join(escape(p) for p in paths)}</div></div>'
+            )
+
+        html_body = None
+        html_template = self._load_template("email_digest.html")
+        if html_template:
+            html_body = html_template.replace("{count}", str(len(items))).replace("{items}", "\n".join(html_items))
+
+        self._send_email(subject, "\n".join(plain_lines), html_body, inline_images=inline_images)
+
+    def _get_pool(self, config) -> SMTPConnectionPool:
+        smtp_port = config.get("smtp_port")
+        # Ensure port is int
+        port = int(smtp_port) if smtp_port else 587
+        key = (config.get("smtp_server"), port, config.get("sender_email"), config.get("sender_password"),
+               config.get("starttls", True), int(config.get("pool_size", 2)))
+
+        with self._pool_lock:
+            # Settings can change at runtime (GUI), so rebuild the pool when they do
+            if self._pool is None or self._pool_key != key:
+                if self._pool is not None:
+                    self._pool.close()
+                self._pool = SMTPConnectionPool(
+                    server=key[0], port=port, sender_email=key[2], sender_password=key[3],
+                    use_starttls=key[4], max_size=key[5]
+                )
+                self._pool_key = key
+            return self._pool
+
+    def close(self):
+        """Send any pending digest and close pooled SMTP connections."""
+        self.flush_digest()
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
+                self._pool_key = None
+
+    def _send_email(self, subject: str, plain_body: str, html_body: Optional[str] = None,
+                    attachments: Optional[List[str]] = None,
+                    inline_images: Optional[List[tuple[str, bytes, str]]] = None):
         config = self._get_config()
-        
+
         smtp_server = config.get("smtp_server")
-        smtp_port = config.get("smtp_port")
         sender_email = config.get("sender_email")
-        sender_password = config.get("sender_password")
         receiver_email = config.get("receiver_email")
 
         if not all([smtp_server, sender_email, receiver_email]):
             logger.warning("Email configuration incomplete. Skipping email notification.")
             return
 
-        # Use 'mixed' as the outer container if we have attachments
+        from email.mime.image import MIMEImage
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+
+        # Use 'mixed' as the outer container if we have attachments,
+        # 'related' if images are referenced inline from the HTML body
         if attachments:
             msg = MIMEMultipart('mixed')
             # Create the body container
             body_container = MIMEMultipart('alternative')
             msg.attach(body_container)
+        elif inline_images:
+            msg = MIMEMultipart('related')
+            body_container = MIMEMultipart('alternative')
+            msg.attach(body_container)
         else:
             msg = MIMEMultipart('alternative')
             body_container = msg
@@ -112,7 +362,7 @@ class EmailService:
 
         # Attach plain text version to the body container
         body_container.attach(MIMEText(plain_body, 'plain'))
-        
+
         # Attach HTML version if available to the body container
         if html_body:
             body_container.attach(MIMEText(html_body, 'html'))
@@ -130,23 +380,15 @@ class EmailService:
                     except Exception as e:
                         logger.error(f"Failed to attach image {file_path}: {e}")
 
-        try:
-            # Ensure port is int
-            port = int(smtp_port) if smtp_port else 587
-            
-            logger.info(f"Connecting to SMTP server {smtp_server}:{port}...")
-            # Use SMTP_SSL if port is 465, otherwise use SMTP + starttls
-            if port == 465:
-                server = smtplib.SMTP_SSL(smtp_server, port, timeout=30)
-            else:
-                server = smtplib.SMTP(smtp_server, port, timeout=30)
-                server.starttls()
+        if inline_images:
+            for cid, data, filename in inline_images:
+                image = MIMEImage(data, _subtype="jpeg")
+                image.add_header('Content-ID', f"<{cid}>")
+                image.add_header('Content-Disposition', 'inline', filename=filename)
+                msg.attach(image)
 
-            if sender_password:
-                server.login(sender_email, sender_password)
-            
-            server.send_message(msg)
-            server.quit()
+        try:
+            self._get_pool(config).send(msg)
             logger.info(f"Email sent successfully to {receiver_email}")
         except Exception as e:
             logger.error(f"Failed to send email: {e}")
@@ -0,0 +1,127 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+from api.models import GenerationParameters
+from core.generator import GeneratorCore
+from core.notifications import EmailService
+
+logger = logging.getLogger(__name__)
+
+_SHUTDOWN = object()
+
+
+def save_and_notify(core: GeneratorCore, email_service: EmailService, images, params: GenerationParameters,
+                    model: Optional[str] = None, generation_seconds: Optional[float] = None) -> list[str]:
+    """
+    Save every image, write its preview thumbnail if the GUI or the email will use it, and send the
+    success email. Returns the saved paths. `model` and `generation_seconds` are recorded in the catalog.
+    """
+    thumbnails = core.thumbnails.eager or email_service.uses_thumbnails()
+    saved_paths = []
+    for img in images:
+        path = core.save_image(img, params=params, model=model, generation_seconds=generation_seconds)
+        saved_paths.append(path)
+        logger.info(f"Image saved to: {path}")
+        if thumbnails:
+            # Made here, while the image is still in memory, so GUI and email never reload the full file
+            with core.metrics.timer("thumbnail_seconds"):
+                core.thumbnails.create(path, img)
+
+    with core.metrics.timer("notify_seconds"):
+        email_service.send_success(saved_paths, params.prompt)
+    return saved_paths
+
+
+class PostProcessor:
+    """
+    Background stage for everything that happens after the API returns:
+    saving, format conversion and notifications run on worker threads so the
+    generation loop only ever waits on the API.
+
+    The queue is bounded: submit() blocks once `queue_size` tasks are pending,
+    which throttles generation instead of buffering unbounded images in memory.
+    shutdown() (or leaving the `with` block) drains the queue before returning.
+    """
+    def __init__(self, core: GeneratorCore, email_service: Optional[EmailService] = None,
+                 workers: int = 2, queue_size: int = 16):
+        self.core = core
+        self.email_service = email_service or EmailService(core.settings)
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self._threads = []
+        self._closed = False
+        for i in range(max(1, workers)):
+            thread = threading.Thread(target=self._worker, name=f"postprocess-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    @classmethod
+    def from_settings(cls, core: GeneratorCore, email_service: Optional[EmailService] = None) -> "PostProcessor":
+        config = core.settings.get("pipeline", {}) or {}
+        return cls(
+            core,
+            email_service=email_service,
+            workers=int(config.get("workers", 2)),
+            queue_size=int(config.get("queue_size", 16))
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+
+    def _worker(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is _SHUTDOWN:
+                    return
+                future, fn, args, queued = task
+                self.core.metrics.observe("queue_wait_seconds", time.perf_counter() - queued, stage="postprocess")
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as e:
+                    logger.error(f"Post-processing task failed: {e}", exc_info=True)
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def _submit(self, fn: Callable[..., Any], *args) -> Future:
+        if self._closed:
+            raise RuntimeError("PostProcessor has been shut down")
+        future = Future()
+        # Blocks while the queue is full: this is the backpressure on the generation loop
+        self._queue.put((future, fn, args, time.perf_counter()))
+        return future
+
+    def submit(self, images, params: GenerationParameters, model: Optional[str] = None,
+               generation_seconds: Optional[float] = None) -> Future:
+        """Queue images for saving and success notification. The future resolves to the saved paths."""
+        return self._submit(save_and_notify, self.core, self.email_service, images, params, model, generation_seconds)
+
+    def submit_failure(self, error_msg: str, params: GenerationParameters) -> Future:
+        return self._submit(self.email_service.send_failure, error_msg, params.prompt)
+
+    def flush(self):
+        """Block until every task submitted so far has finished, and fsync its files under the "batch" policy."""
+        self._queue.join()
+        with self.core.metrics.timer("fsync_seconds"):
+            self.core.storage.sync()
+
+    def shutdown(self):
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(_SHUTDOWN)
+        for thread in self._threads:
+            thread.join()
+        # Sends a pending digest and closes pooled SMTP connections
+        self.email_service.close()
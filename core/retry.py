@@ -0,0 +1,40 @@
+import random
+from dataclasses import dataclass
+from typing import Optional
+
+from api.errors import PERMANENT_ERRORS, ErrorKind, classify_error, retry_after
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Decides whether a failed generation is worth retrying and how long to wait.
+
+    Delays grow exponentially from `base_interval` by `multiplier` per attempt,
+    capped at `max_interval` (never below `base_interval`), and are shortened by a
+    random fraction of up to `jitter` so many workers don't retry in lockstep.
+    A server `Retry-After` hint takes precedence when it is longer.
+    """
+    base_interval: float = 5
+    max_interval: float = 600
+    multiplier: float = 2.0
+    jitter: float = 0.5
+
+    def should_retry(self, kind: ErrorKind) -> bool:
+        return kind not in PERMANENT_ERRORS
+
+    def next_delay(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """Delay before retry number `attempt` (1-based)."""
+        cap = max(self.max_interval, self.base_interval)
+        delay = min(cap, self.base_interval * (self.multiplier ** max(0, attempt - 1)))
+        delay *= 1 - random.uniform(0, min(max(self.jitter, 0), 1))
+
+        if error is not None:
+            hint = retry_after(error)
+            if hint is not None and hint > delay:
+                # Small spread so workers sharing a quota don't all wake at once
+                delay = hint + random.uniform(0, min(1.0, hint * 0.1))
+        return delay
+
+    def classify(self, error: BaseException) -> ErrorKind:
+        return classify_error(error)
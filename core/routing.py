@@ -0,0 +1,54 @@
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from api.models import GenerationParameters
+from core.metrics import Metrics
+
+
+@dataclass
+class RoutingPolicy:
+    """
+    Where a generation may be sent besides its own model.
+
+    `fallbacks` maps a model (or "default") to the models to try, in order, when it
+    fails with a retryable error such as 503 overload or 429 quota; the next model is
+    tried right away instead of waiting out a retry delay. A request's own
+    `fallback_models` take precedence over this mapping.
+
+    With `hedge`, a request still unanswered after `hedge_delay()` (the model's
+    observed `hedge_quantile` latency) is also sent to its first fallback model and
+    the first successful answer is used. Until `hedge_min_samples` latencies have been
+    seen, `hedge_default_delay` is used. Only the async path (GenerationRunner.arun)
+    hedges, because only there can the slower request be cancelled.
+    """
+    fallbacks: dict[str, list[str]] = field(default_factory=dict)
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+    hedge_min_delay: float = 2.0
+    hedge_default_delay: float = 30.0
+    hedge_min_samples: int = 20
+
+    @classmethod
+    def from_settings(cls, config: Optional[dict[str, Any]]) -> "RoutingPolicy":
+        config = config or {}
+        return cls(
+            fallbacks=dict(config.get("fallback_models") or {}),
+            hedge=bool(config.get("hedge", False)),
+            hedge_quantile=float(config.get("hedge_quantile", 0.95)),
+            hedge_min_delay=float(config.get("hedge_min_delay", 2.0)),
+            hedge_default_delay=float(config.get("hedge_default_delay", 30.0)),
+            hedge_min_samples=int(config.get("hedge_min_samples", 20))
+        )
+
+    def models_for(self, params: GenerationParameters) -> list[str]:
+        """The request's model followed by its fallbacks, without duplicates."""
+        fallbacks = params.fallback_models
+        if fallbacks is None:
+            fallbacks = self.fallbacks.get(params.model, self.fallbacks.get("default", []))
+        return list(dict.fromkeys([params.model, *fallbacks]))
+
+    def hedge_delay(self, metrics: Metrics, model: str) -> float:
+        histogram = metrics.histogram("api_latency_seconds", model=model)
+        if histogram is None or histogram.count < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, histogram.quantile(self.hedge_quantile))
@@ -1,9 +1,16 @@
+import asyncio
 import time
 import logging
+from concurrent.futures import Future
 from typing import Callable, Optional
+from api.cancellation import CancellationToken
+from api.errors import ErrorKind
 from api.models import GenerationParameters
 from core.generator import GeneratorCore
 from core.notifications import EmailService
+from core.pipeline import PostProcessor, save_and_notify
+from core.retry import RetryPolicy
+from core.routing import RoutingPolicy
 from core.settings import SettingsManager
 
 logger = logging.getLogger(__name__)
@@ -11,25 +18,60 @@ logger = logging.getLogger(__name__)
 class GenerationRunner:
     """
     Shared runner for both GUI and CLI to handle generation workflow:
-    1. Retry logic
-    2. Notifications
-    3. Status updates
+    1. Retry logic (exponential backoff, fail fast on permanent errors)
+    2. Fallback models, and hedged requests on the async path (see core.routing.RoutingPolicy)
+    3. Notifications
+    4. Status updates
+
+    run() drives the blocking API path; arun() drives the asyncio path and can be
+    awaited concurrently with many other runners on one event loop.
+
+    With a `pipeline`, saving and notifications are handed to its worker threads and
+    run() returns as soon as the API answers; `save_future` resolves to the saved paths.
+
+    A `cancel` token stops the run from any thread and run()/arun() return None
+    right away. arun() aborts the in-flight request, freeing its key slot; run()
+    can only abandon it, so it keeps running (and holding the slot) until the API
+    answers or its deadline (if any) passes. Prefer arun() wherever a stop is expected.
     """
     def __init__(self, core: GeneratorCore, params: GenerationParameters,
                  retry_enabled: bool = False, retry_interval: int = 5, max_retries: int = 0,
                  status_callback: Optional[Callable[[str], None]] = None,
-                 stop_check_callback: Optional[Callable[[], bool]] = None):
+                 stop_check_callback: Optional[Callable[[], bool]] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 use_cache: bool = True,
+                 pipeline: Optional[PostProcessor] = None,
+                 email_service: Optional[EmailService] = None,
+                 routing: Optional[RoutingPolicy] = None,
+                 cancel: Optional[CancellationToken] = None):
         self.core = core
         self.params = params
         self.retry_enabled = retry_enabled
         self.retry_interval = retry_interval
         self.max_retries = max_retries
+        self.retry_policy = retry_policy or RetryPolicy(base_interval=retry_interval)
         self.status_callback = status_callback
         self.stop_check_callback = stop_check_callback
-        
-        self.email_service = EmailService(core.settings)
+        self.cancel = cancel
+        self.use_cache = use_cache
+        self.pipeline = pipeline
+        self.saved_paths: list[str] = []
+        self.save_future: Optional[Future] = None
+        self.routing = routing or RoutingPolicy.from_settings(core.settings.get("routing"))
+        self.models = self.routing.models_for(params)
+        # The model whose answer was used; differs from params.model after a fallback or hedge
+        self.model_used: Optional[str] = None
+        self._started = time.monotonic()
+
+        if email_service is None and pipeline is not None:
+            email_service = pipeline.email_service
+        # A service created here is only used for this run, so its SMTP connection is closed afterwards
+        self._owns_email_service = email_service is None
+        self.email_service = email_service or EmailService(core.settings)
 
     def _should_stop(self) -> bool:
+        if self.cancel is not None and self.cancel.cancelled:
+            return True
         if self.stop_check_callback:
             return self.stop_check_callback()
         return False
@@ -40,64 +82,272 @@ class GenerationRunner:
         else:
             logger.info(msg)
 
+    def _collect_paths(self, future: Future):
+        if not future.exception():
+            self.saved_paths = future.result()
+
+    def _params_for(self, model: str) -> GenerationParameters:
+        if model == self.params.model:
+            return self.params
+        return self.params.model_copy(update={"model": model})
+
+    def _hedge_for(self, params: GenerationParameters) -> Optional[tuple[GenerationParameters, float]]:
+        """(hedge request, delay before sending it), or None when not hedging."""
+        if not self.routing.hedge:
+            return None
+        index = self.models.index(params.model)
+        if index + 1 >= len(self.models):
+            return None
+        return self._params_for(self.models[index + 1]), self.routing.hedge_delay(self.core.metrics, params.model)
+
+    def _can_fall_back(self, e: Exception, index: int) -> bool:
+        return index + 1 < len(self.models) and self.retry_policy.should_retry(self.retry_policy.classify(e))
+
+    def _fall_back(self, e: Exception, index: int):
+        model, fallback = self.models[index], self.models[index + 1]
+        logger.warning(f"{model} failed ({self.retry_policy.classify(e).value}), falling back to {fallback}")
+        self._update_status(f"{model} unavailable, trying {fallback}...")
+        self.core.metrics.inc("fallbacks_total", model=model, to=fallback)
+
+    def _pick(self, winner: GenerationParameters, params: GenerationParameters):
+        if winner is not params:
+            logger.info(f"Hedge request to {winner.model} answered before {params.model}")
+            self.core.metrics.inc("hedge_wins_total", model=winner.model)
+
+    def _generate(self, params: GenerationParameters):
+        """
+        Returns (images, params of the request that produced them).
+        Never hedges: a blocking call can't be cancelled, so the slower request would
+        keep running, billed and holding a key slot, long after it had lost.
+        """
+        return self.core.generate(params, use_cache=self.use_cache, cancel=self.cancel), params
+
+    async def _agenerate(self, params: GenerationParameters):
+        """Async _generate(), with hedging (see RoutingPolicy): the slower of two hedged requests is cancelled."""
+        hedge = self._hedge_for(params)
+        if hedge is None:
+            return await self.core.agenerate(params, use_cache=self.use_cache, cancel=self.cancel), params
+
+        hedge_params, delay = hedge
+        primary = asyncio.ensure_future(self.core.agenerate(params, use_cache=self.use_cache, cancel=self.cancel))
+        requests = {primary: params}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result(), params
+
+            logger.info(f"{params.model} has not answered in {delay:.1f}s, hedging with {hedge_params.model}")
+            self.core.metrics.inc("hedged_requests_total", model=params.model)
+            secondary = asyncio.ensure_future(
+                self.core.agenerate(hedge_params, use_cache=self.use_cache, cancel=self.cancel)
+            )
+            requests[secondary] = hedge_params
+            pending = set(requests)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._pick(requests[task], params)
+                        return task.result(), requests[task]
+            raise primary.exception()
+        finally:
+            for task in requests:
+                if not task.done():
+                    task.cancel()
+
+    def _on_success(self, images):
+        metrics = self.core.metrics
+        metrics.inc("generations_total", model=self.model_used, outcome="success")
+        metrics.mark("images_generated_total", len(images))
+        # Time from the start of the run, retries and fallbacks included; recorded in the catalog
+        elapsed = time.monotonic() - self._started
+
+        if self.pipeline:
+            self.save_future = self.pipeline.submit(images, self.params, self.model_used, elapsed)
+            self.save_future.add_done_callback(self._collect_paths)
+            return
+
+        # Save images and send Success Email
+        self.saved_paths = save_and_notify(self.core, self.email_service, images, self.params,
+                                           self.model_used, elapsed)
+        # Without a pipeline each run is its own batch for the "batch" fsync policy
+        with self.core.metrics.timer("fsync_seconds"):
+            self.core.storage.sync()
+
+    def _notify_failure(self, error_msg: str):
+        if self.pipeline:
+            self.pipeline.submit_failure(error_msg, self.params)
+        else:
+            self.email_service.send_failure(error_msg, self.params.prompt)
+
+    def _on_failure(self, e: Exception, retry_count: int, model: str) -> float:
+        """
+        Raise if the error is final, otherwise return how long to wait before retrying.
+        `model` is the model of the attempt that failed, which metrics are labelled with.
+        """
+        kind = self.retry_policy.classify(e)
+        # Passed explicitly: the async path calls this on a worker thread, outside the except block
+        logger.error(f"Error during generation ({kind.value})", exc_info=e)
+        error_msg = str(e)
+
+        # Send Failure Email immediately on first failure?
+        # Or wait until all retries failed?
+        # Usually better to wait until final failure, but user might want to know about delays.
+        # Let's send only on final failure to avoid spamming.
+
+        # Check retry condition
+        # Safety blocks and invalid requests fail the same way every time, so don't spend calls on them
+        metrics = self.core.metrics
+        if kind == ErrorKind.SAFETY:
+            metrics.inc("blocked_total", model=model)
+        if (not self.retry_enabled
+                or not self.retry_policy.should_retry(kind)
+                or (self.max_retries > 0 and retry_count >= self.max_retries)):
+            metrics.inc("generations_total", model=model, outcome=kind.value)
+            self._notify_failure(error_msg)
+            raise e
+
+        metrics.inc("retries_total", model=model, kind=kind.value)
+        return self.retry_policy.next_delay(retry_count + 1, e)
+
+    def _on_cancelled(self, model: str):
+        """A stop request or time budget ended the run (during an attempt on `model`); not a failure, so nothing is notified."""
+        reason = self.cancel.reason if self.cancel is not None and self.cancel.cancelled else "Stopped"
+        logger.info(f"Generation cancelled: {reason}")
+        self.core.metrics.inc("generations_total", model=model, outcome="cancelled")
+
+    def _sleep(self, seconds: float):
+        if self.cancel is not None:
+            self.cancel.wait(seconds)
+        else:
+            time.sleep(seconds)
+
+    def _retry_status(self, error_msg: str, remaining: int, retry_count: int) -> str:
+        return f"Error: {error_msg.splitlines()[0]}. Retrying in {remaining}s... (Attempt {retry_count})"
+
+    def _release_email_service(self):
+        if self._owns_email_service:
+            self.email_service.close()
+
     def run(self):
+        try:
+            return self._run()
+        finally:
+            self._release_email_service()
+
+    async def arun(self):
+        try:
+            return await self._arun()
+        finally:
+            await asyncio.to_thread(self._release_email_service)
+
+    def _run(self):
+        self._started = time.monotonic()
         retry_count = 0
-        
+        index = 0
+
         while True:
             try:
-                if retry_count > 0:
+                if retry_count > 0 and index == 0:
                     self._update_status(f"Retry attempt {retry_count} starting...")
-                
-                logger.info(f"Starting generation with params: {self.params}")
-                images = self.core.generate(self.params)
-                
+
+                params = self._params_for(self.models[index])
+                logger.info(f"Starting generation with params: {params}")
+                images, used = self._generate(params)
+
                 if self._should_stop():
                     return
 
-                # Save images
-                saved_paths = []
-                for img in images:
-                    path = self.core.save_image(img)
-                    saved_paths.append(path)
-                    logger.info(f"Image saved to: {path}")
-                
-                # Send Success Email
-                self.email_service.send_success(saved_paths, self.params.prompt)
-                
+                self.model_used = used.model
+                self._on_success(images)
                 return images
 
             except Exception as e:
-                logger.error("Error during generation", exc_info=True)
+                if self._should_stop():
+                    self._on_cancelled(self.models[index])
+                    return
+                if self._can_fall_back(e, index) and not self._should_stop():
+                    self._fall_back(e, index)
+                    index += 1
+                    continue
+                model, index = self.models[index], 0
+                delay = self._on_failure(e, retry_count, model)
                 error_msg = str(e)
 
-                # Send Failure Email immediately on first failure? 
-                # Or wait until all retries failed?
-                # Usually better to wait until final failure, but user might want to know about delays.
-                # Let's send only on final failure to avoid spamming.
-                
-                # Check retry condition
-                if not self.retry_enabled or (self.max_retries > 0 and retry_count >= self.max_retries):
-                    self.email_service.send_failure(error_msg, self.params.prompt)
-                    raise e
-                
                 if self._should_stop():
                     return
 
                 # Prepare for retry
                 retry_count += 1
-                
+
                 # Wait loop with interrupt check
                 wait_time = 0
                 step = 0.5
-                while wait_time < self.retry_interval:
+                while wait_time < delay:
                     if self._should_stop():
                         return
-                    
-                    remaining = int(self.retry_interval - wait_time) + 1
-                    self._update_status(f"Error: {error_msg.splitlines()[0]}. Retrying in {remaining}s... (Attempt {retry_count})")
-                    
-                    time.sleep(step)
+
+                    remaining = int(delay - wait_time) + 1
+                    self._update_status(self._retry_status(error_msg, remaining, retry_count))
+
+                    self._sleep(step)
+                    wait_time += step
+
+                if self._should_stop():
+                    return
+
+    async def _arun(self):
+        self._started = time.monotonic()
+        retry_count = 0
+        index = 0
+
+        while True:
+            try:
+                if retry_count > 0 and index == 0:
+                    self._update_status(f"Retry attempt {retry_count} starting...")
+
+                params = self._params_for(self.models[index])
+                logger.info(f"Starting async generation with params: {params}")
+                images, used = await self._agenerate(params)
+
+                if self._should_stop():
+                    return
+
+                self.model_used = used.model
+                # Disk and SMTP I/O (or a full pipeline queue) block, keep them off the event loop
+                await asyncio.to_thread(self._on_success, images)
+                return images
+
+            except Exception as e:
+                if self._should_stop():
+                    self._on_cancelled(self.models[index])
+                    return
+                if self._can_fall_back(e, index) and not self._should_stop():
+                    self._fall_back(e, index)
+                    index += 1
+                    continue
+                model, index = self.models[index], 0
+                # Off the loop because a final failure may send its email synchronously
+                delay = await asyncio.to_thread(self._on_failure, e, retry_count, model)
+                error_msg = str(e)
+
+                if self._should_stop():
+                    return
+
+                retry_count += 1
+
+                wait_time = 0
+                step = 0.5
+                while wait_time < delay:
+                    if self._should_stop():
+                        return
+
+                    remaining = int(delay - wait_time) + 1
+                    self._update_status(self._retry_status(error_msg, remaining, retry_count))
+
+                    await asyncio.sleep(step)
                     wait_time += step
-                
+
                 if self._should_stop():
                     return
+
@@ -0,0 +1,124 @@
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Optional
+
+from api.cancellation import CancellationToken
+from api.errors import ReferenceExpired
+from api.models import ChatTurn, GeneratedImage, GenerationParameters
+
+if TYPE_CHECKING:
+    from .generator import GeneratorCore
+
+logger = logging.getLogger(__name__)
+
+OMITTED = "[earlier edits omitted]"
+
+
+class EditSession:
+    """
+    Step-by-step refinement of one image: each refine() sends only a short edit
+    instruction and gets back an edited version of the latest image.
+
+    Turns go through the SDK's chat interface, but Gemini keeps no conversation
+    on the server: a chat replays its whole history with every message, every
+    earlier image inline. The session therefore keeps its own compact history
+    and rebuilds the chat from it each turn:
+    - the original prompt and its reference images
+    - the last `max_turns` edit instructions and replies, as text
+    - only the latest image, sent as a Files API reference (api.references) that
+      is uploaded once instead of as bytes
+    so a request stays about the same size on the 20th step as on the 2nd.
+
+    Every result is saved like a normal output (prefix "edit", the instruction as
+    its prompt in the catalog); refine() returns the saved paths. Sessions
+    always ask for one image per turn.
+    """
+    def __init__(self, core: "GeneratorCore", params: GenerationParameters, max_turns: int = 4):
+        self.core = core
+        self.params = params.model_copy(update={"number_of_images": 1})
+        self.max_turns = max(1, max_turns)
+        self.prompt_turn = core.client.prompt_turn(self.params)
+        # (instruction, reply) per turn; the first is the prompt itself
+        self.exchanges: list[tuple[ChatTurn, ChatTurn]] = []
+
+    @classmethod
+    def from_settings(cls, core: "GeneratorCore", params: GenerationParameters,
+                      config: Optional[dict[str, Any]] = None) -> "EditSession":
+        config = config or {}
+        return cls(core, params, max_turns=int(config.get("max_turns", 4)))
+
+    @classmethod
+    def from_image(cls, core: "GeneratorCore", params: GenerationParameters, path: str,
+                   config: Optional[dict[str, Any]] = None) -> "EditSession":
+        """A session that refines an image already generated from `params` (e.g. by the runner)."""
+        session = cls.from_settings(core, params, config)
+        session.exchanges.append((session.prompt_turn, ChatTurn(role="model", images=[path])))
+        return session
+
+    @property
+    def current(self) -> Optional[str]:
+        """Path of the latest image, which the next refine() edits."""
+        if not self.exchanges:
+            return None
+        return self.exchanges[-1][1].images[0] if self.exchanges[-1][1].images else None
+
+    def history(self) -> list[ChatTurn]:
+        """What is replayed before the next instruction: the prompt, then the kept turns."""
+        if not self.exchanges:
+            return []
+        history = [self.prompt_turn]
+        kept = self.exchanges[-self.max_turns:]
+        if len(kept) < len(self.exchanges):
+            # Keeps user and model turns alternating where the dropped turns were
+            history.append(ChatTurn(role="model", text=OMITTED))
+        for i, (instruction, reply) in enumerate(kept):
+            if instruction is not self.prompt_turn:
+                history.append(instruction)
+            if i < len(kept) - 1:
+                # Earlier results are described, not sent again
+                reply = ChatTurn(role="model", text=reply.text or "[image]")
+            history.append(reply)
+        return history
+
+    def start(self, cancel: Optional[CancellationToken] = None) -> list[str]:
+        """Generate the first image from the prompt. Returns the saved paths."""
+        if self.exchanges:
+            raise RuntimeError("Edit session has already started")
+        return self._send(self.prompt_turn, cancel)
+
+    def refine(self, instruction: str, cancel: Optional[CancellationToken] = None) -> list[str]:
+        """Apply an edit instruction to the latest image. Returns the saved paths."""
+        if not self.exchanges:
+            self.start(cancel)
+        return self._send(ChatTurn(role="user", text=instruction), cancel)
+
+    def _send(self, message: ChatTurn, cancel: Optional[CancellationToken]) -> list[str]:
+        history = self.history()
+        started = time.monotonic()
+        try:
+            images, reply = self.core.client.chat(self.params, history, message, cancel)
+        except ReferenceExpired:
+            # The previous image's upload was dropped by the API; chat() forgot it, so this uploads it again
+            images, reply = self.core.client.chat(self.params, history, message, cancel)
+        elapsed = time.monotonic() - started
+        self.core.metrics.inc("edit_turns_total", model=self.params.model)
+
+        paths = self._save(images, message, elapsed)
+        self.exchanges.append((message, reply.model_copy(update={"images": paths[:1]})))
+        logger.info(f"Edit turn {len(self.exchanges)} ({len(history)} turns replayed) took {elapsed:.1f}s")
+        return paths
+
+    def _save(self, images: list[GeneratedImage], message: ChatTurn, elapsed: float) -> list[str]:
+        core = self.core
+        params = self.params if message is self.prompt_turn else self.params.model_copy(update={"prompt": message.text})
+        paths = []
+        for image in images:
+            path = core.save_image(image, prefix="edit", params=params, model=self.params.model,
+                                   generation_seconds=elapsed)
+            if core.thumbnails.eager:
+                with core.metrics.timer("thumbnail_seconds"):
+                    core.thumbnails.create(path, image)
+            paths.append(path)
+        with core.metrics.timer("fsync_seconds"):
+            core.storage.sync()
+        return paths
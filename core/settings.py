@@ -38,16 +38,106 @@ class SettingsManager:
     def _default_settings(self) -> dict[str, Any]:
         return {
             "api_key": "",
+            "api_keys": [],
+            "api_keys_file": "",
+            "key_pool": {
+                "quota_eject_seconds": 30,
+                "auth_eject_seconds": 600
+            },
             "output_dir": "outputs",
             "models": [],
             "current_model": "",
+            "rate_limits": {},
+            "rate_limit_db": "",
+            "timeouts": {
+                "default": 0
+            },
+            "output_layout": {
+                "shard": "none",
+                "date_format": "%Y/%m/%d",
+                "hash_depth": 2,
+                "catalog": ""
+            },
+            "references": {
+                "upload": True,
+                "uploads_db": "",
+                "refresh_margin": 3600
+            },
+            "edit_sessions": {
+                "max_turns": 4
+            },
+            "storage": {
+                "fsync": "batch",
+                "batch_size": 64,
+                "buffer_kb": 1024
+            },
+            "dedup": {
+                "enabled": False,
+                "algorithm": "dhash",
+                "threshold": 6,
+                "action": "flag"
+            },
+            "output_format": {
+                "format": "original",
+                "quality": 90,
+                "compress_level": None,
+                "lossless": False
+            },
+            "routing": {
+                "fallback_models": {},
+                "hedge": False,
+                "hedge_quantile": 0.95,
+                "hedge_min_delay": 2.0,
+                "hedge_default_delay": 30.0,
+                "hedge_min_samples": 20
+            },
+            "pipeline": {
+                "workers": 2,
+                "queue_size": 16
+            },
+            "cache": {
+                "enabled": True,
+                "dir": ".cache/results",
+                "max_size_mb": 2048,
+                "seeded_only": True
+            },
+            "metrics": {
+                "debug_responses": False,
+                "response_sample_rate": 0.0,
+                "events_file": "",
+                "port": 0,
+                "host": "127.0.0.1",
+                "textfile": "",
+                "textfile_interval": 15
+            },
+            "server": {
+                "host": "127.0.0.1",
+                "port": 8000,
+                "coalesce": True,
+                "retry": False,
+                "retry_interval": 5,
+                "max_retries": 0
+            },
+            "thumbnails": {
+                "enabled": True,
+                "max_edge": 512,
+                "quality": 80
+            },
             "email": {
                 "enabled": False,
                 "smtp_server": "smtp.gmail.com",
                 "smtp_port": 587,
                 "sender_email": "",
                 "sender_password": "",
-                "receiver_email": ""
+                "receiver_email": "",
+                "starttls": True,
+                "pool_size": 2,
+                "attach": "thumbnail",
+                "digest": {
+                    "enabled": False,
+                    "max_items": 10,
+                    "window_seconds": 600
+                }
             }
         }
 
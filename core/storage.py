@@ -0,0 +1,169 @@
+import logging
+import os
+import threading
+import uuid
+from typing import Any, Iterable, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ("file", "batch", "none")
+
+
+def fsync_path(path: str, directory: bool = False):
+    """fsync a file or directory by path. Directory fsync is not supported everywhere (e.g. Windows) and is skipped there."""
+    flags = os.O_RDONLY
+    if directory:
+        if os.name == "nt":
+            return
+        flags |= getattr(os, "O_DIRECTORY", 0)
+    fd = os.open(path, flags)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class AtomicWriter:
+    """
+    Writes output files so a crash never leaves a truncated file under a final name.
+
+    Data is streamed in `buffer_size` chunks to a hidden temp file in the target
+    folder (same filesystem, so the rename is atomic) and only then given its
+    real name. The name is claimed with a hard link, which fails instead of
+    overwriting: if it is already taken a random suffix is added. Filesystems
+    without hard links fall back to a rename.
+
+    `fsync` decides how durable a finished file is:
+    - file: the file is fsynced before it is renamed and its folder after, so it
+      survives a power loss as soon as write() returns (slowest, worst on NFS)
+    - batch: written files are remembered and fsynced together by sync(), which
+      the pipeline calls when it is flushed, or once `batch_size` are pending
+    - none: left to the OS; still safe against the process crashing, not against
+      the machine going down
+    """
+    def __init__(self, fsync: str = "batch", batch_size: int = 64, buffer_size: int = 1024 * 1024):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync}' (expected one of: {', '.join(FSYNC_POLICIES)})")
+        self.fsync = fsync
+        self.batch_size = max(1, batch_size)
+        self.buffer_size = max(4096, buffer_size)
+        self._lock = threading.Lock()
+        self._pending_files: list[str] = []
+        self._pending_dirs: set[str] = set()
+
+    @classmethod
+    def from_settings(cls, config: Optional[dict[str, Any]]) -> "AtomicWriter":
+        config = config or {}
+        return cls(
+            fsync=config.get("fsync", "batch") or "none",
+            batch_size=int(config.get("batch_size", 64)),
+            buffer_size=int(config.get("buffer_kb", 1024)) * 1024
+        )
+
+    def _temp_path(self, path: str) -> str:
+        directory, name = os.path.split(path)
+        # Hidden, so folder listings and globs for *.png never pick up a half-written file
+        return os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+
+    def _stream(self, tmp_path: str, data: Union[bytes, Iterable[bytes]]):
+        try:
+            f = open(tmp_path, 'xb', buffering=self.buffer_size)
+        except FileNotFoundError:
+            # The folder was removed since it was first created (e.g. outputs cleaned up while running)
+            os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+            f = open(tmp_path, 'xb', buffering=self.buffer_size)
+        with f:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                view = memoryview(data)
+                for offset in range(0, len(view), self.buffer_size):
+                    f.write(view[offset:offset + self.buffer_size])
+            else:
+                for chunk in data:
+                    f.write(chunk)
+            if self.fsync == "file":
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _claim(self, source: str, path: str, rename: bool) -> str:
+        """Give `source` the name `path` (or a suffixed one if taken) without ever replacing an existing file."""
+        candidate = path
+        while True:
+            try:
+                os.link(source, candidate)
+                break
+            except FileExistsError:
+                stem, ext = os.path.splitext(path)
+                candidate = f"{stem}_{uuid.uuid4().hex[:8]}{ext}"
+            except OSError:
+                if not rename:
+                    raise
+                # No hard links here (some network and FAT filesystems): check, then rename
+                if os.path.exists(candidate):
+                    stem, ext = os.path.splitext(path)
+                    candidate = f"{stem}_{uuid.uuid4().hex[:8]}{ext}"
+                    continue
+                os.replace(source, candidate)
+                return candidate
+        if rename:
+            os.remove(source)
+        return candidate
+
+    def write(self, path: str, data: Union[bytes, Iterable[bytes]]) -> str:
+        """Write `data` (bytes or an iterable of chunks) to `path` atomically. Returns the final path."""
+        tmp_path = self._temp_path(path)
+        try:
+            self._stream(tmp_path, data)
+            final = self._claim(tmp_path, path, rename=True)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._written(final)
+        return final
+
+    def link(self, existing: str, path: str) -> Optional[str]:
+        """Hard-link `existing` at `path` (suffixed if taken). Returns the final path, or None if linking is not possible."""
+        try:
+            final = self._claim(existing, path, rename=False)
+        except OSError as e:
+            # Other filesystem, no hard link support, or the original was deleted
+            logger.warning(f"Could not hard-link {path} to {existing}: {e}")
+            return None
+        self._written(final, data_synced=True)
+        return final
+
+    def _written(self, path: str, data_synced: bool = False):
+        directory = os.path.dirname(path) or "."
+        if self.fsync == "file":
+            # The new directory entry is only durable once the folder itself is synced
+            fsync_path(directory, directory=True)
+            return
+        if self.fsync != "batch":
+            return
+        with self._lock:
+            if not data_synced:
+                self._pending_files.append(path)
+            self._pending_dirs.add(directory)
+            full = len(self._pending_files) >= self.batch_size
+        if full:
+            self.sync()
+
+    def sync(self) -> int:
+        """fsync every file and folder written since the last sync ("batch" policy). Returns how many files were synced."""
+        with self._lock:
+            files, self._pending_files = self._pending_files, []
+            dirs, self._pending_dirs = self._pending_dirs, set()
+        for path in files:
+            try:
+                fsync_path(path)
+            except OSError as e:
+                # Deleted or moved since it was written; nothing left to make durable
+                logger.debug(f"Skipping fsync of {path}: {e}")
+        for directory in dirs:
+            try:
+                fsync_path(directory, directory=True)
+            except OSError as e:
+                logger.debug(f"Skipping fsync of {directory}: {e}")
+        return len(files)
@@ -0,0 +1,131 @@
+import itertools
+import logging
+import math
+from string import Formatter
+from typing import Any, Iterable, Iterator
+
+from api.models import GenerationParameters
+from core.batch import BatchJob
+
+logger = logging.getLogger(__name__)
+
+# Job keys that are prompt templates rather than sweep axes when given as a string
+TEMPLATE_KEYS = ("prompt", "neg_prompt", "negative_prompt")
+
+
+def axis_values(name: str, spec: Any) -> Iterable[Any]:
+    """
+    Values of one sweep axis:
+    - a list: taken as is
+    - a mapping with `start`, `stop` and optional `step`: a range, `stop` excluded
+      (integers stay a lazy range; floats are rounded to avoid 0.30000000000000004)
+    - anything else: a single fixed value
+    """
+    if isinstance(spec, list):
+        if not spec:
+            raise ValueError(f"Sweep axis '{name}' is an empty list")
+        return spec
+    if isinstance(spec, dict):
+        if "start" not in spec or "stop" not in spec:
+            raise ValueError(f"Sweep range '{name}' needs 'start' and 'stop'")
+        start, stop, step = spec["start"], spec["stop"], spec.get("step", 1)
+        if not step:
+            raise ValueError(f"Sweep range '{name}' has a zero step")
+        if all(isinstance(v, int) for v in (start, stop, step)):
+            values = range(start, stop, step)
+        else:
+            count = max(0, math.ceil((stop - start) / step - 1e-9))
+            values = [round(start + i * step, 10) for i in range(count)]
+        if not values:
+            raise ValueError(f"Sweep range '{name}' is empty")
+        return values
+    return [spec]
+
+
+def template_fields(template: str) -> set[str]:
+    return {field.split(".")[0].split("[")[0] for _, field, _, _ in Formatter().parse(template) if field}
+
+
+class Sweep:
+    """
+    A parameter grid from the `sweep:` section of a YAML file. Every key except
+    `vars` is a job key (same names as generate.yaml) whose value is a list or
+    range to sweep, or a fixed value. `prompt`/`negative_prompt` may be templates
+    (or lists of templates) using `{name}` placeholders filled from `vars`:
+
+        sweep:
+          prompt: "A {animal} astronaut, {style}"
+          vars:
+            animal: [cat, dog, fox]
+            style: ["oil painting", "pixel art"]
+          model: [gemini-3-pro-image-preview, gemini-2.5-flash-image]
+          seed: {start: 1, stop: 5}
+
+    Jobs are produced lazily in grid order, so sweeps of any size cost memory only
+    for the axis values themselves.
+    """
+    def __init__(self, spec: dict[str, Any]):
+        if not isinstance(spec, dict):
+            raise ValueError("'sweep' must be a mapping of job keys to values, lists or ranges")
+        spec = dict(spec)
+        variables = spec.pop("vars", None) or {}
+        if not isinstance(variables, dict):
+            raise ValueError("'sweep.vars' must be a mapping of template variables to values")
+
+        self.axes: dict[str, Iterable[Any]] = {}
+        self.templates: list[str] = []
+        for key, value in spec.items():
+            if key in TEMPLATE_KEYS:
+                templates = value if isinstance(value, list) else [value]
+                for template in templates:
+                    if not isinstance(template, str):
+                        raise ValueError(f"Sweep '{key}' must be a string or a list of strings")
+                    missing = template_fields(template) - set(variables)
+                    if missing:
+                        raise ValueError(f"Sweep '{key}' uses undefined vars: {', '.join(sorted(missing))}")
+                self.templates.append(key)
+                self.axes[key] = templates
+            else:
+                self.axes[key] = axis_values(key, value)
+        for name, value in variables.items():
+            self.axes[f"vars.{name}"] = axis_values(name, value)
+
+    def __len__(self) -> int:
+        """Number of grid points, before duplicates are removed."""
+        return math.prod(len(values) for values in self.axes.values())
+
+    def job_keys(self) -> set[str]:
+        """Job keys the sweep sets."""
+        return {name for name in self.axes if not name.startswith("vars.")}
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        names = list(self.axes)
+        for values in itertools.product(*self.axes.values()):
+            point = dict(zip(names, values))
+            variables = {name[5:]: point.pop(name) for name in names if name.startswith("vars.")}
+            for key in self.templates:
+                point[key] = point[key].format_map(variables)
+            yield point
+
+
+def sweep_job_id(params: GenerationParameters) -> str:
+    """Ids derived from the parameters, so re-running an edited sweep against a job store skips what already ran."""
+    return f"sweep-{params.cache_key()[:16]}"
+
+
+def unique_jobs(jobs: Iterable[BatchJob]) -> Iterator[BatchJob]:
+    """
+    Drop jobs whose parameters equal an earlier job's (e.g. a var a template does
+    not use). Only a 64-bit digest per job is kept to remember what was seen.
+    """
+    seen: set[int] = set()
+    duplicates = 0
+    for job in jobs:
+        digest = int(job.params.cache_key()[:16], 16)
+        if digest in seen:
+            duplicates += 1
+            continue
+        seen.add(digest)
+        yield job
+    if duplicates:
+        logger.info(f"Skipped {duplicates} duplicate sweep job(s)")
@@ -0,0 +1,118 @@
+import logging
+import os
+from io import BytesIO
+from typing import TYPE_CHECKING, Any, Optional, Union
+
+from api.models import GeneratedImage
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def make_thumbnail(image: "Image.Image", max_edge: int) -> "Image.Image":
+    """
+    Return a copy whose longest edge is at most `max_edge`, in a mode Qt and JPEG can take directly.
+    Uses Pillow's reducing resize, so large sources are shrunk by an integer factor before resampling.
+    """
+    thumb = image.copy()
+    if max(thumb.size) > max_edge:
+        thumb.thumbnail((max_edge, max_edge), reducing_gap=2.0)
+    if thumb.mode not in ("RGB", "RGBA", "L"):
+        thumb = thumb.convert("RGBA" if "A" in thumb.getbands() else "RGB")
+    return thumb
+
+
+def open_for_thumbnail(path: str, max_edge: int) -> "Image.Image":
+    """Open an image file for downscaling. JPEGs are decoded at reduced resolution (draft mode)."""
+    from PIL import Image
+    image = Image.open(path)
+    if image.format == "JPEG":
+        image.draft("RGB", (max_edge, max_edge))
+    return image
+
+
+class ThumbnailStore:
+    """
+    Downscaled previews cached in a `.thumbs` folder next to the outputs.
+    They are written once and reused by the GUI preview and by emails, so
+    neither has to load a full-resolution image again.
+
+    With `eager` set (the GUI does) they are written at save time, while the
+    image is still in memory; otherwise get() makes them on first use, so
+    headless runs that never show or mail a preview skip the work.
+    """
+    def __init__(self, enabled: bool = True, max_edge: int = 512, quality: int = 80, dir_name: str = ".thumbs",
+                 eager: bool = False):
+        self.enabled = enabled
+        self.eager = eager
+        self.max_edge = max_edge
+        self.quality = quality
+        self.dir_name = dir_name
+
+    @classmethod
+    def from_settings(cls, config: Optional[dict[str, Any]]) -> "ThumbnailStore":
+        config = config or {}
+        return cls(
+            enabled=bool(config.get("enabled", True)),
+            max_edge=int(config.get("max_edge", 512)),
+            quality=int(config.get("quality", 80)),
+            dir_name=config.get("dir", ".thumbs")
+        )
+
+    def path_for(self, image_path: str) -> str:
+        directory, filename = os.path.split(image_path)
+        return os.path.join(directory, self.dir_name, os.path.splitext(filename)[0] + ".jpg")
+
+    def create(self, image_path: str, image: Union[GeneratedImage, "Image.Image", None] = None) -> Optional[str]:
+        """
+        Write the thumbnail for a saved image and return its path.
+        Pass the in-memory image when available to avoid reading the file back.
+        """
+        if not self.enabled:
+            return None
+        thumb_path = self.path_for(image_path)
+        try:
+            if isinstance(image, GeneratedImage):
+                thumb = make_thumbnail(image.image, self.max_edge)
+            elif image is not None:
+                thumb = make_thumbnail(image, self.max_edge)
+            else:
+                with open_for_thumbnail(image_path, self.max_edge) as source:
+                    thumb = make_thumbnail(source, self.max_edge)
+
+            if thumb.mode != "RGB":
+                thumb = thumb.convert("RGB")
+            os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+            thumb.save(thumb_path, format="JPEG", quality=self.quality)
+            return thumb_path
+        except Exception as e:
+            logger.warning(f"Failed to create thumbnail for {image_path}: {e}")
+            return None
+
+    def get(self, image_path: str) -> Optional[str]:
+        """Path of the cached thumbnail, creating it if it is missing. None when disabled or on error."""
+        if not self.enabled:
+            return None
+        thumb_path = self.path_for(image_path)
+        if os.path.exists(thumb_path):
+            return thumb_path
+        return self.create(image_path)
+
+    def read_bytes(self, image_path: str) -> Optional[bytes]:
+        """JPEG bytes of the thumbnail, used for inline email previews. Rendered in memory when the cache is disabled."""
+        thumb_path = self.get(image_path)
+        if thumb_path:
+            with open(thumb_path, 'rb') as f:
+                return f.read()
+
+        try:
+            with open_for_thumbnail(image_path, self.max_edge) as source:
+                thumb = make_thumbnail(source, self.max_edge).convert("RGB")
+            buffer = BytesIO()
+            thumb.save(buffer, format="JPEG", quality=self.quality)
+            return buffer.getvalue()
+        except Exception as e:
+            logger.warning(f"Failed to create thumbnail for {image_path}: {e}")
+            return None
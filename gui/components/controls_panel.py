@@ -4,7 +4,7 @@ import os
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, 
     QSpinBox, QDoubleSpinBox, QPushButton, QTextEdit, 
-    QComboBox, QGroupBox, QCheckBox, QMessageBox
+    QComboBox, QGroupBox, QCheckBox, QMessageBox, QListWidget, QFileDialog
 )
 from PyQt6.QtCore import pyqtSignal
 
@@ -15,6 +15,7 @@ logger = logging.getLogger(__name__)
 class ControlsPanel(QWidget):
     generate_requested = pyqtSignal(object)  # Emits GenerationParameters
     stop_requested = pyqtSignal()
+    refine_requested = pyqtSignal(str)  # Emits the edit instruction for the last image
     api_key_updated = pyqtSignal(str)
 
     def __init__(self, core, parent=None):
@@ -50,6 +51,22 @@ class ControlsPanel(QWidget):
         self.neg_prompt_input.setPlaceholderText("Elements to avoid...")
         self.neg_prompt_input.setMaximumHeight(80)
         layout.addWidget(self.neg_prompt_input)
+
+        # Reference Images (image-to-image)
+        layout.addWidget(QLabel("Reference Images (Optional):"))
+        ref_layout = QHBoxLayout()
+        self.ref_list = QListWidget()
+        self.ref_list.setMaximumHeight(70)
+        ref_layout.addWidget(self.ref_list)
+        ref_buttons = QVBoxLayout()
+        self.ref_add_btn = QPushButton("Add...")
+        self.ref_add_btn.clicked.connect(self._on_add_references)
+        ref_buttons.addWidget(self.ref_add_btn)
+        self.ref_clear_btn = QPushButton("Clear")
+        self.ref_clear_btn.clicked.connect(self.ref_list.clear)
+        ref_buttons.addWidget(self.ref_clear_btn)
+        ref_layout.addLayout(ref_buttons)
+        layout.addLayout(ref_layout)
         
         # Parameters Grid
         params_layout = QHBoxLayout()
@@ -159,6 +176,21 @@ class ControlsPanel(QWidget):
         self.generate_btn.setStyleSheet("font-weight: bold; font-size: 14px; background-color: #FFC107; color: black;")
         self.generate_btn.clicked.connect(self._on_generate_clicked)
         layout.addWidget(self.generate_btn)
+
+        # Refine: edit the last image step by step (core.session)
+        refine_group = QGroupBox("Refine Last Image")
+        refine_layout = QHBoxLayout()
+        self.refine_input = QLineEdit()
+        self.refine_input.setPlaceholderText("Describe an edit, e.g. 'make the sky orange'")
+        self.refine_input.returnPressed.connect(self._on_refine_clicked)
+        refine_layout.addWidget(self.refine_input)
+        self.refine_btn = QPushButton("Refine")
+        self.refine_btn.clicked.connect(self._on_refine_clicked)
+        refine_layout.addWidget(self.refine_btn)
+        refine_group.setLayout(refine_layout)
+        layout.addWidget(refine_group)
+        self.refine_available = False
+        self.set_refine_available(False)
         layout.addStretch()
 
     def load_yaml_defaults(self):
@@ -180,6 +212,9 @@ class ControlsPanel(QWidget):
                 self.neg_prompt_input.setPlainText(str(config["negative_prompt"]))
             elif "neg_prompt" in config and config["neg_prompt"]:
                 self.neg_prompt_input.setPlainText(str(config["neg_prompt"]))
+            if config.get("reference_images"):
+                references = config["reference_images"]
+                self.set_references([references] if isinstance(references, str) else references)
             if "model" in config and config["model"]:
                 index = self.model_combo.findText(str(config["model"]))
                 if index >= 0: self.model_combo.setCurrentIndex(index)
@@ -216,6 +251,19 @@ class ControlsPanel(QWidget):
             logger.error(f"Failed to load generate.yaml: {e}")
             return f"Failed to load YAML: {e}"
 
+    def set_references(self, paths):
+        self.ref_list.clear()
+        self.ref_list.addItems([str(p) for p in paths])
+
+    def references(self):
+        return [self.ref_list.item(i).text() for i in range(self.ref_list.count())]
+
+    def _on_add_references(self):
+        paths, _ = QFileDialog.getOpenFileNames(self, "Add Reference Images", "",
+                                                "Images (*.png *.jpg *.jpeg *.webp *.gif)")
+        existing = set(self.references())
+        self.ref_list.addItems([p for p in paths if p not in existing])
+
     def _on_api_key_changed(self):
         self.api_key_updated.emit(self.key_input.text())
 
@@ -243,10 +291,22 @@ class ControlsPanel(QWidget):
             person_generation=self.person_combo.currentText(),
             safety_filter=self.safety_combo.currentText(),
             seed=seed,
-            guidance_scale=guidance
+            guidance_scale=guidance,
+            reference_images=self.references() or None
         )
         self.generate_requested.emit(params)
 
+    def _on_refine_clicked(self):
+        instruction = self.refine_input.text().strip()
+        if instruction and self.refine_available and self.generate_btn.text() != "Stop Generation":
+            self.refine_requested.emit(instruction)
+
+    def set_refine_available(self, available: bool):
+        """Refining needs an image to start from; MainWindow enables it after a successful generation."""
+        self.refine_available = available
+        self.refine_input.setEnabled(available)
+        self.refine_btn.setEnabled(available)
+
     def get_retry_settings(self):
         retry_enabled = self.retry_check.isChecked()
         h = self.retry_h_spin.value()
@@ -272,6 +332,9 @@ class ControlsPanel(QWidget):
         self.generate_btn.setEnabled(enabled)
         self.prompt_input.setEnabled(enabled)
         self.neg_prompt_input.setEnabled(enabled)
+        self.ref_list.setEnabled(enabled)
+        self.ref_add_btn.setEnabled(enabled)
+        self.ref_clear_btn.setEnabled(enabled)
         self.model_combo.setEnabled(enabled)
         self.aspect_combo.setEnabled(enabled)
         self.size_combo.setEnabled(enabled)
@@ -285,3 +348,5 @@ class ControlsPanel(QWidget):
         self.retry_m_spin.setEnabled(enabled)
         self.retry_s_spin.setEnabled(enabled)
         self.max_retries_spin.setEnabled(enabled)
+        self.refine_input.setEnabled(enabled and self.refine_available)
+        self.refine_btn.setEnabled(enabled and self.refine_available)
@@ -1,11 +1,33 @@
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QScrollArea
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QPixmap, QImage
-import io
+
+from api.models import GeneratedImage
+from core.thumbnails import make_thumbnail
+
+# PIL mode -> (QImage format, bytes per pixel)
+_QIMAGE_FORMATS = {
+    "RGB": (QImage.Format.Format_RGB888, 3),
+    "RGBA": (QImage.Format.Format_RGBA8888, 4),
+    "L": (QImage.Format.Format_Grayscale8, 1),
+}
+
+
+def pil_to_qimage(image) -> QImage:
+    """Wrap the PIL pixel buffer in a QImage directly, without encoding to PNG and decoding again."""
+    if image.mode not in _QIMAGE_FORMATS:
+        image = image.convert("RGBA")
+    qformat, bytes_per_pixel = _QIMAGE_FORMATS[image.mode]
+    width, height = image.size
+    data = image.tobytes("raw", image.mode)
+    # copy() detaches the QImage from the Python buffer, which is freed after return
+    return QImage(data, width, height, width * bytes_per_pixel, qformat).copy()
+
 
 class PreviewPanel(QWidget):
-    def __init__(self, parent=None):
+    def __init__(self, max_edge: int = 512, parent=None):
         super().__init__(parent)
+        self.max_edge = max_edge
         self.init_ui()
 
     def init_ui(self):
@@ -21,13 +43,13 @@ class PreviewPanel(QWidget):
         scroll_area.setWidgetResizable(True)
         layout.addWidget(scroll_area)
 
-    def display_image(self, pil_image):
-        # Convert PIL image to QPixmap
-        im_data = io.BytesIO()
-        pil_image.save(im_data, format='PNG')
-        qimg = QImage.fromData(im_data.getvalue())
-        pixmap = QPixmap.fromImage(qimg)
+    def display_image(self, image):
+        """Show a preview. Accepts a ready thumbnail (PIL) or a full result, which is downscaled first."""
+        if isinstance(image, GeneratedImage):
+            image = image.image
+        if max(image.size) > self.max_edge:
+            image = make_thumbnail(image, self.max_edge)
+        pixmap = QPixmap.fromImage(pil_to_qimage(image))
         
-        # Scale if too large, but keep aspect ratio
         self.image_label.setPixmap(pixmap)
         self.image_label.resize(pixmap.size())
@@ -3,7 +3,8 @@ from PyQt6.QtWidgets import QMainWindow, QWidget, QHBoxLayout, QSplitter, QStatu
 from PyQt6.QtCore import Qt
 
 from core.generator import GeneratorCore
-from .workers import GenerationWorker
+from core.notifications import EmailService
+from .workers import GenerationWorker, RefineWorker
 from .components.controls_panel import ControlsPanel
 from .components.preview_panel import PreviewPanel
 
@@ -16,7 +17,13 @@ class MainWindow(QMainWindow):
         self.resize(1200, 800)
         
         self.core = GeneratorCore()
+        # The preview panel shows every result, so write its thumbnail while the image is in memory
+        self.core.thumbnails.eager = True
+        # Shared across runs so the SMTP connection is reused
+        self.email_service = EmailService(self.core.settings)
         self.worker = None
+        # Edit session on the last generated image, for the refine flow
+        self.session = None
         
         self.init_ui()
 
@@ -32,12 +39,13 @@ class MainWindow(QMainWindow):
         
         # Components
         self.controls = ControlsPanel(self.core)
-        self.preview = PreviewPanel()
+        self.preview = PreviewPanel(max_edge=self.core.thumbnails.max_edge)
         
         # Connect signals
         self.controls.api_key_updated.connect(self.update_api_key)
         self.controls.generate_requested.connect(self.start_generation)
         self.controls.stop_requested.connect(self.stop_generation)
+        self.controls.refine_requested.connect(self.start_refine)
         
         # Add to splitter
         splitter.addWidget(self.controls)
@@ -74,8 +82,10 @@ class MainWindow(QMainWindow):
         # Get retry settings from controls
         retry_enabled, retry_interval, max_retries = self.controls.get_retry_settings()
 
-        self.worker = GenerationWorker(self.core, params, retry_enabled, retry_interval, max_retries)
+        self.worker = GenerationWorker(self.core, params, retry_enabled, retry_interval, max_retries,
+                                       email_service=self.email_service)
         self.worker.result_ready.connect(self.on_generation_success)
+        self.worker.preview_ready.connect(self.preview.display_image)
         self.worker.error.connect(self.on_generation_error)
         self.worker.status_update.connect(self.on_status_update)
         self.worker.finished.connect(self.on_worker_finished)
@@ -83,8 +93,26 @@ class MainWindow(QMainWindow):
 
     def on_generation_success(self, images):
         self.statusBar().showMessage("Generation complete")
-        if images:
-            self.preview.display_image(images[0])
+        # A new image starts a new session; refining continues from its first result
+        if self.worker.saved_paths:
+            self.session = self.core.edit_session(self.worker.params, self.worker.saved_paths[0])
+            self.controls.set_refine_available(True)
+
+    def start_refine(self, instruction):
+        if not self.session or (self.worker and self.worker.isRunning()):
+            return
+        self.controls.set_generating(True)
+        self.worker = RefineWorker(self.session, instruction)
+        self.worker.result_ready.connect(self.on_refine_success)
+        self.worker.preview_ready.connect(self.preview.display_image)
+        self.worker.error.connect(self.on_generation_error)
+        self.worker.status_update.connect(self.on_status_update)
+        self.worker.finished.connect(self.on_worker_finished)
+        self.worker.start()
+
+    def on_refine_success(self, paths):
+        self.controls.refine_input.clear()
+        self.statusBar().showMessage(f"Refined ({len(self.session.exchanges) - 1} edits): {paths[0]}")
 
     def on_generation_error(self, error_msg):
         first_line = error_msg.split('\n')[0] if '\n' in error_msg else error_msg
@@ -103,3 +131,12 @@ class MainWindow(QMainWindow):
 
     def on_worker_finished(self):
         self.controls.set_generating(False)
+        if self.worker and self.worker.cancel.cancelled:
+            self.statusBar().showMessage("Generation stopped")
+
+    def closeEvent(self, event):
+        if self.worker and self.worker.isRunning():
+            self.worker.stop()
+            self.worker.wait(2000)
+        self.email_service.close()
+        super().closeEvent(event)
@@ -1,29 +1,40 @@
 from PyQt6.QtCore import QThread, pyqtSignal
-from api.models import GenerationParameters
+from PIL import Image
+from api.cancellation import CancellationToken
+from api.models import GeneratedImage, GenerationParameters
 from core.generator import GeneratorCore
+from core.notifications import EmailService
 from core.runner import GenerationRunner
-from PIL import Image
+from core.session import EditSession
+from core.thumbnails import make_thumbnail
 import logging
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
 class GenerationWorker(QThread):
-    result_ready = pyqtSignal(object)  # Emits list[Image.Image]
+    result_ready = pyqtSignal(object)  # Emits list[GeneratedImage]
+    preview_ready = pyqtSignal(object)  # Emits a downscaled PIL image of the first result
     error = pyqtSignal(str)
     status_update = pyqtSignal(str) # Emits status messages (e.g. retry countdown)
 
     def __init__(self, core: GeneratorCore, params: GenerationParameters, 
-                 retry_enabled: bool = False, retry_interval: int = 5, max_retries: int = 0):
+                 retry_enabled: bool = False, retry_interval: int = 5, max_retries: int = 0,
+                 email_service: Optional[EmailService] = None):
         super().__init__()
         self.core = core
         self.params = params
         self.retry_enabled = retry_enabled
         self.retry_interval = retry_interval
         self.max_retries = max_retries
-        self._is_running = True
+        self.email_service = email_service
+        self.cancel = CancellationToken()
+        self.saved_paths: list[str] = []
 
     def stop(self):
-        self._is_running = False
+        # Aborts the in-flight request (async path), so the thread finishes right away
+        # and the request's key slot is freed instead of waiting for the API
+        self.cancel.cancel("Stopped by user")
 
     def run(self):
         runner = GenerationRunner(
@@ -33,12 +44,72 @@ class GenerationWorker(QThread):
             retry_interval=self.retry_interval,
             max_retries=self.max_retries,
             status_callback=self.status_update.emit,
-            stop_check_callback=lambda: not self._is_running
+            email_service=self.email_service,
+            cancel=self.cancel
         )
 
         try:
-            images = runner.run()
+            images = self.core.run_async(runner.arun())
             if images:
+                self.saved_paths = runner.saved_paths
                 self.result_ready.emit(images)
+                preview = load_preview(self.core, images[0], runner.saved_paths)
+                if preview is not None:
+                    self.preview_ready.emit(preview)
+        except Exception as e:
+            self.error.emit(str(e))
+
+
+class RefineWorker(QThread):
+    """Runs one EditSession.refine() step off the UI thread."""
+    result_ready = pyqtSignal(object)  # Emits the saved paths
+    preview_ready = pyqtSignal(object)
+    error = pyqtSignal(str)
+    status_update = pyqtSignal(str)
+
+    def __init__(self, session: EditSession, instruction: str):
+        super().__init__()
+        self.session = session
+        self.instruction = instruction
+        self.cancel = CancellationToken()
+
+    def stop(self):
+        # Edit turns are blocking calls: the request is abandoned, not aborted, and
+        # finishes (holding its key slot) in the background
+        self.cancel.cancel("Stopped by user")
+
+    def run(self):
+        try:
+            self.status_update.emit(f"Refining: {self.instruction}")
+            paths = self.session.refine(self.instruction, self.cancel)
+            self.result_ready.emit(paths)
+            preview = load_preview(self.session.core, None, paths)
+            if preview is not None:
+                self.preview_ready.emit(preview)
         except Exception as e:
+            if self.cancel.cancelled:
+                return
             self.error.emit(str(e))
+
+
+def load_preview(core: GeneratorCore, image: Optional[GeneratedImage], saved_paths: list[str]):
+    """
+    Runs on the worker thread so decoding never blocks the UI. Prefers the
+    thumbnail cached at save time over downscaling the full-size result.
+    """
+    try:
+        thumbnails = core.thumbnails
+        thumb_path = thumbnails.get(saved_paths[0]) if saved_paths else None
+        if thumb_path:
+            with Image.open(thumb_path) as thumb:
+                thumb.load()
+                return thumb
+        if image is None:
+            if not saved_paths:
+                return None
+            with Image.open(saved_paths[0]) as full:
+                return make_thumbnail(full, thumbnails.max_edge)
+        return make_thumbnail(image.image, thumbnails.max_edge)
+    except Exception as e:
+        logger.warning(f"Failed to load preview: {e}")
+        return None
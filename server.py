@@ -0,0 +1,225 @@
+import argparse
+import base64
+import json
+import logging
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from pydantic import ValidationError
+
+from api.errors import ErrorKind, classify_error
+from api.models import GenerationParameters, GenerationResponse
+from core.coalesce import RequestCoalescer
+from core.generator import GeneratorCore
+from core.metrics_export import CONTENT_TYPE, render_prometheus
+from core.notifications import EmailService
+from core.retry import RetryPolicy
+from core.runner import GenerationRunner
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1024 * 1024
+
+# Error kind -> HTTP status returned to the caller
+ERROR_STATUS = {
+    ErrorKind.QUOTA: 429,
+    ErrorKind.TRANSIENT: 503,
+    ErrorKind.SAFETY: 422,
+    ErrorKind.INVALID: 400,
+    ErrorKind.CANCELLED: 503,
+    ErrorKind.UNKNOWN: 500,
+}
+
+
+class GenerationService:
+    """
+    Generation backend for the HTTP server: one warm GeneratorCore shared by all
+    request threads. Identical requests that arrive while one is in flight wait
+    for it and receive the same images instead of calling the API again.
+    """
+    def __init__(self, core: GeneratorCore, coalesce: bool = True, retry_enabled: bool = False,
+                 retry_interval: int = 5, max_retries: int = 0):
+        self.core = core
+        self.coalesce = coalesce
+        self.retry_enabled = retry_enabled
+        self.retry_interval = retry_interval
+        self.max_retries = max_retries
+        self.email_service = EmailService(core.settings)
+        self.coalescer = RequestCoalescer()
+
+    @classmethod
+    def from_settings(cls, core: GeneratorCore) -> "GenerationService":
+        config = core.settings.get("server", {}) or {}
+        return cls(
+            core,
+            coalesce=bool(config.get("coalesce", True)),
+            retry_enabled=bool(config.get("retry", False)),
+            retry_interval=int(config.get("retry_interval", 5)),
+            max_retries=int(config.get("max_retries", 0))
+        )
+
+    def _generate(self, params: GenerationParameters):
+        runner = GenerationRunner(
+            core=self.core,
+            params=params,
+            retry_enabled=self.retry_enabled,
+            retry_interval=self.retry_interval,
+            max_retries=self.max_retries,
+            retry_policy=RetryPolicy(base_interval=self.retry_interval),
+            email_service=self.email_service
+        )
+        images = runner.run()
+        return images, runner.saved_paths
+
+    def generate(self, params: GenerationParameters) -> tuple[list, list[str], bool]:
+        """Returns (images, saved paths, shared)."""
+        if not self.coalesce:
+            images, paths = self._generate(params)
+            return images, paths, False
+
+        (images, paths), shared = self.coalescer.run(params.cache_key(), lambda: self._generate(params))
+        if shared:
+            self.core.metrics.inc("coalesced_requests_total", model=params.model)
+        return images, paths, shared
+
+    def close(self):
+        self.email_service.close()
+
+
+def make_handler(service: GenerationService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status: int, payload: dict):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_error(self, status: int, message: str, kind: str = None):
+            payload = {"error": message}
+            if kind:
+                payload["kind"] = kind
+            self._send_json(status, payload)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/health":
+                self._send_json(200, {
+                    "status": "ok",
+                    "in_flight": service.coalescer.in_flight(),
+                    "keys": service.core.client.pool.stats()
+                })
+            elif path == "/metrics":
+                body = render_prometheus(service.core.metrics).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self._send_error(404, "Not found")
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/generate":
+                self._send_error(404, "Not found")
+                return
+
+            length = int(self.headers.get("Content-Length") or 0)
+            if length <= 0 or length > MAX_BODY_BYTES:
+                self._send_error(400, "Request body must be a JSON object of at most 1 MiB")
+                return
+
+            try:
+                body = json.loads(self.rfile.read(length))
+                if not isinstance(body, dict):
+                    raise ValueError("expected a JSON object")
+                if body.get("reference_images"):
+                    # They would name files on this host, which a remote caller must not be able to send off
+                    raise ValueError("reference_images are not accepted over HTTP")
+                if not body.get("model") and service.core.settings.get("current_model"):
+                    body["model"] = service.core.settings.get("current_model")
+                params = GenerationParameters(**body)
+            except (ValueError, ValidationError) as e:
+                self._send_error(400, f"Invalid parameters: {e}", ErrorKind.INVALID.value)
+                return
+
+            # ?images=none returns only the saved paths, for callers on the same host
+            include_images = parse_qs(url.query).get("images", ["base64"])[0] != "none"
+            started = time.monotonic()
+            try:
+                images, paths, shared = service.generate(params)
+            except Exception as e:
+                kind = classify_error(e)
+                self._send_error(ERROR_STATUS[kind], str(e), kind.value)
+                return
+
+            elapsed = time.monotonic() - started
+            response = GenerationResponse(
+                images=[base64.b64encode(img.data).decode("ascii") for img in images] if include_images else [],
+                mime_types=[img.mime_type for img in images],
+                paths=paths,
+                info=f"{len(images)} image(s) from {params.model} in {elapsed:.1f}s"
+                     + (" (shared with an identical in-flight request)" if shared else "")
+            )
+            self._send_json(200, response.model_dump())
+
+        def log_message(self, format, *args):
+            logger.info(f"{self.address_string()} - {format % args}")
+
+    return Handler
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Nano Banana Studio HTTP server")
+    parser.add_argument("--host", type=str, default=None, help="Address to bind (default from config, 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=None, help="Port to listen on (default from config, 8000)")
+    parser.add_argument("--api-key", type=str, default=None, help="Google API Key (overrides env/config)")
+    parser.add_argument("--no-coalesce", dest="coalesce", action="store_false", default=None,
+                        help="Send every request upstream, even identical concurrent ones")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    core = GeneratorCore()
+    if args.api_key:
+        core.update_api_key(args.api_key)
+    if not core.has_api_key():
+        print("Error: API Key not found. Set GOOGLE_API_KEY (or GOOGLE_API_KEYS) env var or use --api-key")
+        sys.exit(1)
+
+    config = core.settings.get("server", {}) or {}
+    host = args.host or config.get("host", "127.0.0.1")
+    port = args.port if args.port is not None else int(config.get("port", 8000))
+
+    service = GenerationService.from_settings(core)
+    if args.coalesce is not None:
+        service.coalesce = args.coalesce
+
+    httpd = ThreadingHTTPServer((host, port), make_handler(service))
+    httpd.daemon_threads = True
+    logger.info(f"Serving on http://{host}:{httpd.server_address[1]} (POST /generate, GET /health, GET /metrics)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down...")
+    finally:
+        httpd.server_close()
+        service.close()
+        core.metrics.close()
+
+
+if __name__ == "__main__":
+    main()
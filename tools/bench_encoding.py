@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from api.models import GeneratedImage
+from core.encoding import OutputEncoder, avif_available
+
+SIZES = {"1K": (1024, 1024), "2K": (2048, 2048), "4K": (4096, 4096)}
+
+# (label, encoder options)
+VARIANTS = [
+    ("original", {"format": "original"}),
+    ("png (level 1)", {"format": "png", "compress_level": 1}),
+    ("png (level 6)", {"format": "png", "compress_level": 6}),
+    ("png (level 9)", {"format": "png", "compress_level": 9}),
+    ("webp q80", {"format": "webp", "quality": 80}),
+    ("webp q90", {"format": "webp", "quality": 90}),
+    ("webp lossless", {"format": "webp", "lossless": True, "method": 4}),
+    ("jpeg q85", {"format": "jpeg", "quality": 85}),
+    ("jpeg q95", {"format": "jpeg", "quality": 95}),
+    ("avif q60", {"format": "avif", "quality": 60}),
+]
+
+
+def synthetic_image(size: tuple[int, int]) -> Image.Image:
+    """Smooth gradients, shapes and mild noise: closer to a generated picture than pure noise."""
+    width, height = size
+    gradient = Image.linear_gradient("L").resize(size)
+    image = Image.merge("RGB", (gradient, gradient.rotate(90), gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    draw = ImageDraw.Draw(image)
+    for i in range(40):
+        x, y = (i * 97) % width, (i * 53) % height
+        r = 20 + (i * 37) % (width // 6)
+        draw.ellipse((x, y, x + r, y + r), fill=((i * 40) % 256, (i * 90) % 256, (i * 150) % 256))
+    noise = Image.effect_noise(size, 24).convert("RGB")
+    return Image.blend(image.filter(ImageFilter.GaussianBlur(2)), noise, 0.08)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark output encoders: bytes written and encode/write time per format")
+    parser.add_argument("--input", type=str, default=None, help="Image file to encode (defaults to a synthetic image)")
+    parser.add_argument("--size", type=str, default="2K", choices=list(SIZES), help="Synthetic image size")
+    parser.add_argument("--repeat", type=int, default=3, help="Encodes per format (best time is reported)")
+    parser.add_argument("--output-dir", type=str, default=None, help="Directory to write files to (e.g. an NFS mount)")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, 'rb') as f:
+            source = GeneratedImage.from_bytes(f.read())
+    else:
+        buffer_path = os.path.join(tempfile.gettempdir(), "nano_banana_bench.png")
+        synthetic_image(SIZES[args.size]).save(buffer_path, format="PNG")
+        with open(buffer_path, 'rb') as f:
+            source = GeneratedImage.from_bytes(f.read())
+        os.remove(buffer_path)
+
+    output_dir = args.output_dir or tempfile.mkdtemp(prefix="nano_banana_bench_")
+    os.makedirs(output_dir, exist_ok=True)
+    width, height = source.image.size
+    print(f"Source: {width}x{height} {source.mime_type}, {len(source.data) / 1024:.0f} KiB, writing to {output_dir}")
+    print(f"{'format':<16}{'size (KiB)':>12}{'ratio':>8}{'encode (ms)':>14}{'write (ms)':>12}")
+
+    for label, options in VARIANTS:
+        if options["format"] == "avif" and not avif_available():
+            print(f"{label:<16}{'skipped (no AVIF encoder)':>46}")
+            continue
+
+        encoder = OutputEncoder(**options)
+        best_encode = best_write = float("inf")
+        for i in range(args.repeat):
+            # Fresh object each round so the lazy decode is included in the timing
+            image = GeneratedImage(data=source.data, mime_type=source.mime_type)
+            started = time.perf_counter()
+            data, ext = encoder.encode(image)
+            encoded = time.perf_counter()
+            path = os.path.join(output_dir, f"bench_{i}.{ext}")
+            with open(path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            written = time.perf_counter()
+            os.remove(path)
+            best_encode = min(best_encode, encoded - started)
+            best_write = min(best_write, written - encoded)
+
+        ratio = len(data) / len(source.data)
+        print(f"{label:<16}{len(data) / 1024:>12.0f}{ratio:>8.2f}{best_encode * 1000:>14.1f}{best_write * 1000:>12.1f}")
+
+    if not args.output_dir:
+        os.rmdir(output_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that should only be loaded once a generation actually needs them
+HEAVY_MODULES = ["google.genai", "PIL", "pydantic", "yaml", "dotenv", "smtplib", "email.mime"]
+
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run_once(cli_args: list[str]) -> tuple[float, dict[str, tuple[int, int]]]:
+    """Run cli.py under -X importtime. Returns (wall seconds, {module: (self us, cumulative us)})."""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.join(PROJECT_ROOT, "cli.py")] + cli_args,
+        cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    wall = time.perf_counter() - started
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return wall, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure cli.py startup: wall time, total import time and the slowest imports "
+                    "(python -X importtime), against a time budget"
+    )
+    parser.add_argument("--runs", type=int, default=10, help="Runs to take the median of (after one warm-up run)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    parser.add_argument("--budget-ms", type=float, default=150, help="Fail if the median wall time exceeds this")
+    parser.add_argument("cli_args", nargs=argparse.REMAINDER,
+                        help="Arguments passed to cli.py after '--' (default: --help)")
+    args = parser.parse_args()
+
+    cli_args = [a for a in args.cli_args if a != "--"] or ["--help"]
+
+    # The first run pays for writing .pyc files and a cold disk cache
+    run_once(cli_args)
+    walls, import_totals, runs = [], [], []
+    for _ in range(max(1, args.runs)):
+        wall, modules = run_once(cli_args)
+        walls.append(wall)
+        import_totals.append(sum(self_us for self_us, _ in modules.values()) / 1e6)
+        runs.append(modules)
+
+    wall_ms = statistics.median(walls) * 1000
+    print(f"cli.py {' '.join(cli_args)}: {args.runs} runs")
+    print(f"  wall time (median):   {wall_ms:8.1f} ms")
+    print(f"  import time (median): {statistics.median(import_totals) * 1000:8.1f} ms")
+
+    # Cumulative time of the slowest modules, from the median-wall run
+    modules = runs[walls.index(sorted(walls)[len(walls) // 2])]
+    print(f"  slowest imports (cumulative ms):")
+    for name, (_, cumulative) in sorted(modules.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"    {cumulative / 1000:8.1f}  {name}")
+
+    loaded = [name for name in HEAVY_MODULES if name in modules]
+    print(f"  heavy modules loaded: {', '.join(loaded) if loaded else 'none'}")
+
+    if wall_ms > args.budget_ms:
+        print(f"Over budget: {wall_ms:.1f} ms > {args.budget_ms:.0f} ms")
+        sys.exit(1)
+    print(f"Within budget ({args.budget_ms:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
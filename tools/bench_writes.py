@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.storage import AtomicWriter
+
+# (label, writer options); None is a plain open/write with no temp file, the pre-atomic behaviour
+VARIANTS = [
+    ("direct write", None),
+    ("atomic, fsync none", {"fsync": "none"}),
+    ("atomic, fsync batch", {"fsync": "batch"}),
+    ("atomic, fsync file", {"fsync": "file"}),
+]
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_variant(directory: str, options, payload: bytes, count: int, batch_size: int, buffer_kb: int):
+    """Write `count` files into `directory`. Returns (total seconds, per-file latencies)."""
+    writer = AtomicWriter(batch_size=batch_size, buffer_size=buffer_kb * 1024, **options) if options else None
+    latencies = []
+    started = time.perf_counter()
+    for i in range(count):
+        path = os.path.join(directory, f"bench_{i:05d}.png")
+        file_started = time.perf_counter()
+        if writer:
+            writer.write(path, payload)
+        else:
+            with open(path, 'xb') as f:
+                f.write(payload)
+        latencies.append(time.perf_counter() - file_started)
+    if writer:
+        # Whatever the batch policy left pending is part of the cost of the run
+        writer.sync()
+    return time.perf_counter() - started, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark output writes: direct vs atomic with each fsync policy")
+    parser.add_argument("--output-dir", type=str, action="append", default=None,
+                        help="Directory to write to; repeat to compare e.g. a local disk and an NFS mount "
+                             "(default: a temp dir)")
+    parser.add_argument("--count", type=int, default=200, help="Files written per policy")
+    parser.add_argument("--size-kb", type=int, default=1536, help="Size of each file in KiB (a 1K PNG is ~1.5 MiB)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Files per fsync under the batch policy")
+    parser.add_argument("--buffer-kb", type=int, default=1024, help="Write buffer size in KiB")
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size_kb * 1024)
+    targets = args.output_dir or [tempfile.gettempdir()]
+    for target in targets:
+        os.makedirs(target, exist_ok=True)
+        print(f"\n{target}: {args.count} files of {args.size_kb} KiB")
+        print(f"{'policy':<22}{'total (s)':>10}{'files/s':>10}{'MiB/s':>9}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+        for label, options in VARIANTS:
+            directory = tempfile.mkdtemp(prefix="nano_banana_writes_", dir=target)
+            try:
+                total, latencies = run_variant(directory, options, payload, args.count, args.batch_size, args.buffer_kb)
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+            mib = args.count * len(payload) / (1024 * 1024)
+            print(f"{label:<22}{total:>10.2f}{args.count / total:>10.1f}{mib / total:>9.1f}"
+                  f"{percentile(latencies, 0.5) * 1000:>10.2f}{percentile(latencies, 0.99) * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
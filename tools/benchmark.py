@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import shutil
+import logging
+import argparse
+import tempfile
+import subprocess
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from api.key_pool import KeyPool
+from api.models import GenerationParameters
+from core.batch import BatchJob, BatchRunner
+from core.generator import GeneratorCore
+from core.pipeline import PostProcessor
+from core.retry import RetryPolicy
+from core.runner import GenerationRunner
+from tools.bench_encoding import SIZES
+from tools.fake_genai import FakeBackend, FakeClient
+
+MODES = ["single", "batch", "async"]
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile, q in 0-100."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def count_images(output_dir: str) -> int:
+    """Saved images in every shard folder, skipping hidden folders such as .thumbs."""
+    count = 0
+    for directory, subdirs, names in os.walk(output_dir):
+        subdirs[:] = [d for d in subdirs if not d.startswith(".")]
+        count += sum(1 for name in names if name.startswith("img_"))
+    return count
+
+
+def build_core(args, backend: FakeBackend, output_dir: str) -> GeneratorCore:
+    """A real GeneratorCore (encoder, thumbnails, pipeline settings) whose genai.Clients are the fake backend."""
+    core = GeneratorCore()
+    core.settings.settings["output_dir"] = output_dir
+    core.settings.settings["email"] = {"enabled": False}
+    # Each run must reach the backend, and quotas would only measure the limiter
+    core.cache = None
+    core.client.rate_limiter = None
+    keys = [f"bench-key-{i}" for i in range(max(1, args.keys))]
+    core.client.pool = KeyPool(keys, quota_eject_seconds=args.retry_interval, client_factory=lambda key: FakeClient(backend))
+    if args.output_format:
+        core.update_output_format({"format": args.output_format})
+    return core
+
+
+def run_mode(args, mode: str) -> dict:
+    backend = FakeBackend(
+        image_size=args.image_size, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, quota_rate=args.quota_rate, seed=args.seed
+    )
+    output_dir = tempfile.mkdtemp(prefix=f"nano_banana_bench_{mode}_")
+    core = build_core(args, backend, output_dir)
+    params = GenerationParameters(prompt="benchmark", model=args.model, number_of_images=args.num_images)
+    policy = RetryPolicy(base_interval=args.retry_interval, max_interval=max(args.retry_interval, 2))
+    retry = {"retry_enabled": True, "retry_interval": args.retry_interval, "max_retries": args.max_retries,
+             "retry_policy": policy}
+
+    latencies = []
+    succeeded = failed = 0
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+
+    if mode == "single":
+        for _ in range(args.requests):
+            job_started = time.perf_counter()
+            runner = GenerationRunner(core, params, **retry)
+            try:
+                # The path the GUI takes: arun() on the core's event loop
+                core.run_async(runner.arun())
+                succeeded += 1
+            except Exception:
+                failed += 1
+            latencies.append(time.perf_counter() - job_started)
+    else:
+        manifest_path = os.path.join(output_dir, "manifest.jsonl")
+        jobs = (BatchJob(id=f"bench-{i}", params=params) for i in range(args.requests))
+        pipeline = PostProcessor.from_settings(core)
+        try:
+            batch = BatchRunner(core, jobs, workers=args.workers, manifest_path=manifest_path,
+                                pipeline=pipeline, **retry)
+            if mode == "async":
+                asyncio.run(batch.arun())
+            else:
+                batch.run()
+        finally:
+            pipeline.shutdown()
+
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                latencies.append(record["duration"])
+                if record["status"] == "success":
+                    succeeded += 1
+                else:
+                    failed += 1
+
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    images = count_images(output_dir)
+    if not args.keep_outputs:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    return {
+        "mode": mode,
+        "requests": args.requests,
+        "succeeded": succeeded,
+        "failed": failed,
+        "images": images,
+        "api_calls": backend.calls,
+        "api_errors": backend.errors,
+        "api_429": backend.quota_errors,
+        "elapsed_s": round(elapsed, 3),
+        "images_per_s": round(images / elapsed, 2) if elapsed else 0.0,
+        "p50_s": round(percentile(latencies, 50), 3),
+        "p95_s": round(percentile(latencies, 95), 3),
+        "p99_s": round(percentile(latencies, 99), 3),
+        "cpu_s": round(cpu, 2),
+        "cpu_pct": round(100 * cpu / elapsed, 1) if elapsed else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def print_table(results: list[dict]):
+    print(f"{'mode':<8}{'ok':>6}{'fail':>6}{'images':>8}{'img/s':>9}{'p50 (s)':>9}{'p95 (s)':>9}"
+          f"{'p99 (s)':>9}{'cpu %':>8}{'peak RSS (MB)':>15}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['succeeded']:>6}{r['failed']:>6}{r['images']:>8}{r['images_per_s']:>9.2f}"
+              f"{r['p50_s']:>9.3f}{r['p95_s']:>9.3f}{r['p99_s']:>9.3f}{r['cpu_pct']:>8.1f}{r['peak_rss_mb']:>15.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the generation pipeline offline against a fake API backend "
+                    "(throughput, latency percentiles, CPU and peak RSS)"
+    )
+    parser.add_argument("--mode", choices=MODES + ["all"], default="all",
+                        help="single: sequential runs as in the GUI, batch: thread pool, async: asyncio path")
+    parser.add_argument("--requests", type=int, default=50, help="Generation requests per mode")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent workers / requests in flight (batch, async)")
+    parser.add_argument("--num-images", type=int, default=1, help="Images per request")
+    parser.add_argument("--image-size", choices=list(SIZES), default="1K", help="Size of the returned images")
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean fake API latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency spread as a fraction of the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls failing with 503")
+    parser.add_argument("--quota-rate", type=float, default=0.0, help="Fraction of calls failing with 429")
+    parser.add_argument("--keys", type=int, default=1, help="API keys in the pool (all served by the fake backend)")
+    parser.add_argument("--retry-interval", type=float, default=0.1, help="Base retry interval in seconds")
+    parser.add_argument("--max-retries", type=int, default=5, help="Max retries per request")
+    parser.add_argument("--model", default="gemini-3-pro-image-preview", help="Model name (imagen-* uses generate_images)")
+    parser.add_argument("--output-format", default=None, help="Override the configured output format")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the fake backend's latency/error draws")
+    parser.add_argument("--keep-outputs", action="store_true", help="Keep the written images")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Run all modes in this process (peak RSS is then cumulative)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show application logs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+    modes = MODES if args.mode == "all" else [args.mode]
+
+    results = []
+    for mode in modes:
+        if len(modes) > 1 and not args.in_process:
+            # A fresh interpreter per mode keeps peak RSS and CPU figures independent
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + ["--mode", mode, "--json"],
+                check=True, capture_output=True, text=True
+            ).stdout
+            results.extend(json.loads(output.strip().splitlines()[-1]))
+        else:
+            results.append(run_mode(args, mode))
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"{args.requests} requests/mode, {args.image_size} images, latency {args.latency}s "
+              f"(+/-{args.jitter * 100:.0f}%), errors {args.error_rate:.0%}, 429s {args.quota_rate:.0%}")
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Local stand-in for `google.genai.Client` used by the benchmarks: returns real SDK
+response objects with pre-encoded images after a configurable delay, and fails a
+configurable fraction of calls with 5xx or 429 errors. No network is used.
+"""
+import asyncio
+import random
+import threading
+import time
+from io import BytesIO
+from typing import Optional
+
+from google.genai import errors, types
+
+from tools.bench_encoding import SIZES, synthetic_image
+
+
+def make_image_bytes(size: tuple[int, int], fmt: str = "PNG") -> bytes:
+    buffer = BytesIO()
+    synthetic_image(size).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+class FakeBackend:
+    """Shared behaviour and call counters for the sync and async surfaces."""
+    def __init__(self, image_size: str = "1K", latency: float = 0.5, jitter: float = 0.2,
+                 error_rate: float = 0.0, quota_rate: float = 0.0, seed: Optional[int] = None):
+        self.image_data = make_image_bytes(SIZES[image_size])
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.quota_rate = quota_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.quota_errors = 0
+
+    def _plan(self) -> tuple[float, str]:
+        """Pick this call's delay and outcome ("ok", "error" or "quota")."""
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency * (1 + self._random.uniform(-self.jitter, self.jitter)))
+            roll = self._random.random()
+            if roll < self.quota_rate:
+                self.quota_errors += 1
+                return delay * 0.1, "quota"
+            if roll < self.quota_rate + self.error_rate:
+                self.errors += 1
+                return delay, "error"
+            return delay, "ok"
+
+    def _raise(self, outcome: str):
+        if outcome == "quota":
+            raise errors.ClientError(429, {"error": {
+                "code": 429, "message": "Resource has been exhausted (fake backend)", "status": "RESOURCE_EXHAUSTED"
+            }})
+        raise errors.ServerError(503, {"error": {
+            "code": 503, "message": "The model is overloaded (fake backend)", "status": "UNAVAILABLE"
+        }})
+
+    def _image_bytes(self) -> bytes:
+        # A fresh copy per image, like the SDK's base64 decode, so memory use is realistic
+        return bytes(bytearray(self.image_data))
+
+    def content_response(self, count: int) -> types.GenerateContentResponse:
+        candidates = [
+            types.Candidate(
+                content=types.Content(role="model", parts=[
+                    types.Part(inline_data=types.Blob(data=self._image_bytes(), mime_type="image/png"))
+                ]),
+                finish_reason="STOP"
+            )
+            for _ in range(max(1, count))
+        ]
+        return types.GenerateContentResponse(candidates=candidates)
+
+    def images_response(self, count: int) -> types.GenerateImagesResponse:
+        return types.GenerateImagesResponse(generated_images=[
+            types.GeneratedImage(image=types.Image(image_bytes=self._image_bytes(), mime_type="image/png"))
+            for _ in range(max(1, count))
+        ])
+
+
+def _count(config, name: str) -> int:
+    return getattr(config, name, None) or 1
+
+
+class _Models:
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+
+    def generate_content(self, model, contents, config=None):
+        delay, outcome = self.backend._plan()
+        time.sleep(delay)
+        if outcome != "ok":
+            self.backend._raise(outcome)
+        return self.backend.content_response(_count(config, "candidate_count"))
+
+    def generate_images(self, model, prompt, config=None):
+        delay, outcome = self.backend._plan()
+        time.sleep(delay)
+        if outcome != "ok":
+            self.backend._raise(outcome)
+        return self.backend.images_response(_count(config, "number_of_images"))
+
+
+class _AsyncModels:
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+
+    async def generate_content(self, model, contents, config=None):
+        delay, outcome = self.backend._plan()
+        await asyncio.sleep(delay)
+        if outcome != "ok":
+            self.backend._raise(outcome)
+        return self.backend.content_response(_count(config, "candidate_count"))
+
+    async def generate_images(self, model, prompt, config=None):
+        delay, outcome = self.backend._plan()
+        await asyncio.sleep(delay)
+        if outcome != "ok":
+            self.backend._raise(outcome)
+        return self.backend.images_response(_count(config, "number_of_images"))
+
+
+class _Aio:
+    def __init__(self, backend: FakeBackend):
+        self.models = _AsyncModels(backend)
+
+
+class FakeClient:
+    """Drop-in for `genai.Client` covering the `models` and `aio.models` calls APIClient makes."""
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+        self.models = _Models(backend)
+        self.aio = _Aio(backend)
@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.catalog import Catalog
+from core.settings import SettingsManager
+
+
+def parse_time(value: str) -> float:
+    """A date (2026-10-17) or date and time (2026-10-17T14:30) as a Unix timestamp."""
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM-DD or YYYY-MM-DDTHH:MM, got '{value}'")
+
+
+def default_catalog() -> str:
+    settings = SettingsManager()
+    name = (settings.get("output_layout") or {}).get("catalog") or "catalog.db"
+    return os.path.join(settings.get("output_dir") or "outputs", name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the catalog of saved outputs without walking the output folders")
+    parser.add_argument("--catalog", type=str, default=None, help="Catalog file (default: the one in output_dir)")
+    parser.add_argument("--model", type=str, default=None, help="Only outputs produced by this model")
+    parser.add_argument("--prompt", type=str, default=None, help="Only outputs whose prompt contains this text")
+    parser.add_argument("--sha256", type=str, default=None, help="Only outputs whose SHA-256 starts with this")
+    parser.add_argument("--since", type=parse_time, default=None, help="Only outputs saved at or after this date")
+    parser.add_argument("--until", type=parse_time, default=None, help="Only outputs saved before this date")
+    parser.add_argument("--duplicates", action="store_true", help="Only outputs flagged as near-duplicates")
+    parser.add_argument("--limit", type=int, default=50, help="Maximum results, newest first (0 for all)")
+    parser.add_argument("--count", action="store_true", help="Print the number of matches only")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per line")
+    args = parser.parse_args()
+
+    path = args.catalog or default_catalog()
+    if not os.path.exists(path):
+        print(f"Catalog not found: {path} (enable it with output_layout.catalog in config.json, or catalog: in generate.yaml)")
+        sys.exit(1)
+
+    catalog = Catalog(path)
+    rows = catalog.find(model=args.model, prompt=args.prompt, sha256=args.sha256, since=args.since,
+                        until=args.until, duplicates=args.duplicates, limit=None if args.count else args.limit)
+    if args.count:
+        print(len(rows))
+        return
+
+    for row in rows:
+        if args.json:
+            print(json.dumps(row, ensure_ascii=False))
+            continue
+        created = datetime.fromtimestamp(row["created"]).strftime("%Y-%m-%d %H:%M:%S")
+        took = f"{row['generation_seconds']:.1f}s" if row["generation_seconds"] is not None else "-"
+        prompt = (row["prompt"] or "").replace("\n", " ")
+        print(f"{created}  {row['model'] or '-':<32} {took:>7}  {row['sha256'][:12]}  {row['path']}")
+        if prompt:
+            print(f"    {prompt[:100]}")
+        if row["duplicate_of"]:
+            print(f"    near-duplicate of {row['duplicate_of']}")
+    print(f"{len(rows)} of {catalog.count()} outputs")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import os
 import sys
 import logging
 import argparse
+import time
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -20,11 +21,32 @@ logger = logging.getLogger(__name__)
 def main():
     parser = argparse.ArgumentParser(description="Test email configuration")
     parser.add_argument("--attach", action="store_true", help="Include a dummy attachment")
+    parser.add_argument("--count", type=int, default=1, help="Number of emails to send (reuses the pooled connection)")
+    parser.add_argument("--digest", action="store_true", help="Buffer the emails and send them as one digest")
+    parser.add_argument("--server", type=str, default=None,
+                        help="Override SMTP host:port, e.g. a local 'python -m aiosmtpd -n -l localhost:8025' (no TLS/login)")
     args = parser.parse_args()
 
     logger.info("Starting email test...")
     
     settings = SettingsManager()
+    if args.server:
+        host, _, port = args.server.partition(":")
+        email_config = dict(settings.get("email", {}))
+        email_config.update({
+            "enabled": True,
+            "smtp_server": host,
+            "smtp_port": int(port or 25),
+            "starttls": False,
+            "sender_password": "",
+            "sender_email": email_config.get("sender_email") or "studio@localhost",
+            "receiver_email": email_config.get("receiver_email") or "test@localhost"
+        })
+        settings.settings["email"] = email_config
+    if args.digest:
+        email_config = dict(settings.get("email", {}))
+        email_config["digest"] = {**email_config.get("digest", {}), "enabled": True, "max_items": args.count}
+        settings.settings["email"] = email_config
     email_service = EmailService(settings)
     
     if not email_service.is_enabled():
@@ -49,7 +71,11 @@ def main():
 
     try:
         logger.info("Sending test email...")
-        email_service.send_success(attachments, "Test Prompt (Diagnostics)")
+        started = time.monotonic()
+        for i in range(args.count):
+            email_service.send_success(attachments, f"Test Prompt (Diagnostics) #{i + 1}")
+        email_service.close()
+        logger.info(f"Sent {args.count} email(s) in {time.monotonic() - started:.2f}s")
         logger.info("Test completed. Check your inbox (and SPAM folder).")
     except Exception as e:
         logger.error(f"Test failed: {e}")